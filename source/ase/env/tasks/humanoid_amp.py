@@ -131,8 +131,6 @@ class HumanoidAMP(Humanoid):
         """
         dt = self.dt  # 获取时间间隔
 
-        # 将motion_ids进行平铺
-        motion_ids = torch.tile(motion_ids.unsqueeze(-1), [1, self._num_amp_obs_steps])
         # 将motion_times0扩展一个维度
         motion_times = motion_times0.unsqueeze(-1)
         # 生成时间步
@@ -140,13 +138,9 @@ class HumanoidAMP(Humanoid):
         # 计算motion_times
         motion_times = motion_times + time_steps
 
-        # 将motion_ids展平
-        motion_ids = motion_ids.view(-1)
-        # 将motion_times展平
-        motion_times = motion_times.view(-1)
-        # 从_motion_lib中获取运动状态
+        # 一次查询所有时间步的运动状态，并展平为 (batch_size * num_amp_obs_steps, ...)
         root_pos, root_rot, dof_pos, root_vel, root_ang_vel, dof_vel, key_pos \
-               = self._motion_lib.get_motion_state(motion_ids, motion_times)
+               = [v.flatten(0, 1) for v in self._motion_lib.get_motion_state(motion_ids, motion_times)]
         # 构建AMP观测值
         amp_obs_demo = build_amp_observations(root_pos, root_rot, root_vel, root_ang_vel,
                                               dof_pos, dof_vel, key_pos,
@@ -275,15 +269,12 @@ class HumanoidAMP(Humanoid):
 
     def _init_amp_obs_ref(self, env_ids, motion_ids, motion_times):
         dt = self.dt
-        motion_ids = torch.tile(motion_ids.unsqueeze(-1), [1, self._num_amp_obs_steps - 1])
         motion_times = motion_times.unsqueeze(-1)
         time_steps = -dt * (torch.arange(0, self._num_amp_obs_steps - 1, device=self.device) + 1)
         motion_times = motion_times + time_steps
 
-        motion_ids = motion_ids.view(-1)
-        motion_times = motion_times.view(-1)
         root_pos, root_rot, dof_pos, root_vel, root_ang_vel, dof_vel, key_pos \
-               = self._motion_lib.get_motion_state(motion_ids, motion_times)
+               = [v.flatten(0, 1) for v in self._motion_lib.get_motion_state(motion_ids, motion_times)]
         amp_obs_demo = build_amp_observations(root_pos, root_rot, root_vel, root_ang_vel, 
                                               dof_pos, dof_vel, key_pos, 
                                               self._local_root_obs, self._root_height_obs, 
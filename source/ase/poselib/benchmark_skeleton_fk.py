@@ -0,0 +1,116 @@
+"""
+Benchmark the level-parallel forward kinematics of SkeletonState against the per-joint loops it replaced.
+
+For every skeleton and every clip length in --num_frames a random motion is built from local
+rotations. The script times
+- FK: local rotations -> global transformations (``SkeletonState.global_transformation``)
+- IK-to-local: global rotations -> local rotations (``SkeletonState.local_rotation``)
+and checks that both give the same tensors as the per-joint reference.
+
+    python benchmark_skeleton_fk.py --num_frames 100 1000 10000
+"""
+
+import argparse
+import time
+
+import torch
+
+from poselib.core.rotation3d import *
+from poselib.skeleton.skeleton3d import SkeletonTree, SkeletonState
+
+parser = argparse.ArgumentParser(description="Benchmark SkeletonState forward kinematics.")
+parser.add_argument("--humanoid_mjcf", type=str, default="../data/assets/mjcf/amp_humanoid.xml")
+parser.add_argument("--go2_mjcf", type=str, default="../../extensions/unitree_s2r/unitree_robots/go2/go2.xml")
+parser.add_argument("--num_frames", type=int, nargs="+", default=[100, 1000, 10000])
+parser.add_argument("--repeats", type=int, default=5)
+parser.add_argument("--device", type=str, default="cpu")
+args = parser.parse_args()
+
+
+def global_transformation_per_joint(state):
+    """ reference FK: one transform_mul per joint """
+    local_transformation = state.local_transformation
+    parent_indices = state.skeleton_tree.parent_indices.numpy()
+    global_transformation = []
+    for node_index in range(len(state.skeleton_tree)):
+        parent_index = parent_indices[node_index]
+        if parent_index == -1:
+            global_transformation.append(local_transformation[..., node_index, :])
+        else:
+            global_transformation.append(
+                transform_mul(global_transformation[parent_index], local_transformation[..., node_index, :])
+            )
+    return torch.stack(global_transformation, axis=-2)
+
+
+def local_rotation_per_joint(state):
+    """ reference IK-to-local: one quat_mul_norm per joint """
+    global_rotation = state.global_rotation
+    local_rotation = global_rotation.clone()
+    for node_index in range(len(state.skeleton_tree)):
+        parent_index = state.skeleton_tree.parent_indices[node_index]
+        if parent_index != -1:
+            local_rotation[..., node_index, :] = quat_mul_norm(
+                quat_inverse(global_rotation[..., parent_index, :]), global_rotation[..., node_index, :]
+            )
+    return local_rotation
+
+
+def timeit(fn):
+    times = []
+    for _ in range(args.repeats):
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        fn()
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(name, skeleton_tree, num_frames):
+    num_joints = skeleton_tree.num_joints
+    r = quat_normalize(torch.randn(num_frames, num_joints, 4, device=args.device))
+    t = torch.randn(num_frames, 3, device=args.device)
+    local_state = SkeletonState.from_rotation_and_root_translation(skeleton_tree, r, t, is_local=True)
+    global_state = SkeletonState.from_rotation_and_root_translation(
+        skeleton_tree, local_state.global_rotation, t, is_local=False
+    )
+
+    # fresh states so that the cached properties are recomputed on every run
+    def fk():
+        SkeletonState(local_state.tensor, skeleton_tree, True).global_transformation
+
+    def to_local():
+        SkeletonState(global_state.tensor, skeleton_tree, False).local_rotation
+
+    fk_error = (global_transformation_per_joint(local_state) - local_state.global_transformation).abs().max().item()
+    local_error = (local_rotation_per_joint(global_state) - global_state.local_rotation).abs().max().item()
+    print(
+        "{:s}: {:d} joints, {:d} levels, {:d} frames, max abs difference fk {:.3e} local {:.3e}".format(
+            name, num_joints, len(skeleton_tree.level_schedule), num_frames, fk_error, local_error
+        )
+    )
+    for label, reference, batched in (
+        ("fk", lambda: global_transformation_per_joint(SkeletonState(local_state.tensor, skeleton_tree, True)), fk),
+        ("local", lambda: local_rotation_per_joint(SkeletonState(global_state.tensor, skeleton_tree, False)), to_local),
+    ):
+        reference_time = timeit(reference)
+        batched_time = timeit(batched)
+        print(
+            "  {:6s} per joint {:8.2f} ms  level-parallel {:8.2f} ms  ({:.1f}x)".format(
+                label, reference_time * 1e3, batched_time * 1e3, reference_time / batched_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    torch.manual_seed(0)
+    skeleton_trees = {
+        "humanoid": SkeletonTree.from_mjcf(args.humanoid_mjcf),
+        "go2": SkeletonTree.from_mjcf(args.go2_mjcf),
+    }
+    for name, skeleton_tree in skeleton_trees.items():
+        for num_frames in args.num_frames:
+            benchmark(name, skeleton_tree, num_frames)
@@ -112,6 +112,12 @@ class SkeletonTree(Serializable):
         self._parent_indices = parent_indices.long()
         self._local_translation = local_translation
         self._node_indices = {self.node_names[i]: i for i in range(len(self))}
+        self._level_schedule = self._compute_level_schedule(self._parent_indices)
+        self._non_root_indices = (
+            torch.cat([nodes for nodes, _ in self._level_schedule] + [torch.zeros(0, dtype=torch.long)]),
+            torch.cat([parents for _, parents in self._level_schedule] + [torch.zeros(0, dtype=torch.long)]),
+        )
+        self._device_schedules = {}
 
     def __len__(self):
         """ number of nodes in the skeleton tree """
@@ -155,6 +161,62 @@ class SkeletonTree(Serializable):
         """ number of nodes in the skeleton tree """
         return len(self)
 
+    @property
+    def level_schedule(self):
+        """ the non-root nodes grouped by their depth in the tree. Each entry is a pair of long
+        tensors (node_indices, parent_indices) for one depth level, from the children of the roots
+        downwards, so that all the nodes of a level can be composed with their parents in one
+        batched op
+
+        :rtype: List[Tuple[Tensor, Tensor]]
+        """
+        return self._level_schedule
+
+    @property
+    def non_root_indices(self):
+        """ (node_indices, parent_indices) of all the non-root nodes, concatenated over the levels
+
+        :rtype: Tuple[Tensor, Tensor]
+        """
+        return self._non_root_indices
+
+    def _schedule_on(self, device):
+        """ level schedule and non-root indices on the device of the skeleton state tensors """
+        device = torch.device(device)
+        if device not in self._device_schedules:
+            self._device_schedules[device] = (
+                [(nodes.to(device), parents.to(device)) for nodes, parents in self._level_schedule],
+                tuple(indices.to(device) for indices in self._non_root_indices),
+            )
+        return self._device_schedules[device]
+
+    @staticmethod
+    def _compute_level_schedule(parent_indices):
+        parent_indices = parent_indices.tolist()
+        depth = [-1] * len(parent_indices)
+        for node_index in range(len(parent_indices)):
+            # walk up to the first node with a known depth, then fill in the path below it
+            path = []
+            curr_index = node_index
+            while curr_index != -1 and depth[curr_index] == -1:
+                path.append(curr_index)
+                curr_index = parent_indices[curr_index]
+            curr_depth = -1 if curr_index == -1 else depth[curr_index]
+            for path_index in reversed(path):
+                curr_depth += 1
+                depth[path_index] = curr_depth
+
+        level_schedule = []
+        for level in range(1, max(depth, default=0) + 1):
+            nodes = [i for i in range(len(parent_indices)) if depth[i] == level]
+            level_schedule.append(
+                (
+                    torch.tensor(nodes, dtype=torch.long),
+                    torch.tensor([parent_indices[i] for i in nodes], dtype=torch.long),
+                )
+            )
+        return level_schedule
+
     @classmethod
     def from_dict(cls, dict_repr, *args, **kwargs):
         return cls(
@@ -432,23 +494,20 @@ class SkeletonState(Serializable):
         """ global transformation of each joint (transform from joint frame to global frame) """
         if not hasattr(self, "_global_transformation"):
             local_transformation = self.local_transformation
-            global_transformation = []
-            parent_indices = self.skeleton_tree.parent_indices.numpy()
-            # global_transformation = local_transformation.identity_like()
-            for node_index in range(len(self.skeleton_tree)):
-                parent_index = parent_indices[node_index]
-                if parent_index == -1:
-                    global_transformation.append(
-                        local_transformation[..., node_index, :]
-                    )
-                else:
-                    global_transformation.append(
-                        transform_mul(
-                            global_transformation[parent_index],
-                            local_transformation[..., node_index, :],
-                        )
-                    )
-            self._global_transformation = torch.stack(global_transformation, axis=-2)
+            # the roots are already in the global frame, every deeper level is composed with its
+            # (already global) parents in one batched op
+            level_schedule, _ = self.skeleton_tree._schedule_on(local_transformation.device)
+            global_transformation = local_transformation.clone()
+            for node_indices, parent_indices in level_schedule:
+                global_transformation.index_copy_(
+                    -2,
+                    node_indices,
+                    transform_mul(
+                        global_transformation.index_select(-2, parent_indices),
+                        local_transformation.index_select(-2, node_indices),
+                    ),
+                )
+            self._global_transformation = global_transformation
         return self._global_transformation
 
     @property
@@ -492,18 +551,21 @@ class SkeletonState(Serializable):
         in `.skeleton_tree.node_names` """
         if self._local_rotation is None:
             if not hasattr(self, "_comp_local_rotation"):
-                local_rotation = quat_identity_like(self.global_rotation)
-                for node_index in range(len(self.skeleton_tree)):
-                    parent_index = self.skeleton_tree.parent_indices[node_index]
-                    if parent_index == -1:
-                        local_rotation[..., node_index, :] = self.global_rotation[
-                            ..., node_index, :
-                        ]
-                    else:
-                        local_rotation[..., node_index, :] = quat_mul_norm(
-                            quat_inverse(self.global_rotation[..., parent_index, :]),
-                            self.global_rotation[..., node_index, :],
-                        )
+                # a local rotation only depends on the global rotations of the node and its parent,
+                # so all the non-root nodes are converted at once; the roots keep their global one
+                global_rotation = self.global_rotation
+                local_rotation = global_rotation.clone()
+                _, (node_indices, parent_indices) = self.skeleton_tree._schedule_on(
+                    global_rotation.device
+                )
+                local_rotation.index_copy_(
+                    -2,
+                    node_indices,
+                    quat_mul_norm(
+                        quat_inverse(global_rotation.index_select(-2, parent_indices)),
+                        global_rotation.index_select(-2, node_indices),
+                    ),
+                )
                 self._comp_local_rotation = local_rotation
             return self._comp_local_rotation
         else:
@@ -26,9 +26,14 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import hashlib
+import math
 import numpy as np
 import os
+import time
 import yaml
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from poselib.poselib.skeleton.skeleton3d import SkeletonMotion
 from poselib.poselib.core.rotation3d import *
@@ -89,30 +94,99 @@ class DeviceCache:
         return out
 
 
+MOTION_CACHE_VERSION = 2
+"""Version of the on-disk motion cache, bump it when the derived tensors change."""
+
+MOTION_CACHE_KEYS = ("gts", "grs", "lrs", "grvs", "gravs", "dvs")
+"""Derived per-frame tensors stored in the on-disk motion cache."""
+
+
+def _read_motion_file(motion_file, metadata_only=False):
+    """
+    读取并解码一个运动文件，在线程池中执行，所有计算都在 CPU 上完成。
+
+    Args:
+        motion_file (str): 运动文件路径
+        metadata_only (bool): 只返回帧率和帧数，不计算逐帧张量
+
+    Returns:
+        dict: fps, num_frames, num_bytes，以及 gts/grs/lrs/grvs/gravs 逐帧张量和计算关节速度用的原始精度局部旋转
+    """
+    motion = SkeletonMotion.from_file(motion_file)
+    clip = {
+        "fps": motion.fps,
+        "num_frames": motion.tensor.shape[0],
+        "num_bytes": os.path.getsize(motion_file),
+    }
+    if not metadata_only:
+        clip["gts"] = motion.global_translation.float()
+        clip["grs"] = motion.global_rotation.float()
+        clip["lrs"] = motion.local_rotation.float()
+        clip["grvs"] = motion.global_root_velocity.float()
+        clip["gravs"] = motion.global_root_angular_velocity.float()
+        clip["source_lrs"] = motion.local_rotation
+    return clip
+
+
 class MotionLib():
     def __init__(self, motion_file, dof_body_ids, dof_offsets,
-                 key_body_ids, device):
+                 key_body_ids, device, use_disk_cache=True, cache_dir=None,
+                 num_workers=None, lazy_load=False):
+        """
+        Args:
+            motion_file (str): 单个运动文件或者运动列表 yaml
+            dof_body_ids (list): 每个关节对应的刚体编号
+            dof_offsets (list): 每个关节在自由度向量中的起始位置，最后一项为自由度总数
+            key_body_ids (list): 关键刚体编号
+            device (str): 运动数据所在的设备
+            use_disk_cache (bool): 是否把转换后的运动张量缓存到磁盘，命中缓存时跳过运动文件的读取和转换
+            cache_dir (str): 缓存目录，默认为运动文件所在目录下的 .motion_cache
+            num_workers (int): 读取和解码运动文件的线程数，默认为 min(8, CPU 数)
+            lazy_load (bool): 初始化时只读取帧率和帧数，片段在第一次被 sample_motions 或 get_motion_state
+                选中时才转换并传到设备上，用于很大的运动库。命中磁盘缓存时所有片段直接从缓存读取
+        """
         self._dof_body_ids = dof_body_ids
         self._dof_offsets = dof_offsets
         self._num_dof = dof_offsets[-1]
         self._key_body_ids = torch.tensor(key_body_ids, device=device)
         self._device = device
-        self._load_motions(motion_file)
+        self._num_workers = num_workers if num_workers is not None else min(8, os.cpu_count() or 1)
+        self._lazy_load = lazy_load
+        self._load_metrics = {"num_files": 0, "num_bytes": 0, "load_time": 0.0}
+        self._build_dof_index()
 
-        motions = self._motions
-        self.gts = torch.cat([m.global_translation for m in motions], dim=0).float()
-        self.grs = torch.cat([m.global_rotation for m in motions], dim=0).float()
-        self.lrs = torch.cat([m.local_rotation for m in motions], dim=0).float()
-        self.grvs = torch.cat([m.global_root_velocity for m in motions], dim=0).float()
-        self.gravs = torch.cat([m.global_root_angular_velocity for m in motions], dim=0).float()
-        self.dvs = torch.cat([m.dof_vels for m in motions], dim=0).float()
-
-        lengths = self._motion_num_frames
-        lengths_shifted = lengths.roll(1)
-        lengths_shifted[0] = 0
-        self.length_starts = lengths_shifted.cumsum(0)
+        motion_files, motion_weights = self._fetch_motion_files(motion_file)
+        cache_file = None
+        cache = None
+        if use_disk_cache:
+            if cache_dir is None:
+                cache_dir = os.path.join(os.path.dirname(motion_file), ".motion_cache")
+            cache_file = os.path.join(cache_dir, "motion_lib-{:s}.pt".format(self._motion_cache_key(motion_files)))
+            cache = self._read_motion_cache(cache_file)
+
+        clips = self._load_motions(motion_files, motion_weights, cache)
+
+        if cache is not None:
+            lengths = self._motion_num_frames
+            lengths_shifted = lengths.roll(1)
+            lengths_shifted[0] = 0
+            self.length_starts = lengths_shifted.cumsum(0)
+            for k in MOTION_CACHE_KEYS:
+                setattr(self, k, cache[k].to(self._device, dtype=torch.float32))
+            self._frame_table = self._compute_frame_table(0)
+            self._motion_loaded = [True] * self.num_motions()
+            self._num_loaded_motions = self.num_motions()
+        else:
+            # 片段按加载顺序首尾相接地存放，length_starts 记录每个片段第一帧的位置
+            self.length_starts = torch.zeros_like(self._motion_num_frames)
+            self._motion_loaded = [False] * self.num_motions()
+            self._num_loaded_motions = 0
+            if not self._lazy_load:
+                self._append_clips(list(range(self.num_motions())), clips)
+                if cache_file is not None:
+                    self._write_motion_cache(cache_file)
 
-        self.motion_ids = torch.arange(len(self._motions), dtype=torch.long, device=self._device)
+        self.motion_ids = torch.arange(self.num_motions(), dtype=torch.long, device=self._device)
 
         return
 
@@ -123,11 +197,28 @@ class MotionLib():
         return sum(self._motion_lengths)
 
     def get_motion(self, motion_id):
+        # 逐帧数据已经拼接在 gts 等张量中，单个运动对象在第一次访问时才读取
+        if self._motions[motion_id] is None:
+            self._motions[motion_id] = self._load_motion_file(self._motion_files[motion_id])
         return self._motions[motion_id]
 
+    def get_load_metrics(self):
+        """
+        运动文件读取的统计，延迟加载时包括之后按需读取的片段。
+
+        Returns:
+            dict: num_files, num_bytes, load_time (s), files_per_s, bytes_per_s
+        """
+        metrics = dict(self._load_metrics)
+        load_time = max(metrics["load_time"], 1e-9)
+        metrics["files_per_s"] = metrics["num_files"] / load_time
+        metrics["bytes_per_s"] = metrics["num_bytes"] / load_time
+        return metrics
+
     def sample_motions(self, n):
         # 根据_motion_weights进行多项式抽样，生成n个样本，允许重复
         motion_ids = torch.multinomial(self._motion_weights, num_samples=n, replacement=True)
+        self._ensure_loaded(motion_ids)
 
         # m = self.num_motions()
         # motion_ids = np.random.choice(m, size=n, replace=True, p=self._motion_weights)
@@ -153,12 +244,14 @@ class MotionLib():
 
     def get_motion_state(self, motion_ids, motion_times):
         """
-        获取运动状态
-        
+        获取运动状态，所有字段在一次查询中得到：两帧的数据用一次索引取出，
+        关节角度是预先按帧计算好的，查询时只需要插值。
+
         Args:
-            motion_ids (list): 运动ID列表
-            motion_times (list): 每个运动的时间列表
-        
+            motion_ids (torch.Tensor): 运动ID [n]
+            motion_times (torch.Tensor): 每个运动的时间 [n]，或者每个运动取多个时间点 [n, 时间步数]
+                （例如 AMP 观测的历史帧），此时所有返回值都多一维时间步
+
         Returns:
             tuple: 包含以下元素的元组
                 root_pos (torch.Tensor): 根节点位置
@@ -170,135 +263,183 @@ class MotionLib():
                 key_pos (torch.Tensor): 关键节点位置
         
         """
-        n = len(motion_ids)
-        num_bodies = self._get_num_bodies()
-        num_key_bodies = self._key_body_ids.shape[0]
-
-        motion_len = self._motion_lengths[motion_ids]
-        num_frames = self._motion_num_frames[motion_ids]
-        dt = self._motion_dt[motion_ids]
+        self._ensure_loaded(motion_ids)
 
-        frame_idx0, frame_idx1, blend = self._calc_frame_blend(motion_times, motion_len, num_frames, dt)
+        batch_shape = motion_times.shape
+        if motion_times.dim() > motion_ids.dim():
+            motion_ids = motion_ids.unsqueeze(-1).expand(batch_shape)
 
-        f0l = frame_idx0 + self.length_starts[motion_ids]
-        f1l = frame_idx1 + self.length_starts[motion_ids]
-
-        root_pos0 = self.gts[f0l, 0]
-        root_pos1 = self.gts[f1l, 0]
-
-        root_rot0 = self.grs[f0l, 0]
-        root_rot1 = self.grs[f1l, 0]
-
-        local_rot0 = self.lrs[f0l]
-        local_rot1 = self.lrs[f1l]
-
-        root_vel = self.grvs[f0l]
-
-        root_ang_vel = self.gravs[f0l]
-        
-        key_pos0 = self.gts[f0l.unsqueeze(-1), self._key_body_ids.unsqueeze(0)]
-        key_pos1 = self.gts[f1l.unsqueeze(-1), self._key_body_ids.unsqueeze(0)]
-
-        dof_vel = self.dvs[f0l]
-
-        vals = [root_pos0, root_pos1, local_rot0, local_rot1, root_vel, root_ang_vel, key_pos0, key_pos1]
-        for v in vals:
-            assert v.dtype != torch.float64
-
-
-        blend = blend.unsqueeze(-1)
-
-        root_pos = (1.0 - blend) * root_pos0 + blend * root_pos1
-
-        root_rot = torch_utils.slerp(root_rot0, root_rot1, blend)
-
-        blend_exp = blend.unsqueeze(-1)
-        key_pos = (1.0 - blend_exp) * key_pos0 + blend_exp * key_pos1
-        
-        local_rot = torch_utils.slerp(local_rot0, local_rot1, torch.unsqueeze(blend, axis=-1))
-        dof_pos = self._local_rotation_to_dof(local_rot)
+        state = query_motion_state(self._frame_table, self.length_starts, self._motion_lengths,
+                                   self._motion_num_frames, self._motion_dt,
+                                   self._exp_map_dof_ids, self._hinge_dof_ids,
+                                   motion_ids.reshape(-1), motion_times.reshape(-1),
+                                   self._num_dof, self._key_body_ids.shape[0])
 
+        root_pos, root_rot, dof_pos, root_vel, root_ang_vel, dof_vel, key_pos = \
+            [v.view(batch_shape + v.shape[1:]) for v in state]
         return root_pos, root_rot, dof_pos, root_vel, root_ang_vel, dof_vel, key_pos
     
-    def _load_motions(self, motion_file):
-        # 初始化各种列表，用于存储运动数据
-        self._motions = []
-        self._motion_lengths = []
-        self._motion_weights = []
-        self._motion_fps = []
-        self._motion_dt = []
-        self._motion_num_frames = []
-        self._motion_files = []
-
-        # 初始化总长度为0.0
-        total_len = 0.0
-
-        # 获取运动文件及其权重
-        motion_files, motion_weights = self._fetch_motion_files(motion_file)
+    def _load_motions(self, motion_files, motion_weights, cache=None):
+        """
+        读取所有运动片段的帧率、帧数和权重。未命中缓存时用线程池读取运动文件，
+        返回解码后的片段（延迟加载时只有元数据），命中缓存时返回 None。
+        """
         num_motion_files = len(motion_files)
-        for f in range(num_motion_files):
-            # 打印加载进度
-            curr_file = motion_files[f]
-            print("Loading {:d}/{:d} motion files: {:s}".format(f + 1, num_motion_files, curr_file))
-            
-            # 从文件中加载当前运动
-            curr_motion = SkeletonMotion.from_file(curr_file)
-
-            # 计算当前运动的帧率和时间间隔
-            motion_fps = curr_motion.fps
-            curr_dt = 1.0 / motion_fps
-
-            # 获取当前运动的帧数和总长度
-            num_frames = curr_motion.tensor.shape[0]
-            curr_len = 1.0 / motion_fps * (num_frames - 1)
-
-            # 存储当前运动的帧率、时间间隔和帧数
-            self._motion_fps.append(motion_fps)
-            self._motion_dt.append(curr_dt)
-            self._motion_num_frames.append(num_frames)
-
-            # 计算当前运动的关节速度
-            curr_dof_vels = self._compute_motion_dof_vels(curr_motion)
-            curr_motion.dof_vels = curr_dof_vels
-
-            # 如果使用缓存，将当前运动对象移到设备上
-            if USE_CACHE:
-                curr_motion = DeviceCache(curr_motion, self._device)
-            else:
-                curr_motion.tensor = curr_motion.tensor.to(self._device)
-                curr_motion._skeleton_tree._parent_indices = curr_motion._skeleton_tree._parent_indices.to(self._device)
-                curr_motion._skeleton_tree._local_translation = curr_motion._skeleton_tree._local_translation.to(self._device)
-                curr_motion._rotation = curr_motion._rotation.to(self._device)
+        self._motions = [None] * num_motion_files
+        self._motion_files = list(motion_files)
+
+        if cache is not None:
+            # 帧率和帧数来自缓存，运动文件在 get_motion 中按需读取
+            print("Loading {:d} motion files from the motion cache".format(num_motion_files))
+            clips = None
+            motion_fps = cache["motion_fps"].tolist()
+            motion_num_frames = cache["motion_num_frames"].tolist()
+        else:
+            clips = self._read_motion_files(motion_files, metadata_only=self._lazy_load)
+            motion_fps = [clip["fps"] for clip in clips]
+            motion_num_frames = [clip["num_frames"] for clip in clips]
 
-            # 将当前运动对象添加到列表中
-            self._motions.append(curr_motion)
-            self._motion_lengths.append(curr_len)
+        # 写缓存时保存双精度的帧率，命中缓存时的时间间隔和长度与直接读取运动文件时一致
+        self._motion_fps_exact = motion_fps
 
-            # 获取当前运动的权重并添加到列表中
-            curr_weight = motion_weights[f]
-            self._motion_weights.append(curr_weight)
-            self._motion_files.append(curr_file)
+        # 计算每个运动的时间间隔和总长度
+        motion_dt = [1.0 / fps for fps in motion_fps]
+        motion_lengths = [1.0 / fps * (num_frames - 1) for fps, num_frames in zip(motion_fps, motion_num_frames)]
 
-        # 将运动长度列表转换为张量
-        self._motion_lengths = torch.tensor(self._motion_lengths, device=self._device, dtype=torch.float32)
+        # 将运动长度、帧率、时间间隔和帧数转换为张量
+        self._motion_lengths = torch.tensor(motion_lengths, device=self._device, dtype=torch.float32)
+        self._motion_fps = torch.tensor(motion_fps, device=self._device, dtype=torch.float32)
+        self._motion_dt = torch.tensor(motion_dt, device=self._device, dtype=torch.float32)
+        self._motion_num_frames = torch.tensor(motion_num_frames, device=self._device)
 
         # 将运动权重列表转换为张量，并归一化
-        self._motion_weights = torch.tensor(self._motion_weights, dtype=torch.float32, device=self._device)
+        self._motion_weights = torch.tensor(motion_weights, dtype=torch.float32, device=self._device)
         self._motion_weights /= self._motion_weights.sum()
 
-        # 将帧率、时间间隔和帧数列表转换为张量
-        self._motion_fps = torch.tensor(self._motion_fps, device=self._device, dtype=torch.float32)
-        self._motion_dt = torch.tensor(self._motion_dt, device=self._device, dtype=torch.float32)
-        self._motion_num_frames = torch.tensor(self._motion_num_frames, device=self._device)
-
-        # 计算运动的数量和总长度
+        # 打印加载的运动数量和总长度
         num_motions = self.num_motions()
         total_len = self.get_total_length()
-
-        # 打印加载的运动数量和总长度
         print("Loaded {:d} motions with a total length of {:.3f}s.".format(num_motions, total_len))
 
-        # 返回
+        return clips
+
+    def _read_motion_files(self, motion_files, metadata_only=False):
+        """用线程池读取并解码运动文件，并累计读取统计。"""
+        start_time = time.perf_counter()
+        read_fn = partial(_read_motion_file, metadata_only=metadata_only)
+        if self._num_workers > 1 and len(motion_files) > 1:
+            with ThreadPoolExecutor(max_workers=self._num_workers) as pool:
+                clips = list(pool.map(read_fn, motion_files))
+        else:
+            clips = [read_fn(f) for f in motion_files]
+        load_time = time.perf_counter() - start_time
+
+        num_bytes = sum(clip["num_bytes"] for clip in clips)
+        self._load_metrics["num_files"] += len(clips)
+        self._load_metrics["num_bytes"] += num_bytes
+        self._load_metrics["load_time"] += load_time
+        print("Read {:d} motion files ({:.1f} MB) in {:.2f}s: {:.1f} files/s, {:.1f} MB/s".format(
+            len(clips), num_bytes / 1e6, load_time, len(clips) / max(load_time, 1e-9),
+            num_bytes / 1e6 / max(load_time, 1e-9)))
+        return clips
+
+    def _append_clips(self, motion_ids, clips):
+        """
+        把解码后的片段接到逐帧张量的末尾。CPU 上先拼接成一块，再一次传到设备上。
+
+        Args:
+            motion_ids (list): 片段编号
+            clips (list): _read_motion_file 返回的片段，与 motion_ids 一一对应
+        """
+        keys = ("gts", "grs", "lrs", "grvs", "gravs")
+        frames = [torch.cat([clip[k] for clip in clips], dim=0) for k in keys]
+        packed = torch.cat([f.reshape(-1) for f in frames]).to(self._device)
+        frames = [p.view(f.shape) for p, f in zip(packed.split([f.numel() for f in frames]), frames)]
+
+        ids = torch.tensor(motion_ids, dtype=torch.long, device=self._device)
+        # 与逐帧的实现一致，用运动文件原始精度的局部旋转计算速度
+        source_lrs = torch.cat([clip["source_lrs"] for clip in clips], dim=0).to(self._device)
+        frames.append(self._compute_motion_dof_vels(source_lrs, ids))
+        keys = keys + ("dvs",)
+
+        num_frames = self._motion_num_frames[ids]
+        num_stored_frames = self.gts.shape[0] if hasattr(self, "gts") else 0
+        self.length_starts[ids] = num_frames.cumsum(0) - num_frames + num_stored_frames
+
+        for k, f in zip(keys, frames):
+            setattr(self, k, torch.cat([getattr(self, k), f], dim=0) if num_stored_frames > 0 else f)
+        frame_table = self._compute_frame_table(num_stored_frames)
+        self._frame_table = torch.cat([self._frame_table, frame_table], dim=0) if num_stored_frames > 0 else frame_table
+        for motion_id in motion_ids:
+            self._motion_loaded[motion_id] = True
+        self._num_loaded_motions += len(motion_ids)
+        return
+
+    def _ensure_loaded(self, motion_ids):
+        """延迟加载时读取 motion_ids 中还没有加载的片段，全部加载之后不再有主机同步。"""
+        if self._num_loaded_motions == self.num_motions():
+            return
+        motion_ids = [i for i in torch.unique(motion_ids).tolist() if not self._motion_loaded[i]]
+        if len(motion_ids) == 0:
+            return
+        clips = self._read_motion_files([self._motion_files[i] for i in motion_ids])
+        self._append_clips(motion_ids, clips)
+        return
+
+    def _compute_frame_table(self, start_frame):
+        """
+        把 start_frame 之后每一帧查询需要的数据排成一行：
+            [根节点位置 3, 根节点旋转 4, 关节角度, 根节点速度 3, 根节点角速度 3, 关节速度, 关键刚体位置]
+        关节角度在这里按帧算好，get_motion_state 只需要一次索引和插值。
+        """
+        num_frames = self.gts.shape[0] - start_frame
+        dof_pos = self._local_rotation_to_dof(self.lrs[start_frame:])
+        key_pos = self.gts[start_frame:, self._key_body_ids].reshape(num_frames, -1)
+        return torch.cat([self.gts[start_frame:, 0], self.grs[start_frame:, 0], dof_pos,
+                          self.grvs[start_frame:], self.gravs[start_frame:], self.dvs[start_frame:], key_pos], dim=-1)
+
+    def _load_motion_file(self, motion_file):
+        return self._to_device(SkeletonMotion.from_file(motion_file))
+
+    def _to_device(self, curr_motion):
+        # 如果使用缓存，将当前运动对象移到设备上
+        if USE_CACHE:
+            curr_motion = DeviceCache(curr_motion, self._device)
+        else:
+            curr_motion.tensor = curr_motion.tensor.to(self._device)
+            curr_motion._skeleton_tree._parent_indices = curr_motion._skeleton_tree._parent_indices.to(self._device)
+            curr_motion._skeleton_tree._local_translation = curr_motion._skeleton_tree._local_translation.to(self._device)
+            curr_motion._rotation = curr_motion._rotation.to(self._device)
+        return curr_motion
+
+    def _motion_cache_key(self, motion_files):
+        """运动文件内容和关节映射的哈希，任何一项变化都会使用新的缓存文件。"""
+        sha = hashlib.sha1()
+        sha.update("v{:d}".format(MOTION_CACHE_VERSION).encode())
+        sha.update(repr((list(self._dof_body_ids), list(self._dof_offsets))).encode())
+        for motion_file in motion_files:
+            sha.update(os.path.basename(motion_file).encode())
+            with open(motion_file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+        return sha.hexdigest()
+
+    def _read_motion_cache(self, cache_file):
+        if not os.path.isfile(cache_file):
+            return None
+        print("Reading motion cache: {:s}".format(cache_file))
+        return torch.load(cache_file, map_location="cpu")
+
+    def _write_motion_cache(self, cache_file):
+        cache = {k: getattr(self, k).cpu() for k in MOTION_CACHE_KEYS}
+        cache["motion_fps"] = torch.tensor(self._motion_fps_exact, dtype=torch.float64)
+        cache["motion_num_frames"] = self._motion_num_frames.cpu()
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # 先写临时文件再替换，多个进程同时写入时读取方不会看到写了一半的文件
+        tmp_file = "{:s}.tmp-{:d}".format(cache_file, os.getpid())
+        torch.save(cache, tmp_file)
+        os.replace(tmp_file, cache_file)
+        print("Wrote motion cache: {:s}".format(cache_file))
         return
 
     def _fetch_motion_files(self, motion_file):
@@ -338,84 +479,170 @@ class MotionLib():
         return frame_idx0, frame_idx1, blend
 
     def _get_num_bodies(self):
-        motion = self.get_motion(0)
-        num_bodies = motion.num_joints
+        num_bodies = self.gts.shape[1]
         return num_bodies
 
-    def _compute_motion_dof_vels(self, motion):
-        num_frames = motion.tensor.shape[0]
-        dt = 1.0 / motion.fps
-        dof_vels = []
-
-        for f in range(num_frames - 1):
-            local_rot0 = motion.local_rotation[f]
-            local_rot1 = motion.local_rotation[f + 1]
-            frame_dof_vel = self._local_rotation_to_dof_vel(local_rot0, local_rot1, dt)
-            frame_dof_vel = frame_dof_vel
-            dof_vels.append(frame_dof_vel)
-        
-        dof_vels.append(dof_vels[-1])
-        dof_vels = torch.stack(dof_vels, dim=0)
-
-        return dof_vels
-    
-    def _local_rotation_to_dof(self, local_rot):
+    def _build_dof_index(self):
+        """
+        预先计算自由度与刚体之间的映射，之后的转换只需要一次索引：
+            _dof_joint_ids: 每个自由度所属的关节
+            _dof_components: 3 自由度关节取指数映射的第 0/1/2 个分量，1 自由度关节取 3（绕 y 轴的转角）
+            _dof_vel_body_ids / _dof_vel_axes: 每个自由度的速度取自哪个刚体的哪个轴
+        """
         body_ids = self._dof_body_ids
         dof_offsets = self._dof_offsets
 
-        n = local_rot.shape[0]
-        dof_pos = torch.zeros((n, self._num_dof), dtype=torch.float, device=self._device)
-
+        joint_ids = []
+        components = []
         for j in range(len(body_ids)):
-            body_id = body_ids[j]
             joint_offset = dof_offsets[j]
             joint_size = dof_offsets[j + 1] - joint_offset
 
             if (joint_size == 3):
-                joint_q = local_rot[:, body_id]
-                joint_exp_map = torch_utils.quat_to_exp_map(joint_q)
-                dof_pos[:, joint_offset:(joint_offset + joint_size)] = joint_exp_map
+                joint_ids += [j, j, j]
+                components += [0, 1, 2]
             elif (joint_size == 1):
-                joint_q = local_rot[:, body_id]
-                joint_theta, joint_axis = torch_utils.quat_to_angle_axis(joint_q)
-                joint_theta = joint_theta * joint_axis[..., 1] # assume joint is always along y axis
-
-                joint_theta = normalize_angle(joint_theta)
-                dof_pos[:, joint_offset] = joint_theta
-
+                joint_ids.append(j)
+                components.append(3)
             else:
                 print("Unsupported joint type")
                 assert(False)
 
-        return dof_pos
+        # 插值时 3 自由度关节按指数映射处理，1 自由度关节按转角处理
+        exp_map_dof_ids = [[dof_offsets[j] + i for i in range(3)] for j in range(len(body_ids)) if dof_offsets[j + 1] - dof_offsets[j] == 3]
+        hinge_dof_ids = [dof_offsets[j] for j in range(len(body_ids)) if dof_offsets[j + 1] - dof_offsets[j] == 1]
+        self._exp_map_dof_ids = torch.tensor(exp_map_dof_ids, dtype=torch.long, device=self._device).view(-1, 3)
+        self._hinge_dof_ids = torch.tensor(hinge_dof_ids, dtype=torch.long, device=self._device)
+
+        body_ids = torch.tensor(body_ids, dtype=torch.long, device=self._device)
+        self._dof_joint_body_ids = body_ids
+        self._dof_joint_ids = torch.tensor(joint_ids, dtype=torch.long, device=self._device)
+        self._dof_components = torch.tensor(components, dtype=torch.long, device=self._device)
+        self._dof_vel_body_ids = body_ids[self._dof_joint_ids]
+        # assume 1-dof joints are always along the y axis
+        self._dof_vel_axes = torch.where(
+            self._dof_components == 3, torch.ones_like(self._dof_components), self._dof_components
+        )
+        return
 
-    def _local_rotation_to_dof_vel(self, local_rot0, local_rot1, dt):
-        body_ids = self._dof_body_ids
-        dof_offsets = self._dof_offsets
+    def _compute_motion_dof_vels(self, local_rotation, motion_ids):
+        """
+        一次计算多个片段所有帧的关节速度。
+
+        Args:
+            local_rotation (torch.Tensor): motion_ids 中的片段首尾相接的局部旋转 [总帧数, 刚体数, 4]
+            motion_ids (torch.Tensor): 片段编号
 
-        dof_vel = torch.zeros([self._num_dof], device=self._device)
+        Returns:
+            torch.Tensor: [总帧数, 自由度数]，每个片段的最后一帧沿用前一帧的速度
+        """
+        num_frames = self._motion_num_frames[motion_ids]
+        frame_dt = torch.repeat_interleave(1.0 / self._motion_fps[motion_ids].double(), num_frames)
+        frame_dt = frame_dt.to(local_rotation.device, dtype=local_rotation.dtype)
+        dof_vels = self._local_rotation_to_dof_vel(local_rotation[:-1], local_rotation[1:], frame_dt[:-1])
+        dof_vels = torch.cat([dof_vels, dof_vels[-1:]], dim=0)
 
-        diff_quat_data = quat_mul_norm(quat_inverse(local_rot0), local_rot1)
-        diff_angle, diff_axis = quat_angle_axis(diff_quat_data)
-        local_vel = diff_axis * diff_angle.unsqueeze(-1) / dt
-        local_vel = local_vel
+        # 片段最后一帧与下一个片段第一帧之间的差分没有意义，用前一帧覆盖
+        last_frames = (num_frames.cumsum(0) - 1).to(local_rotation.device)
+        dof_vels[last_frames] = dof_vels[last_frames - 1]
 
-        for j in range(len(body_ids)):
-            body_id = body_ids[j]
-            joint_offset = dof_offsets[j]
-            joint_size = dof_offsets[j + 1] - joint_offset
+        return dof_vels.float()
+    
+    def _local_rotation_to_dof(self, local_rot):
+        joint_q = local_rot[:, self._dof_joint_body_ids]
+        joint_theta, joint_axis = torch_utils.quat_to_angle_axis(joint_q)
+        joint_exp_map = torch_utils.angle_axis_to_exp_map(joint_theta, joint_axis)
+        joint_theta = normalize_angle(joint_theta * joint_axis[..., 1]) # assume joint is always along y axis
 
-            if (joint_size == 3):
-                joint_vel = local_vel[body_id]
-                dof_vel[joint_offset:(joint_offset + joint_size)] = joint_vel
+        # [n, 关节数, 4]，前三列为指数映射，最后一列为 1 自由度关节的转角
+        joint_dofs = torch.cat([joint_exp_map, joint_theta.unsqueeze(-1)], dim=-1)
+        dof_pos = joint_dofs[:, self._dof_joint_ids, self._dof_components]
 
-            elif (joint_size == 1):
-                assert(joint_size == 1)
-                joint_vel = local_vel[body_id]
-                dof_vel[joint_offset] = joint_vel[1] # assume joint is always along y axis
+        return dof_pos
 
-            else:
-                print("Unsupported joint type")
-                assert(False)
+    def _local_rotation_to_dof_vel(self, local_rot0, local_rot1, dt):
+        """
+        Args:
+            local_rot0, local_rot1 (torch.Tensor): [n, 刚体数, 4] 相邻两帧的局部旋转
+            dt (torch.Tensor or float): 两帧之间的时间间隔，张量时形状为 [n]
+        """
+        if isinstance(dt, torch.Tensor):
+            dt = dt.view(-1, 1, 1)
+
+        diff_quat_data = quat_mul_norm(quat_inverse(local_rot0), local_rot1)
+        diff_angle, diff_axis = quat_angle_axis(diff_quat_data)
+        local_vel = diff_axis * diff_angle.unsqueeze(-1) / dt
 
-        return dof_vel
\ No newline at end of file
+        dof_vel = local_vel[:, self._dof_vel_body_ids, self._dof_vel_axes]
+
+        return dof_vel
+
+
+#####################################################################
+###=========================jit functions=========================###
+#####################################################################
+
+@torch.jit.script
+def flip_exp_map(exp_map):
+    # type: (Tensor) -> Tensor
+    # 同一个旋转的另一种指数映射表示，转角为 angle - 2 * pi
+    angle = torch.norm(exp_map, dim=-1, keepdim=True).clamp(min=1e-9)
+    return exp_map * (1.0 - 2.0 * math.pi / angle)
+
+@torch.jit.script
+def lerp_exp_map(exp_map0, exp_map1, blend):
+    # type: (Tensor, Tensor, Tensor) -> Tensor
+    # 转角接近 pi 时相邻两帧的指数映射可能方向相反，选与第一帧更近的表示再插值，结果的转角保持在 [0, pi]
+    flipped1 = flip_exp_map(exp_map1)
+    use_flipped = torch.norm(flipped1 - exp_map0, dim=-1, keepdim=True) < torch.norm(exp_map1 - exp_map0, dim=-1, keepdim=True)
+    exp_map1 = torch.where(use_flipped, flipped1, exp_map1)
+
+    exp_map = (1.0 - blend) * exp_map0 + blend * exp_map1
+    exp_map = torch.where(torch.norm(exp_map, dim=-1, keepdim=True) > math.pi, flip_exp_map(exp_map), exp_map)
+    return exp_map
+
+@torch.jit.script
+def query_motion_state(frame_table, length_starts, motion_lengths, motion_num_frames, motion_dt,
+                       exp_map_dof_ids, hinge_dof_ids, motion_ids, motion_times, num_dof, num_key_bodies):
+    # type: (Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, int, int) -> Tuple[Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor]
+    n = motion_ids.shape[0]
+    motion_len = motion_lengths[motion_ids]
+    num_frames = motion_num_frames[motion_ids]
+    dt = motion_dt[motion_ids]
+
+    # 与 MotionLib._calc_frame_blend 相同
+    phase = torch.clip(motion_times / motion_len, 0.0, 1.0)
+    frame_idx0 = (phase * (num_frames - 1)).long()
+    frame_idx1 = torch.min(frame_idx0 + 1, num_frames - 1)
+    blend = ((motion_times - frame_idx0 * dt) / dt).unsqueeze(-1)
+
+    # 两帧的数据用一次索引取出
+    starts = length_starts[motion_ids]
+    frames = frame_table[torch.cat([frame_idx0 + starts, frame_idx1 + starts])]
+    frame0 = frames[:n]
+    frame1 = frames[n:]
+
+    dof_start = 7
+    vel_start = dof_start + num_dof
+    dof_vel_start = vel_start + 6
+    key_start = dof_vel_start + num_dof
+
+    root_pos = (1.0 - blend) * frame0[:, 0:3] + blend * frame1[:, 0:3]
+    root_rot = torch_utils.slerp(frame0[:, 3:7], frame1[:, 3:7], blend)
+
+    dof_pos0 = frame0[:, dof_start:vel_start]
+    dof_pos1 = frame1[:, dof_start:vel_start]
+    dof_pos = torch.zeros_like(dof_pos0)
+    dof_pos[:, exp_map_dof_ids] = lerp_exp_map(dof_pos0[:, exp_map_dof_ids], dof_pos1[:, exp_map_dof_ids],
+                                               blend.unsqueeze(-1))
+    hinge_pos0 = dof_pos0[:, hinge_dof_ids]
+    dof_pos[:, hinge_dof_ids] = normalize_angle(hinge_pos0 + blend * normalize_angle(dof_pos1[:, hinge_dof_ids] - hinge_pos0))
+
+    root_vel = frame0[:, vel_start:vel_start + 3]
+    root_ang_vel = frame0[:, vel_start + 3:dof_vel_start]
+    dof_vel = frame0[:, dof_vel_start:key_start]
+
+    key_pos = (1.0 - blend) * frame0[:, key_start:] + blend * frame1[:, key_start:]
+    key_pos = key_pos.view(n, num_key_bodies, 3)
+
+    return root_pos, root_rot, dof_pos, root_vel, root_ang_vel, dof_vel, key_pos
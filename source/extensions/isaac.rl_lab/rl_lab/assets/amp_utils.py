@@ -6,52 +6,101 @@ _EPS = torch.finfo().eps * 10
 
 
 class RunningMeanStd:
-    def __init__(self, epsilon: float = 1e-4, shape: Tuple[int, ...] = ()):
+    def __init__(self, epsilon: float = 1e-4, shape: Tuple[int, ...] = (), device="cpu"):
         """
         Calculates the running mean and std of a data stream
         https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+        The statistics are float64 tensors on ``device`` and are updated without leaving it.
         :param epsilon: helps with arithmetic issues
         :param shape: the shape of the data stream's output
+        :param device: device of the statistics, they follow the data passed to :meth:`update`
         """
-        self.mean = np.zeros(shape, np.float64)
-        self.var = np.ones(shape, np.float64)
-        self.count = epsilon
-
-    def update(self, arr: np.ndarray) -> None:
-        batch_mean = np.mean(arr, axis=0)
-        batch_var = np.var(arr, axis=0)
-        batch_count = arr.shape[0]
-        self.update_from_moments(batch_mean, batch_var, batch_count)
-
-    def update_from_moments(self, batch_mean: np.ndarray, batch_var: np.ndarray, batch_count: int) -> None:
+        self.mean = torch.zeros(shape, dtype=torch.float64, device=device)
+        self.var = torch.ones(shape, dtype=torch.float64, device=device)
+        self.count = torch.tensor(epsilon, dtype=torch.float64, device=device)
+
+    def to(self, device):
+        self.mean = self.mean.to(device)
+        self.var = self.var.to(device)
+        self.count = self.count.to(device)
+        return self
+
+    def update(self, arr) -> None:
+        arr = torch.as_tensor(arr)
+        if arr.device != self.mean.device:
+            self.to(arr.device)
+        batch_var, batch_mean = torch.var_mean(arr, dim=0, correction=0)
+        self.update_from_moments(batch_mean.double(), batch_var.double(), arr.shape[0])
+
+    def update_from_moments(self, batch_mean: torch.Tensor, batch_var: torch.Tensor, batch_count: int) -> None:
         delta = batch_mean - self.mean
         tot_count = self.count + batch_count
 
         new_mean = self.mean + delta * batch_count / tot_count
         m_a = self.var * self.count
         m_b = batch_var * batch_count
-        m_2 = m_a + m_b + np.square(delta) * self.count * batch_count / (self.count + batch_count)
-        new_var = m_2 / (self.count + batch_count)
-
-        new_count = batch_count + self.count
+        m_2 = m_a + m_b + torch.square(delta) * self.count * batch_count / tot_count
+        new_var = m_2 / tot_count
 
         self.mean = new_mean
         self.var = new_var
-        self.count = new_count
+        self.count = tot_count
+
+    def __getstate__(self):
+        # checkpoints keep the NumPy layout of the original implementation, so they load with either version
+        state = self.__dict__.copy()
+        state["mean"] = self.mean.cpu().numpy()
+        state["var"] = self.var.cpu().numpy()
+        state["count"] = float(self.count)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        state["mean"] = torch.as_tensor(state["mean"], dtype=torch.float64)
+        state["var"] = torch.as_tensor(state["var"], dtype=torch.float64)
+        state["count"] = torch.as_tensor(state["count"], dtype=torch.float64)
+        self.__dict__.update(state)
 
 
 class Normalizer(RunningMeanStd):
-    def __init__(self, input_dim, epsilon=1e-4, clip_obs=10.0):
-        super().__init__(shape=input_dim)
+    """Running mean / std normalizer of the AMP observations.
+
+    :meth:`normalize_torch` reuses float32 copies of the statistics that are only rebuilt after an :meth:`update`.
+    A frozen normalizer (:meth:`freeze`, e.g. during evaluation) ignores updates, so it always takes that path.
+    """
+
+    def __init__(self, input_dim, epsilon=1e-4, clip_obs=10.0, device="cpu"):
+        super().__init__(shape=input_dim, device=device)
         self.epsilon = epsilon
         self.clip_obs = clip_obs
+        self.frozen = False
+        self._normalization_cache = None
+
+    def freeze(self):
+        """Stop updating the statistics."""
+        self.frozen = True
+
+    def unfreeze(self):
+        self.frozen = False
+
+    def update(self, arr) -> None:
+        if self.frozen:
+            return
+        super().update(arr)
+        self._normalization_cache = None
 
     def normalize(self, input):
-        return np.clip((input - self.mean) / np.sqrt(self.var + self.epsilon), -self.clip_obs, self.clip_obs)
+        mean = self.mean.cpu().numpy()
+        var = self.var.cpu().numpy()
+        return np.clip((input - mean) / np.sqrt(var + self.epsilon), -self.clip_obs, self.clip_obs)
 
     def normalize_torch(self, input, device):
-        mean_torch = torch.tensor(self.mean, device=device, dtype=torch.float32)
-        std_torch = torch.sqrt(torch.tensor(self.var + self.epsilon, device=device, dtype=torch.float32))
+        cache = self._normalization_cache
+        if cache is None or cache[0].device != input.device:
+            mean_torch = self.mean.to(device=input.device, dtype=torch.float32)
+            std_torch = torch.sqrt((self.var + self.epsilon).to(device=input.device, dtype=torch.float32))
+            cache = self._normalization_cache = (mean_torch, std_torch)
+        mean_torch, std_torch = cache
         return torch.clamp((input - mean_torch) / std_torch, -self.clip_obs, self.clip_obs)
 
     def update_normalizer(self, rollouts, expert_loader):
@@ -59,7 +108,17 @@ class Normalizer(RunningMeanStd):
         expert_data_generator = expert_loader.dataset.feed_forward_generator_amp(expert_loader.batch_size)
 
         for expert_batch, policy_batch in zip(expert_data_generator, policy_data_generator):
-            self.update(torch.vstack(tuple(policy_batch) + tuple(expert_batch)).cpu().numpy())
+            self.update(torch.vstack(tuple(policy_batch) + tuple(expert_batch)))
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_normalization_cache"] = None
+        return state
+
+    def __setstate__(self, state):
+        # checkpoints written before the normalizer could be frozen
+        state = {"frozen": False, "_normalization_cache": None, **state}
+        super().__setstate__(state)
 
 
 def quaternion_slerp(q0, q1, fraction, spin=0, shortestpath=True):
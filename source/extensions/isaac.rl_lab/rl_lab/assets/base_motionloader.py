@@ -1,7 +1,10 @@
 import os
 import csv
 import json
+import numpy as np
 import torch
+
+from . import motion_cache
 _EPS = torch.finfo(float).eps * 4.0
 
 #from omni.isaac.lab.utils.math import *
@@ -14,7 +17,8 @@ class MotionData_Base:
                  file_type="csv",
                  data_spaces = None,
                  env_step_duration = 0.005,
-                 
+                 use_cache = True,
+                 cache_dir = None,
                  **kwargs):
         """
         args:
@@ -24,6 +28,8 @@ class MotionData_Base:
         data_spaces: dict 数据空间，即每个数据的维度，用于自定义数据的格式，
                           当没有指定时，会自动根据datatype选择默认的数据格式
         env_step_duration：float 环境步长，即isaaclab每次读数据的间隔
+        use_cache: bool 是否使用编译好的二进制缓存（仅对txt数据生效），缓存不存在时会在第一次加载后生成
+        cache_dir: str 缓存的根目录，默认为 data_dir/.motion_cache
         """
         self.device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
         self.data_dir = data_dir
@@ -35,17 +41,26 @@ class MotionData_Base:
 
         self.env_step_duration = env_step_duration
         self.original_data_tensors = []#存储原始数据的列表
-        self.data_tensors = []#存储插值处理后的数据的列表
+        self.data_tensors = []#存储插值处理后的数据的列表，是frames中每个片段的视图
+        self.frames = None#所有片段插值后的帧首尾相接组成的二维张量
+        self.clip_offsets = None#每个片段在frames中的起始行
+        self.clip_num_frames = None#每个片段插值后的帧数
         self.data_names = []#存储数据名称的列表
         self.data_length = []#总可索引帧数
         self.frame_duration = []#存储帧持续时间的列表
         self.data_time_length = []#存储数据时间长度的列表
         self.data_weights = []#存储数据权重的列表
+        self.use_cache = use_cache and file_type == "txt"
+        self.cache_dir = cache_dir if cache_dir is not None else os.path.join(data_dir, ".motion_cache")
 
         # 将 kwargs 中的所有键值对初始化为类的属性
         for key, value in kwargs.items():
             setattr(self, key, value)
         
+        if self.use_cache and self.load_cached_data():
+            print(f'Motion Data Loaded From Cache {self.cache_path}')
+            return
+
         if file_type == "csv":
             self.load_csv_data()
         elif file_type == "txt":
@@ -57,6 +72,8 @@ class MotionData_Base:
         #self.data_reordering()
         #从original_data_tensors进行插值，让离散数据的时间间隔与env_step_duration一致，并保存到data_tensors
         self.data_discretization()
+        if self.use_cache:
+            self.save_cached_data()
         #self.re_calculate_velocity()
         print('Motion Data Loaded Successfully')
 
@@ -138,6 +155,52 @@ class MotionData_Base:
         else:
             self.data_weights = torch.full_like(self.data_weights, 1.0 / len(self.data_weights))  # 如果总权重为0，均匀分配权重 
 
+    def load_cached_data(self):
+        """
+        尝试从编译好的缓存中加载插值后的数据，成功返回True。
+        缓存以源文件内容、数据布局和env_step_duration的哈希命名，任何一项变化都不会命中旧缓存。
+        """
+        file_names = motion_cache.list_source_files(self.data_dir, "txt")
+        dataset_hash = motion_cache.compute_dataset_hash(
+            self.data_dir, file_names, self.cumulative_indices, self.env_step_duration
+        )
+        self.cache_path = os.path.join(self.cache_dir, dataset_hash)
+        cache = motion_cache.load_motion_cache(self.cache_path)
+        if cache is None:
+            return False
+
+        # 内存映射的帧数组，在cpu上直接共享页，在gpu上只需要一次整体拷贝
+        self.frames = torch.from_numpy(cache["frames"]).to(self.device)
+        offsets = torch.from_numpy(cache["offsets"]).to(self.device)
+        self.build_frame_index(offsets[1:] - offsets[:-1])
+        self.data_names = cache["data_names"].tolist()
+        self.data_length = torch.from_numpy(cache["data_length"]).to(self.device)
+        self.frame_duration = torch.from_numpy(cache["frame_duration"]).to(self.device)
+        self.data_time_length = torch.from_numpy(cache["data_time_length"]).to(self.device)
+        self.data_weights = torch.from_numpy(cache["data_weights"]).to(self.device)
+        return True
+
+    def save_cached_data(self):
+        """
+        将插值后的数据写入缓存，供之后的训练进程直接内存映射读取。
+        """
+        offsets = np.concatenate(([0], torch.cumsum(self.clip_num_frames, dim=0).cpu().numpy()))
+        frames = self.frames.cpu().numpy()
+        try:
+            motion_cache.save_motion_cache(
+                self.cache_path,
+                frames,
+                offsets,
+                data_names=np.array(self.data_names),
+                data_length=self.data_length.cpu().numpy(),
+                frame_duration=self.frame_duration.cpu().numpy(),
+                data_time_length=self.data_time_length.cpu().numpy(),
+                data_weights=self.data_weights.cpu().numpy(),
+            )
+        except OSError as e:
+            # 数据目录只读等情况下不影响训练
+            print(f"Failed to write motion cache {self.cache_path}: {e}")
+
     def load_csv_data(self):
         """
         从指定目录加载所有CSV文件，并将每个文件转换为一个不包含表头的二维Tensor。
@@ -165,37 +228,54 @@ class MotionData_Base:
         """
         将数据进行离散化，在MotionData初始化的时候调用，将数据按照仿真环境的step时间间隔进行插值
         以减少强化学习中的计算量
+
+        所有动作片段拼接成一个ragged的二维张量一次性处理：插值时间网格由torch.arange生成，
+        每个插值帧所属的片段由searchsorted确定，root_quat只调用一次quaternion_slerp。
+        """
+        if len(self.original_data_tensors) == 0:
+            return
+        original_data = torch.cat(self.original_data_tensors, dim=0)
+        clip_lengths = torch.tensor([data.shape[0] for data in self.original_data_tensors], device=self.device)
+        clip_starts = torch.cumsum(clip_lengths, dim=0) - clip_lengths
+
+        data_time_length = self.data_time_length.to(device=self.device, dtype=torch.float64)
+        data_length = self.data_length.to(device=self.device, dtype=torch.int64)
+        # 每个片段的插值帧数，即满足 k * env_step_duration < data_time_length 的k的个数
+        num_samples = torch.ceil(data_time_length / self.env_step_duration).to(torch.int64)
+        sample_ends = torch.cumsum(num_samples, dim=0)
+        sample_idx = torch.arange(int(sample_ends[-1]), device=self.device)
+        clip_idx = torch.searchsorted(sample_ends, sample_idx, right=True)
+        local_idx = sample_idx - (sample_ends - num_samples)[clip_idx]
+
+        # 计算 idx_low 和 idx_high
+        interpolation_time = local_idx.to(torch.float64) * self.env_step_duration
+        percentage = interpolation_time / data_time_length[clip_idx]
+        frame_pos = percentage * data_length[clip_idx]
+        idx_low = torch.floor(frame_pos).to(torch.int64)
+        idx_high = torch.ceil(frame_pos).to(torch.int64)
+        blend = (frame_pos - idx_low).unsqueeze(-1)
+        frame_stats = original_data[clip_starts[clip_idx] + idx_low]
+        frame_ends = original_data[clip_starts[clip_idx] + idx_high]
+
+        intermidate_data = self.slerp(frame_stats, frame_ends, blend).to(original_data.dtype)
+        if 'root_quat' in self.cumulative_indices:
+            start, end = self.cumulative_indices['root_quat']
+            intermidate_data[:, start:end] = self.quaternion_slerp(frame_stats[:, start:end], frame_ends[:, start:end], blend)
+
+        self.frames = intermidate_data
+        self.build_frame_index(num_samples)
+        print(f"Converted {len(self.data_tensors)} motions, {intermidate_data.shape[0]} frames.")
+
+    def build_frame_index(self, clip_num_frames: torch.Tensor):
+        """
+        根据每个片段的帧数建立frames的片段偏移表，并把data_tensors设置为frames上的视图。
+
+        args:
+        clip_num_frames: [片段数] 每个片段插值后的帧数
         """
-        for original_data_tensor,data_time_length,data_length,name in zip(self.original_data_tensors,self.data_time_length,self.data_length,self.data_names):
-            # 创建一个列表来存储插值时间
-            interpolation_time_list = []
-            interpolation_time = 0
-            
-            while interpolation_time < data_time_length:
-                # 将所有插值的时间点添加到插值时间列表中
-                interpolation_time_list.append(interpolation_time)
-                interpolation_time += self.env_step_duration
-                
-            interpolation_time_tensor = torch.tensor(interpolation_time_list,dtype=torch.float64,device=self.device)
-            intermidate_data = torch.zeros((len(interpolation_time_tensor),original_data_tensor.shape[1]),device=self.device)
-            # 计算 idx_low 和 idx_high
-            percentage = interpolation_time_tensor / data_time_length
-            #(data_length-1) 是为了确保idx_low和idx_high的范围都在0到data_length-1之间,索引值不能超过data_length-1
-            idx_low = torch.floor(percentage *data_length).to(torch.int64)
-            idx_high = torch.ceil(percentage * data_length).to(torch.int64)    
-            frame_stats = original_data_tensor[idx_low,:]
-            frame_ends = original_data_tensor[idx_high,:]
-            blend = (percentage * data_length - idx_low).clone().detach().unsqueeze(-1).to(self.device)
-           
-            for key, (start,end) in self.cumulative_indices.items():
-                if key == 'root_quat':
-                    interpolatec_quat = self.quaternion_slerp(frame_stats[:,start:end],frame_ends[:,start:end],blend)
-                    intermidate_data[:,start:end] = interpolatec_quat
-                else:
-                    interpolatec_element = self.slerp(frame_stats[:,start:end],frame_ends[:,start:end],blend)
-                    intermidate_data[:,start:end] = interpolatec_element
-            print(f"Converted : {name}.")
-            self.data_tensors.append(intermidate_data)           
+        self.clip_num_frames = clip_num_frames.to(device=self.device, dtype=torch.int64)
+        self.clip_offsets = torch.cumsum(self.clip_num_frames, dim=0) - self.clip_num_frames
+        self.data_tensors = list(torch.split(self.frames, self.clip_num_frames.tolist(), dim=0))
 
     def interpole_frame_at_time(self,interpolation_time,):
         #TODO
@@ -297,6 +377,90 @@ class MotionData_Base:
         读取数据tensor，返回一个frame
         """
         return self.data_tensors[motion_id][frame_num]   
+
+    def frame_indices(self, motion_ids: torch.Tensor, frame_idx: torch.Tensor) -> torch.Tensor:
+        """
+        把(片段, 帧)转换为frames中的行号，超出片段范围的帧被截断到片段的首帧或末帧。
+
+        :param motion_ids: 片段索引，任意形状
+        :param frame_idx: 片段内的帧索引，可以是浮点数（向下取整），形状与motion_ids可广播
+        :return: frames中的行号
+        """
+        motion_ids = motion_ids.to(dtype=torch.int64)
+        frame_idx = frame_idx.to(dtype=torch.int64)
+        frame_idx = torch.minimum(frame_idx.clamp(min=0), self.clip_num_frames[motion_ids] - 1)
+        return self.clip_offsets[motion_ids] + frame_idx
+
+    def get_frame_batch(self, motion_ids: torch.Tensor, frame_idx: torch.Tensor) -> torch.Tensor:
+        """
+        批量读取帧，无论环境数量多少都只做一次gather。
+
+        :param motion_ids: [N] 片段索引
+        :param frame_idx: [N] 片段内的帧索引
+        :return: [N, 帧维度] 的帧，是frames的拷贝，可以直接原地修改
+        """
+        return self.frames[self.frame_indices(motion_ids, frame_idx)]
+
+    def sample_motion_ids(self, n: int) -> torch.Tensor:
+        """
+        按照data_weights采样n个片段索引，没有权重时均匀采样。
+        """
+        if isinstance(self.data_weights, torch.Tensor) and self.data_weights.numel() > 0:
+            return torch.multinomial(self.data_weights, n, replacement=True)
+        return torch.randint(len(self.data_tensors), (n,), device=self.device)
+
+    def get_random_frame_batch(self, n: int):
+        """
+        随机采样n个片段和片段内的帧，用于环境重置。
+
+        :param n: 采样数量
+        :return: frames [n, 帧维度] 采样到的帧
+                 motion_ids [n] 片段索引
+                 frame_idx [n] 片段内的帧索引
+                 max_frame_idx [n] 片段的最后一帧的索引
+        """
+        motion_ids = self.sample_motion_ids(n)
+        max_frame_idx = self.clip_num_frames[motion_ids] - 1
+        frame_idx = (torch.rand(n, device=self.device) * max_frame_idx).to(dtype=torch.int64)
+        return self.frames[self.clip_offsets[motion_ids] + frame_idx], motion_ids, frame_idx, max_frame_idx
+
+    def get_frame_window(self, motion_ids: torch.Tensor, frame_idx: torch.Tensor, frame_offsets: torch.Tensor) -> torch.Tensor:
+        """
+        读取每个环境从frame_idx开始、偏移为frame_offsets的一组帧，只做一次gather。
+
+        :param motion_ids: [N] 片段索引
+        :param frame_idx: [N] 片段内的帧索引
+        :param frame_offsets: [W] 相对frame_idx的帧偏移
+        :return: [N, W, 帧维度]
+        """
+        frame_idx = frame_idx.to(dtype=torch.int64).unsqueeze(-1) + frame_offsets.to(device=self.device, dtype=torch.int64)
+        return self.frames[self.frame_indices(motion_ids.unsqueeze(-1), frame_idx)]
+
+    def timelist_offsets(self, time_list=None) -> torch.Tensor:
+        """
+        把时间偏移列表（秒）转换为帧偏移。
+
+        :param time_list: 时间偏移列表（秒），默认使用self.time_list
+        :return: [len(time_list)] 帧偏移
+        """
+        if time_list is None:
+            time_list = self.time_list
+        return torch.round(torch.tensor(time_list, dtype=torch.float64) / self.env_step_duration)
+
+    def get_frame_batch_by_timelist(self, motion_ids: torch.Tensor, frame_idx: torch.Tensor, state: torch.Tensor = None, time_list=None) -> torch.Tensor:
+        """
+        读取未来time_list秒处的参考帧并展平，用作观测。
+
+        :param motion_ids: [N] 片段索引
+        :param frame_idx: [N] 片段内的帧索引
+        :param state: [N, S] 机器人状态，给定时从每一帧的前S维中减去
+        :param time_list: 时间偏移列表（秒），默认使用self.time_list
+        :return: [N, len(time_list) * 帧维度]
+        """
+        frames = self.get_frame_window(motion_ids, frame_idx, self.timelist_offsets(time_list))
+        if state is not None:
+            frames[..., : state.shape[-1]] -= state.unsqueeze(1)
+        return frames.flatten(1)
      
     def get_tensors(self):
         """
@@ -7,8 +7,18 @@ class AmpMotion(MotionData_Base):
                  datatype="isaaclab",
                  file_type="txt",
                  data_spaces = None,
-                 env_step_duration = 0.005,**kwargs):
+                 env_step_duration = 0.005,
+                 prefetch = False,**kwargs):
+        """
+        prefetch: bool 预取模式。每次 feed_forward_generator 返回当前更新的数据后，立即在另一个 CUDA stream 上
+                       采样下一次更新的数据，判别器更新时不需要等待采样
+        """
         super().__init__(data_dir,datatype,file_type,data_spaces,env_step_duration,**kwargs)
+        self.prefetch = prefetch
+        self._sample_blocks = [None, None]#双缓冲的采样块，预取模式下交替使用
+        self._current_block = 0
+        self._prefetch_stream = torch.cuda.Stream(device=self.device) if prefetch and self.device.type == "cuda" else None
+        self._prefetch_event = None
         self.prepare_amp_state_trans()
     
     def prepare_amp_state_trans(self):
@@ -57,9 +67,10 @@ class AmpMotion(MotionData_Base):
             self.amp_state.append(s)
             self.amp_state_next.append(s_next)
 
-        # 合并 amp_state 和 amp_state_next 列表为二维张量
-        self.amp_state = torch.cat(self.amp_state, dim=0)
-        self.amp_state_next = torch.cat(self.amp_state_next, dim=0)
+        # 把 s 和 s_next 交错存放在一个 [行数, 2, 维度] 的张量中，一次 index_select 即可取出整个状态转移
+        self.amp_transitions = torch.stack([torch.cat(self.amp_state, dim=0), torch.cat(self.amp_state_next, dim=0)], dim=1)
+        self.amp_state = self.amp_transitions[:, 0]
+        self.amp_state_next = self.amp_transitions[:, 1]
 
         # 将 start_end_indices 转换为张量
         self.start_end_indices = torch.tensor(start_end_indices, dtype=torch.int64, device=self.device)
@@ -67,27 +78,69 @@ class AmpMotion(MotionData_Base):
         # 计算 max_row_sizes
         self.max_row_sizes = self.start_end_indices[:, 1] - self.start_end_indices[:, 0]
         self.amp_obs_num = self.amp_state.shape[1]
+
+        # 每一行的采样概率为 片段权重 / 片段行数，与“先按权重选片段，再在片段内均匀选行”的分布相同。
+        # 预先计算累计权重，采样时只需要一次 rand 和一次 searchsorted
+        row_weights = torch.repeat_interleave(
+            self.data_weights.to(torch.float64) / self.max_row_sizes.clamp(min=1), self.max_row_sizes
+        )
+        self.amp_row_cdf = torch.cumsum(row_weights, dim=0)
+
+    def sample_transition_rows(self, num_samples, out=None):
+        """
+        按片段权重采样 num_samples 个状态转移在 amp_transitions 中的行号。
+        """
+        u = torch.rand(num_samples, device=self.device, dtype=torch.float64) * self.amp_row_cdf[-1]
+        rows = torch.searchsorted(self.amp_row_cdf, u, right=True, out=out)
+        # 浮点误差可能让 u 恰好等于最后一个累计值
+        return rows.clamp_(max=self.amp_row_cdf.shape[0] - 1)
+
+    def _fill_sample_block(self, block_id, num_samples):
+        block = self._sample_blocks[block_id]
+        shape = (num_samples, 2, self.amp_obs_num)
+        if block is None or block[0].shape != shape:
+            block = (
+                torch.empty(shape, dtype=self.amp_transitions.dtype, device=self.device),
+                torch.empty(num_samples, dtype=torch.int64, device=self.device),
+            )
+            self._sample_blocks[block_id] = block
+        rows = self.sample_transition_rows(num_samples, out=block[1])
+        torch.index_select(self.amp_transitions, 0, rows, out=block[0])
+        return block[0]
+
+    def _launch_prefetch(self, block_id, num_samples):
+        if self._prefetch_stream is None:
+            self._fill_sample_block(block_id, num_samples)
+            return
+        # 预取写入的缓冲区可能还在被上一次更新读取，需要先等待默认 stream
+        self._prefetch_stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(self._prefetch_stream):
+            self._fill_sample_block(block_id, num_samples)
+            self._prefetch_event = torch.cuda.Event()
+            self._prefetch_event.record(self._prefetch_stream)
+
     def feed_forward_generator(self, num_mini_batch, mini_batch_size):
-        for _ in range(num_mini_batch):
-            
-            # 根据权重进行抽样
-            indices = torch.multinomial(self.data_weights, mini_batch_size, replacement=True)
-            
-            # 生成所有需要的 row_idx
-            row_indices = torch.rand(mini_batch_size, device=self.device) * self.max_row_sizes[indices]
-            row_indices = row_indices.long() 
-            
-            # 获取每个样本的起始和结束行索引
-            start_indices = self.start_end_indices[indices][:, 0]
-            
-            # 计算实际的行索引
-            actual_row_indices = start_indices + row_indices
-            
-            # 使用切片获取所需的行
-            s = self.amp_state[actual_row_indices]
-            s_next = self.amp_state_next[actual_row_indices]
+        """
+        一次性采样整个更新所需的专家状态转移，逐个返回 mini-batch 的 (s, s_next) 视图。
+        返回的张量在下一次（预取模式下为下下次）调用本函数前有效。
+        """
+        num_samples = num_mini_batch * mini_batch_size
+        block_id = self._current_block
+        prefetched = self._sample_blocks[block_id]
+        if self.prefetch and prefetched is not None and prefetched[0].shape[0] == num_samples:
+            if self._prefetch_event is not None:
+                torch.cuda.current_stream(self.device).wait_event(self._prefetch_event)
+            block = prefetched[0]
+        else:
+            block = self._fill_sample_block(block_id, num_samples)
+        if self.prefetch:
+            # 在另一个缓冲区中为下一次更新采样
+            self._current_block = 1 - block_id
+            self._launch_prefetch(self._current_block, num_samples)
 
-            yield s, s_next
+        for i in range(num_mini_batch):
+            batch = block[i * mini_batch_size : (i + 1) * mini_batch_size]
+            yield batch[:, 0], batch[:, 1]
 
 class VQVAEMotion(MotionData_Base):
     def __init__(self, 
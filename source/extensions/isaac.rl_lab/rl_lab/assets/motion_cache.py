@@ -0,0 +1,97 @@
+"""
+运动数据集的二进制缓存。
+
+MotionData_Base 每次启动都要逐个 json.load 原始 txt 文件并重新插值，这里把插值后的结果
+编译成一个连续的 float32 帧数组 (frames.npy) 和一个索引文件 (index.npz)：
+
+    frames.npy : [总帧数, 帧维度] float32，所有动作片段按顺序首尾相接
+    index.npz  : offsets          [片段数 + 1] int64，片段 i 占据 frames[offsets[i]:offsets[i+1]]
+                 data_names       [片段数] 片段对应的源文件名
+                 data_length      [片段数] int64，原始数据的可索引帧数
+                 frame_duration   [片段数] float32，原始数据的帧间隔
+                 data_time_length [片段数] float32，片段时长
+                 data_weights     [片段数] float32，归一化后的片段权重
+
+缓存目录以源文件内容、数据布局和 env_step_duration 的哈希命名，任何一项变化都会生成新的缓存。
+读取时 frames.npy 以 copy-on-write 的方式内存映射，同一台机器上的多个训练进程共享同一份物理页。
+"""
+
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+CACHE_VERSION = 2
+"""缓存格式版本，修改缓存内容或插值算法时需要递增。"""
+
+FRAMES_FILE = "frames.npy"
+INDEX_FILE = "index.npz"
+
+
+def list_source_files(data_dir: str, file_type: str) -> list[str]:
+    """返回数据目录下所有指定类型的源文件名（已排序）。"""
+    return sorted(f for f in os.listdir(data_dir) if f.endswith("." + file_type))
+
+
+def compute_dataset_hash(data_dir: str, file_names: list[str], cumulative_indices: dict, env_step_duration: float) -> str:
+    """
+    计算数据集的内容哈希。
+
+    args:
+    data_dir: str 数据目录
+    file_names: list 参与哈希的源文件名
+    cumulative_indices: dict 每个数据字段在帧中的 (start, end)
+    env_step_duration: float 插值使用的环境步长
+    """
+    sha = hashlib.sha1()
+    sha.update(f"v{CACHE_VERSION}".encode())
+    sha.update(repr(sorted(cumulative_indices.items())).encode())
+    sha.update(repr(float(env_step_duration)).encode())
+    for file_name in file_names:
+        sha.update(file_name.encode())
+        with open(os.path.join(data_dir, file_name), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def load_motion_cache(cache_path: str) -> dict | None:
+    """
+    读取编译好的缓存。缓存不存在或不完整时返回 None。
+
+    frames 以 mmap_mode="c" 打开：只读取被访问到的页，并且写入不会影响磁盘上的文件。
+    """
+    frames_file = os.path.join(cache_path, FRAMES_FILE)
+    index_file = os.path.join(cache_path, INDEX_FILE)
+    if not (os.path.isfile(frames_file) and os.path.isfile(index_file)):
+        return None
+    cache = {"frames": np.load(frames_file, mmap_mode="c")}
+    with np.load(index_file) as index:
+        for key in index.files:
+            cache[key] = index[key]
+    return cache
+
+
+def save_motion_cache(cache_path: str, frames: np.ndarray, offsets: np.ndarray, **index_arrays) -> None:
+    """
+    把插值后的数据写入缓存目录。
+
+    先写到临时目录再重命名，多个进程同时编译同一个数据集时，只有第一个完成的会被保留，
+    其余进程的结果被丢弃，读取方永远不会看到写了一半的文件。
+    """
+    parent = os.path.dirname(cache_path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    try:
+        np.save(os.path.join(tmp_path, FRAMES_FILE), np.ascontiguousarray(frames, dtype=np.float32))
+        np.savez(os.path.join(tmp_path, INDEX_FILE), offsets=offsets.astype(np.int64), **index_arrays)
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # 另一个进程已经写好了同一个缓存
+        if not os.path.isdir(cache_path):
+            raise
+    finally:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
@@ -19,7 +19,7 @@ import time
 import numpy as np
 from pyquaternion import Quaternion
 
-from kinematics import build_serial_chain_from_urdf
+from rl_lab.rsl_rl.utils.kinematics import CompiledSerialChains, build_serial_chain_from_urdf
 
 import pose3d
 from pybullet_utils import transformations
@@ -69,6 +69,8 @@ chain_foot_rl = build_serial_chain_from_urdf(
 chain_foot_rr = build_serial_chain_from_urdf(
     open(config.URDF_FILENAME, 'rb').read(), config.HR_FOOT_NAME
 )
+# 四条腿的足端位置一次批量计算
+chain_feet = CompiledSerialChains([chain_foot_fl, chain_foot_fr, chain_foot_rl, chain_foot_rr])
 
 
 def build_markers(num_markers):
@@ -358,23 +360,7 @@ def retarget_pose(robot, default_pose, ref_joint_pos):
     joint_pose = np.array(joint_pose)
     # print(joint_pose)
 
-    tar_toe_pos_local = np.squeeze(
-        np.concatenate(
-            [
-                chain_foot_fl.forward_kinematics(joint_pose[:3]).get_matrix()[:, :3, 3],
-                chain_foot_fr.forward_kinematics(joint_pose[3:6]).get_matrix()[
-                    :, :3, 3
-                ],
-                chain_foot_rl.forward_kinematics(joint_pose[6:9]).get_matrix()[
-                    :, :3, 3
-                ],
-                chain_foot_rr.forward_kinematics(joint_pose[9:12]).get_matrix()[
-                    :, :3, 3
-                ],
-            ],
-            axis=-1,
-        )
-    )
+    tar_toe_pos_local = chain_feet.end_positions(joint_pose).reshape(-1).numpy()
 
     pose = np.concatenate([root_pos, root_rot, joint_pose, tar_toe_pos_local])
 
@@ -0,0 +1,413 @@
+"""Retarget motions from keypoint (.txt) files, a whole clip at a time.
+
+Headless counterpart of retarget_kp_motions.py that needs neither pybullet nor the simulator:
+- the root poses of all the frames are computed together from the keypoints,
+- every leg is solved with the closed-form hip-roll / hip-pitch / knee IK and clipped to the URDF joint limits,
+- the velocities are finite differences over the whole clip.
+The output files have the same layout as the ones of retarget_kp_motions.py and are loaded by MotionData_Base.
+
+    python source/extensions/isaac.rl_lab/rl_lab/datasets_retarget/retarget_kp_motions_batch.py
+"""
+import argparse
+import os
+
+import numpy as np
+import torch
+
+from rl_lab.rsl_rl.utils.kinematics import CompiledSerialChains, build_serial_chain_from_urdf
+from rl_lab.rsl_rl.utils.kinematics.urdf_parser_py.urdf import URDF
+
+import retarget_configgo2 as config
+
+POS_SIZE = 3
+ROT_SIZE = 4
+JOINT_POS_SIZE = 12
+TAR_TOE_POS_LOCAL_SIZE = 12
+LINEAR_VEL_SIZE = 3
+ANGULAR_VEL_SIZE = 3
+JOINT_VEL_SIZE = 12
+TAR_TOE_VEL_LOCAL_SIZE = 12
+
+# reference motion, same as retarget_kp_motions.py
+FRAME_DURATION = 0.01677
+REF_POS_OFFSET = np.array([0, 0, 0])
+
+REF_PELVIS_JOINT_ID = 0
+REF_NECK_JOINT_ID = 3
+
+# FR FL RR RL, same order as config.SIM_HIP_JOINT_IDS and config.SIM_TOE_OFFSET_LOCAL
+REF_TOE_JOINT_IDS = [10, 15, 19, 23]
+REF_HIP_JOINT_IDS = [6, 11, 16, 20]
+REF_FOOT_NAMES = [config.FR_FOOT_NAME, config.FL_FOOT_NAME, config.HR_FOOT_NAME, config.HL_FOOT_NAME]
+# FL FR RL RR, the order of the joints in the output frames
+SIM_FOOT_NAMES = [config.FL_FOOT_NAME, config.FR_FOOT_NAME, config.HL_FOOT_NAME, config.HR_FOOT_NAME]
+
+
+def quat_mul(q0, q1):
+    """ Hamilton product of (..., 4) quaternions in (x, y, z, w) order. """
+    x0, y0, z0, w0 = np.moveaxis(q0, -1, 0)
+    x1, y1, z1, w1 = np.moveaxis(q1, -1, 0)
+    return np.stack(
+        [
+            w0 * x1 + x0 * w1 + y0 * z1 - z0 * y1,
+            w0 * y1 - x0 * z1 + y0 * w1 + z0 * x1,
+            w0 * z1 + x0 * y1 - y0 * x1 + z0 * w1,
+            w0 * w1 - x0 * x1 - y0 * y1 - z0 * z1,
+        ],
+        axis=-1,
+    )
+
+
+def quat_conjugate(q):
+    return np.concatenate([-q[..., :3], q[..., 3:]], axis=-1)
+
+
+def quat_rotate(q, v):
+    """ Rotate (..., 3) points by (..., 4) unit quaternions. """
+    xyz, w = q[..., :3], q[..., 3:]
+    t = 2.0 * np.cross(xyz, v)
+    return v + w * t + np.cross(xyz, t)
+
+
+def quat_about_axis(angle, axis):
+    axis = np.asarray(axis, dtype=np.float64)
+    return np.concatenate([np.sin(0.5 * angle) * axis / np.linalg.norm(axis), [np.cos(0.5 * angle)]])
+
+
+def quat_to_matrix(q):
+    """ (..., 4) unit quaternions to (..., 3, 3) rotation matrices. """
+    x, y, z, w = np.moveaxis(q, -1, 0)
+    return np.stack(
+        [
+            np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+            np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+            np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+        ],
+        axis=-2,
+    )
+
+
+def quat_from_matrix(m):
+    """ (..., 3, 3) rotation matrices to (..., 4) unit quaternions, from the largest of w, x, y, z. """
+    m00, m11, m22 = m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]
+    # 四个候选分母，取最大的一个保证数值稳定
+    candidates = np.stack(
+        [
+            np.stack([1 + m00 - m11 - m22, m[..., 0, 1] + m[..., 1, 0], m[..., 0, 2] + m[..., 2, 0],
+                      m[..., 2, 1] - m[..., 1, 2]], axis=-1),
+            np.stack([m[..., 0, 1] + m[..., 1, 0], 1 - m00 + m11 - m22, m[..., 1, 2] + m[..., 2, 1],
+                      m[..., 0, 2] - m[..., 2, 0]], axis=-1),
+            np.stack([m[..., 0, 2] + m[..., 2, 0], m[..., 1, 2] + m[..., 2, 1], 1 - m00 - m11 + m22,
+                      m[..., 1, 0] - m[..., 0, 1]], axis=-1),
+            np.stack([m[..., 2, 1] - m[..., 1, 2], m[..., 0, 2] - m[..., 2, 0], m[..., 1, 0] - m[..., 0, 1],
+                      1 + m00 + m11 + m22], axis=-1),
+        ],
+        axis=-2,
+    )
+    best = np.argmax(np.stack([m00 - m11 - m22, m11 - m00 - m22, m22 - m00 - m11, m00 + m11 + m22], axis=-1), axis=-1)
+    q = np.take_along_axis(candidates, best[..., None, None], axis=-2)[..., 0, :]
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+# 与 retarget_kp_motions.py 中 pybullet_utils.transformations 给出的旋转相同
+REF_COORD_ROT = quat_about_axis(0.5 * np.pi, [1, 0, 0])  # 坐标系变换
+REF_ROOT_ROT = quat_about_axis(0.47 * np.pi, [0, 0, 1])
+
+
+class LegIK(object):
+    """Closed-form inverse kinematics of the legs of a quadruped.
+
+    Every leg is a hip roll joint about x, followed by a hip pitch and a knee joint about y, with the thigh
+    joint offset sideways from the hip and the knee and the foot straight below the previous joint, which is the
+    layout of the Unitree legs. The geometry and the joint limits are read from the URDF.
+
+    Args:
+        urdf_filename: The URDF of the robot.
+        foot_names: The foot links, one per leg, in the order of the legs in the joint vector.
+    """
+
+    def __init__(self, urdf_filename, foot_names):
+        data = open(urdf_filename, "rb").read()
+        robot = URDF.from_xml_string(data)
+        self.chain_feet = CompiledSerialChains(
+            [build_serial_chain_from_urdf(data, name) for name in foot_names], dtype=torch.float64
+        )
+        joint_offsets = self.chain_feet.joint_offsets.numpy()
+        end_offsets = self.chain_feet.end_offsets.numpy()
+        if self.chain_feet.num_joints != 3 or not np.allclose(
+            self.chain_feet.joint_axes.numpy(), np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 1.0, 0.0]])
+        ):
+            raise ValueError("Every leg must have a hip roll joint about x and two pitch joints about y.")
+        if not np.allclose(joint_offsets[..., :3, :3], np.eye(3)) or not np.allclose(end_offsets[..., :3, :3], np.eye(3)):
+            raise ValueError("The joint frames of the legs must not be rotated.")
+        if not np.allclose(joint_offsets[:, 1, [0, 2], 3], 0.0) or not np.allclose(
+            joint_offsets[:, 2, :2, 3], 0.0
+        ) or not np.allclose(end_offsets[:, :2, 3], 0.0):
+            raise ValueError("The thigh joint must be offset sideways, the knee and the foot straight below.")
+
+        self.hip_pos = joint_offsets[:, 0, :3, 3]  # 髋关节在base坐标系中的位置
+        self.hip_width = joint_offsets[:, 1, 1, 3]
+        self.thigh_length = -joint_offsets[:, 2, 2, 3]
+        self.calf_length = -end_offsets[:, 2, 3]
+
+        joints = dict((j.name, j) for j in robot.joints)
+        limits = np.array([[(joints[n].limit.lower, joints[n].limit.upper) for n in names]
+                           for names in self.chain_feet.joint_names])
+        self.joint_lim_low = limits[..., 0]
+        self.joint_lim_high = limits[..., 1]
+
+        # pybullet 中 base 的位置是其惯性坐标系的原点
+        inertial = robot.link_map[robot.get_root()].inertial
+        self.base_com_offset = np.zeros(3) if inertial is None or inertial.origin is None else np.array(
+            inertial.origin.xyz
+        )
+
+    def base_link_pos(self, root_pos, root_rot):
+        """ Origin of the base link frame, (N, 3), from the position of the base center of mass. """
+        return root_pos - quat_rotate(root_rot, self.base_com_offset)
+
+    def hip_pos_world(self, root_pos, root_rot):
+        """ Hip positions of the legs in the world frame, (N, num_legs, 3). """
+        base_pos = self.base_link_pos(root_pos, root_rot)
+        return base_pos[:, None] + quat_rotate(root_rot[:, None], self.hip_pos)
+
+    def solve(self, foot_pos):
+        """
+        Joint positions that put the feet at the given positions in the base link frame.
+
+        The knees bend backwards. Unreachable targets are projected to the nearest reachable direction and the
+        joints are clipped to their limits, the pitch joints being solved after the hip roll is clipped.
+
+        Args:
+            foot_pos: Target foot positions in the base link frame, (N, num_legs, 3).
+
+        Returns:
+            Joint positions, (N, num_legs * 3).
+        """
+        x, y, z = np.moveaxis(foot_pos - self.hip_pos, -1, 0)
+        d = self.hip_width
+        # hip roll: the foot seen in the y-z plane is the thigh offset (d, h) rotated by the hip angle
+        h = -np.sqrt(np.maximum(y * y + z * z - d * d, 0.0))
+        q_hip = np.arctan2(d * z - h * y, d * y + h * z)
+        q_hip = np.clip(q_hip, self.joint_lim_low[:, 0], self.joint_lim_high[:, 0])
+        h = -np.sin(q_hip) * y + np.cos(q_hip) * z
+
+        # hip pitch and knee: planar two-link leg in the x-h plane of the thigh
+        l1, l2 = self.thigh_length, self.calf_length
+        cos_knee = (x * x + h * h - l1 * l1 - l2 * l2) / (2 * l1 * l2)
+        q_knee = -np.arccos(np.clip(cos_knee, -1.0, 1.0))
+        q_knee = np.clip(q_knee, self.joint_lim_low[:, 2], self.joint_lim_high[:, 2])
+        q_thigh = np.arctan2(-x, -h) - np.arctan2(l2 * np.sin(q_knee), l1 + l2 * np.cos(q_knee))
+        q_thigh = np.clip(q_thigh, self.joint_lim_low[:, 1], self.joint_lim_high[:, 1])
+
+        return np.stack([q_hip, q_thigh, q_knee], axis=-1).reshape(foot_pos.shape[0], -1)
+
+    def foot_positions(self, joint_pose):
+        """ Foot positions in the base link frame, (N, num_legs * 3). """
+        return self.chain_feet.end_positions(torch.from_numpy(joint_pose)).reshape(joint_pose.shape[0], -1).numpy()
+
+
+def process_ref_joint_pos_data(joint_pos):
+    """ Keypoints of all the frames, (N, num_keypoints, 3), to the robot world frame. """
+    proc_pos = quat_rotate(REF_COORD_ROT, joint_pos)
+    proc_pos = quat_rotate(REF_ROOT_ROT, proc_pos)
+    return proc_pos * config.REF_POS_SCALE + REF_POS_OFFSET
+
+
+def calc_heading(q):
+    rot_dir = quat_rotate(q, np.array([1.0, 0.0, 0.0]))
+    return np.arctan2(rot_dir[..., 1], rot_dir[..., 0])
+
+
+def retarget_root_pose(ref_joint_pos):
+    """ Root positions (N, 3) and rotations (N, 4) of all the frames. """
+    pelvis_pos = ref_joint_pos[:, REF_PELVIS_JOINT_ID]
+    neck_pos = ref_joint_pos[:, REF_NECK_JOINT_ID]
+
+    left_shoulder_pos = ref_joint_pos[:, REF_HIP_JOINT_IDS[0]]
+    right_shoulder_pos = ref_joint_pos[:, REF_HIP_JOINT_IDS[1]]
+    left_hip_pos = ref_joint_pos[:, REF_HIP_JOINT_IDS[2]]
+    right_hip_pos = ref_joint_pos[:, REF_HIP_JOINT_IDS[3]]
+
+    forward_dir = neck_pos - pelvis_pos
+    forward_dir = forward_dir + config.FORWARD_DIR_OFFSET
+    forward_dir = forward_dir / np.linalg.norm(forward_dir, axis=-1, keepdims=True)
+
+    delta_shoulder = left_shoulder_pos - right_shoulder_pos
+    delta_hip = left_hip_pos - right_hip_pos
+    dir_shoulder = delta_shoulder / np.linalg.norm(delta_shoulder, axis=-1, keepdims=True)
+    dir_hip = delta_hip / np.linalg.norm(delta_hip, axis=-1, keepdims=True)
+
+    left_dir = 0.5 * (dir_shoulder + dir_hip)
+
+    up_dir = np.cross(forward_dir, left_dir)
+    up_dir = up_dir / np.linalg.norm(up_dir, axis=-1, keepdims=True)
+
+    left_dir = np.cross(up_dir, forward_dir)
+    left_dir[:, 2] = 0.0  # make the base more stable
+    left_dir = left_dir / np.linalg.norm(left_dir, axis=-1, keepdims=True)
+
+    rot_mat = np.stack([forward_dir, left_dir, up_dir], axis=-1)
+
+    root_pos = 0.5 * (pelvis_pos + neck_pos)
+    root_rot = quat_mul(quat_from_matrix(rot_mat), config.INIT_ROT)
+    root_rot = root_rot / np.linalg.norm(root_rot, axis=-1, keepdims=True)
+
+    return root_pos, root_rot
+
+
+def retarget_pose(leg_ik, ref_joint_pos):
+    """
+    Robot poses of all the frames of a clip.
+
+    Args:
+        leg_ik: The IK of the legs in the order of SIM_FOOT_NAMES.
+        ref_joint_pos: Keypoints in the robot world frame, (N, num_keypoints, 3).
+
+    Returns:
+        Poses (N, 3 + 4 + 12 + 12): root position, root rotation, joint positions and foot positions in the base frame.
+    """
+    root_pos, root_rot = retarget_root_pose(ref_joint_pos)
+    root_pos = root_pos + config.SIM_ROOT_OFFSET
+
+    inv_init_rot = quat_conjugate(config.INIT_ROT)
+    heading = calc_heading(quat_mul(root_rot, inv_init_rot))
+    cos_heading, sin_heading = np.cos(heading)[:, None], np.sin(heading)[:, None]
+
+    # 按 REF_TOE_JOINT_IDS 的顺序取对应腿的髋关节
+    sim_leg_ids = [SIM_FOOT_NAMES.index(name) for name in REF_FOOT_NAMES]
+    sim_hip_pos = leg_ik.hip_pos_world(root_pos, root_rot)[:, sim_leg_ids]
+
+    ref_toe_pos = ref_joint_pos[:, REF_TOE_JOINT_IDS]
+    ref_hip_pos = ref_joint_pos[:, REF_HIP_JOINT_IDS]
+    toe_offset_local = np.array(config.SIM_TOE_OFFSET_LOCAL)
+    toe_offset_world = np.stack(
+        [
+            cos_heading * toe_offset_local[:, 0] - sin_heading * toe_offset_local[:, 1],
+            sin_heading * toe_offset_local[:, 0] + cos_heading * toe_offset_local[:, 1],
+            np.broadcast_to(toe_offset_local[:, 2], cos_heading.shape[:1] + toe_offset_local.shape[:1]),
+        ],
+        axis=-1,
+    )
+
+    tar_toe_pos = sim_hip_pos + ref_toe_pos - ref_hip_pos
+    tar_toe_pos[..., 2] = ref_toe_pos[..., 2]
+    tar_toe_pos += toe_offset_world
+
+    # 目标足端位置转换到base坐标系，并换回关节的腿顺序
+    tar_toe_pos_base = np.empty_like(tar_toe_pos)
+    tar_toe_pos_base[:, sim_leg_ids] = quat_rotate(
+        quat_conjugate(root_rot)[:, None], tar_toe_pos - leg_ik.base_link_pos(root_pos, root_rot)[:, None]
+    )
+    joint_pose = leg_ik.solve(tar_toe_pos_base)
+
+    tar_toe_pos_local = leg_ik.foot_positions(joint_pose)
+
+    return np.concatenate([root_pos, root_rot, joint_pose, tar_toe_pos_local], axis=-1)
+
+
+def retarget_motion(leg_ik, joint_pos_data):
+    """
+    Retarget a whole clip. Frame f uses frames f and f + 1 for the velocities, so N keypoint frames give N - 1 frames
+    with the layout of retarget_kp_motions.retarget_motion.
+    """
+    time_between_frames = FRAME_DURATION
+    poses = retarget_pose(leg_ik, joint_pos_data)
+
+    root_pos = poses[:, 0:POS_SIZE]
+    root_rot = poses[:, POS_SIZE : (POS_SIZE + ROT_SIZE)]
+    joint_pose = poses[:, (POS_SIZE + ROT_SIZE) : (POS_SIZE + ROT_SIZE + JOINT_POS_SIZE)]
+    tar_toe_pos_local = poses[:, (POS_SIZE + ROT_SIZE + JOINT_POS_SIZE) :]
+    curr_rot, next_rot = root_rot[:-1], root_rot[1:]
+
+    # Linear velocity in base frame.
+    del_linear_vel = np.diff(root_pos, axis=0) / time_between_frames
+    del_linear_vel = quat_rotate(quat_conjugate(curr_rot), del_linear_vel)
+
+    # Angular velocity in base frame, from the shortest rotation between consecutive frames.
+    diff_quat = quat_mul(next_rot, quat_conjugate(curr_rot))
+    diff_quat *= np.where(diff_quat[:, 3:] < 0.0, -1.0, 1.0)
+    sin_half_angle = np.linalg.norm(diff_quat[:, :3], axis=-1, keepdims=True)
+    angle = 2.0 * np.arctan2(sin_half_angle, diff_quat[:, 3:])
+    axis = np.where(sin_half_angle > 1e-12, diff_quat[:, :3] / np.maximum(sin_half_angle, 1e-12), [1.0, 0.0, 0.0])
+    del_angular_vel = axis * angle / time_between_frames
+    base_orientation_quat_from_init = quat_mul(quat_conjugate(config.INIT_ROT), curr_rot)
+    del_angular_vel = quat_rotate(quat_conjugate(base_orientation_quat_from_init), del_angular_vel)
+
+    joint_velocity = np.diff(joint_pose, axis=0) / time_between_frames
+    toe_velocity = np.diff(tar_toe_pos_local, axis=0) / time_between_frames
+
+    new_frames = np.concatenate(
+        [poses[:-1], del_linear_vel, del_angular_vel, joint_velocity, toe_velocity], axis=-1
+    )
+    new_frames[:, 0:2] -= new_frames[0, 0:2]
+
+    return new_frames
+
+
+def load_ref_data(JOINT_POS_FILENAME, FRAME_START, FRAME_END):
+    joint_pos_data = np.loadtxt(JOINT_POS_FILENAME, delimiter=",")
+
+    start_frame = 0 if (FRAME_START is None) else FRAME_START
+    end_frame = joint_pos_data.shape[0] if (FRAME_END is None) else FRAME_END
+    joint_pos_data = joint_pos_data[start_frame:end_frame]
+
+    return joint_pos_data
+
+
+def output_motion(frames, out_filename, motion_weight, frame_duration):
+    """ Same file as retarget_utils.output_motion, which needs pybullet to be imported. """
+    rows = ",".join("\n  [" + ", ".join("%.5f" % v for v in frame) + "]" for frame in frames)
+    with open(out_filename, "w") as f:
+        f.write("{\n")
+        f.write('"LoopMode": "Wrap",\n')
+        f.write('"FrameDuration": ' + str(frame_duration) + ",\n")
+        f.write('"EnableCycleOffsetPosition": true,\n')
+        f.write('"EnableCycleOffsetRotation": true,\n')
+        f.write('"MotionWeight": ' + str(motion_weight) + ",\n")
+        f.write("\n")
+        f.write('"Frames":\n')
+        f.write("[" + rows)
+        f.write("\n]")
+        f.write("\n}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retarget keypoint motions without pybullet.")
+    parser.add_argument("--urdf", type=str, default=config.URDF_FILENAME)
+    parser.add_argument("--output_dir", type=str, default=config.OUTPUT_DIR)
+    parser.add_argument("--motions", type=str, nargs="*", default=None, help="Names of the motions to retarget.")
+    args_cli = parser.parse_args()
+
+    output_dir = args_cli.output_dir
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    leg_ik = LegIK(args_cli.urdf, SIM_FOOT_NAMES)
+
+    for mocap_motion in config.MOCAP_MOTIONS:
+        if args_cli.motions and mocap_motion[0] not in args_cli.motions:
+            continue
+        print(f"Re-targeting {mocap_motion}")
+
+        joint_pos_data = load_ref_data(mocap_motion[1], mocap_motion[2], mocap_motion[3] + 1)
+
+        if "reverse" in mocap_motion[0]:
+            joint_pos_data = np.flip(joint_pos_data, axis=0)
+
+        # 每3个数构建一个关键点，并对所有帧一起做坐标变换
+        joint_pos_data = joint_pos_data.reshape(joint_pos_data.shape[0], -1, POS_SIZE)
+        joint_pos_data = process_ref_joint_pos_data(joint_pos_data)
+
+        # 调整足端位置，使每只脚的最低点在地面上，再抬高 TOE_HEIGHT_OFFSET
+        toe_height = joint_pos_data[:, REF_TOE_JOINT_IDS, -1]
+        joint_pos_data[:, REF_TOE_JOINT_IDS, -1] = toe_height - toe_height.min(axis=0) + config.TOE_HEIGHT_OFFSET
+
+        retarget_frames = retarget_motion(leg_ik, joint_pos_data)
+
+        output_file = os.path.join(output_dir, f"{mocap_motion[0]}.txt")
+        output_motion(retarget_frames, output_file, mocap_motion[4], FRAME_DURATION)
+
+
+if __name__ == "__main__":
+    main()
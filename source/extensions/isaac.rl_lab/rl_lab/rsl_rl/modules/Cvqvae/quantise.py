@@ -1,3 +1,4 @@
+import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -18,9 +19,16 @@ class VectorQuantiser(nn.Module):
     - anchor: 锚定采样方法 ('probrandom', 'random', 'closest')
     - first_batch: 如果为真，则使用模型的离线版本
     - contras_loss: 如果为真，则使用对比损失进一步提高性能
+    - chunk_size: 不需要完整距离矩阵时，每次计算距离的行数，None表示一次计算全部
+    - return_encodings: 如果为假，则不构建one-hot编码矩阵，返回值中的min_encodings为None
+    - reinit_interval: 每隔多少次训练前向重新初始化一次死代码
+    - reinit_threshold: embed_prob低于该值的代码被视为死代码，None表示使用CodebookReinitialiser的默认值
+    - reinit_max_codes: 每次重新初始化最多更新的代码数量，None表示使用CodebookReinitialiser的默认值
     """
     def __init__(self, num_embed, embed_dim, beta, distance='cos', 
-                 anchor='probrandom', first_batch=False, contras_loss=False):
+                 anchor='probrandom', first_batch=False, contras_loss=False,
+                 chunk_size=None, return_encodings=True, reinit_interval=1, reinit_threshold=None,
+                 reinit_max_codes=None):
         super().__init__()
         
         self.num_embed = num_embed  # 代码本大小
@@ -30,10 +38,15 @@ class VectorQuantiser(nn.Module):
         self.anchor = anchor  # 锚定采样方法
         self.first_batch = first_batch  # 是否为第一个批次
         self.contras_loss = contras_loss  # 是否使用对比损失
+        self.chunk_size = chunk_size  # 分块计算距离的行数
+        self.return_encodings = return_encodings  # 是否返回one-hot编码
         self.decay = 0.99  # 衰减率
         self.init = False  # 初始化标志
         
         self.pool = FeaturePool(self.num_embed, self.embed_dim)  # 特征池
+        self.reinit = CodebookReinitialiser(self.num_embed, anchor=self.anchor, decay=self.decay,
+                                            interval=reinit_interval, threshold=reinit_threshold, pool=self.pool,
+                                            max_codes=reinit_max_codes)
         self.embedding = nn.Embedding(self.num_embed, self.embed_dim)  # 嵌入层
         self.embedding.weight.data.uniform_(-1.0 / self.num_embed, 1.0 / self.num_embed)  # 初始化嵌入权重
         self.register_buffer("embed_prob", torch.zeros(self.num_embed))  # 注册缓冲区用于存储嵌入概率
@@ -47,78 +60,235 @@ class VectorQuantiser(nn.Module):
         #z = rearrange(z, 'b c h w -> b h w c').contiguous()
         z_flattened = z.view(-1, self.embed_dim)
         
-        # 计算距离
-        if self.distance == 'l2':
-            # L2距离计算
-            d = - torch.sum(z_flattened.detach() ** 2, dim=1, keepdim=True) - \
-                torch.sum(self.embedding.weight ** 2, dim=1) + \
-                2 * torch.einsum('bd, dn-> bn', z_flattened.detach(), rearrange(self.embedding.weight, 'n d-> d n'))
-        elif self.distance == 'cos':
-            # 余弦距离计算
-            normed_z_flattened = F.normalize(z_flattened, dim=1).detach()
-            normed_codebook = F.normalize(self.embedding.weight, dim=1)
-            d = torch.einsum('bd,dn->bn', normed_z_flattened, rearrange(normed_codebook, 'n d -> d n'))
-        
-        # 编码
-        sort_distance, indices = d.sort(dim=1)
-        encoding_indices = indices[:, -1]
-        encodings = torch.zeros(encoding_indices.unsqueeze(1).shape[0], self.num_embed, device=z.device)
-        encodings.scatter_(1, encoding_indices.unsqueeze(1), 1)
+        # 对比损失和这一次要运行的重新初始化需要完整的距离矩阵，只计算一次；其余情况分块计算最近的代码
+        reinit_now = self.training and self.anchor in self.reinit.anchor_samplers and (not self.init) \
+            and self.reinit.runs_next_call()
+        if self.training and (self.contras_loss or (reinit_now and self.reinit.needs_distance())):
+            d = code_distance(z_flattened, self.embedding.weight, self.distance)
+            encoding_indices = last_argmax(d)
+        else:
+            d = None
+            encoding_indices = nearest_code_indices(z_flattened, self.embedding.weight, self.distance, self.chunk_size)
         
-        # 量化并恢复形状
-        z_q = torch.matmul(encodings, self.embedding.weight).view(z.shape)
+        # 量化并恢复形状，按索引取代码向量代替one-hot矩阵乘法
+        z_q = F.embedding(encoding_indices, self.embedding.weight).view(z.shape)
         # 计算嵌入损失
         loss = self.beta * torch.mean((z_q.detach() - z) ** 2) + torch.mean((z_q - z.detach()) ** 2)
         # 保留梯度
         z_q = z + (z_q - z).detach()
-        # 恢复原始输入形状
-        #z_q = rearrange(z_q, 'b h w c -> b c h w').contiguous()
         
         # 统计
-        avg_probs = torch.mean(encodings, dim=0)
+        avg_probs = torch.bincount(encoding_indices, minlength=self.num_embed).float() / encoding_indices.numel()
         perplexity = torch.exp(-torch.sum(avg_probs * torch.log(avg_probs + 1e-10)))
-        min_encodings = encodings
+        if self.return_encodings:
+            min_encodings = torch.zeros(encoding_indices.shape[0], self.num_embed, device=z.device)
+            min_encodings.scatter_(1, encoding_indices.unsqueeze(1), 1)
+        else:
+            min_encodings = None
         
         # 在线聚类重新初始化未优化的点
         if self.training:
             # 计算代码条目的平均使用情况
             self.embed_prob.mul_(self.decay).add_(avg_probs, alpha=1 - self.decay)
-            # 运行平均更新
-            if self.anchor in ['closest', 'random', 'probrandom'] and (not self.init):
-                if self.anchor == 'closest':
-                    # 最近采样
-                    sort_distance, indices = d.sort(dim=0)
-                    random_feat = z_flattened.detach()[indices[-1, :]]
-                elif self.anchor == 'random':
-                    # 基于特征池的随机采样
-                    random_feat = self.pool.query(z_flattened.detach())
-                elif self.anchor == 'probrandom':
-                    # 基于概率的随机采样
-                    norm_distance = F.softmax(d.t(), dim=1)
-                    prob = torch.multinomial(norm_distance, num_samples=1).view(-1)
-                    random_feat = z_flattened.detach()[prob]
-                # 基于平均使用情况的衰减参数
-                decay = torch.exp(-(self.embed_prob * self.num_embed * 10) / (1 - self.decay) - 1e-3).unsqueeze(1).repeat(1, self.embed_dim)
-                self.embedding.weight.data = self.embedding.weight.data * (1 - decay) + random_feat * decay
-                if self.first_batch:
+            # 运行平均更新，只处理embed_prob低于阈值的代码
+            if self.anchor in self.reinit.anchor_samplers and (not self.init):
+                if self.reinit(self.embedding.weight.data, self.embed_prob, z_flattened.detach(), self.distance, d) and self.first_batch:
                     self.init = True
             
             # 对比损失
             if self.contras_loss:
-                sort_distance, indices = d.sort(dim=0)
-                dis_pos = sort_distance[-max(1, int(sort_distance.size(0) / self.num_embed)):, :].mean(dim=0, keepdim=True)
-                dis_neg = sort_distance[:int(sort_distance.size(0) * 1 / 2), :]
+                # 只需要每个代码最近的若干个和最远的一半特征，不需要完整排序；负样本的顺序不影响交叉熵
+                dis_pos = d.topk(max(1, int(d.size(0) / self.num_embed)), dim=0).values.mean(dim=0, keepdim=True)
+                dis_neg = d.topk(int(d.size(0) * 1 / 2), dim=0, largest=False, sorted=False).values
                 dis = torch.cat([dis_pos, dis_neg], dim=0).t() / 0.07
                 contra_loss = F.cross_entropy(dis, torch.zeros((dis.size(0),), dtype=torch.long, device=dis.device))
                 loss += contra_loss
         
         return z_q, loss, (perplexity, min_encodings, encoding_indices)
 
+def code_distance(z_flattened, codebook, distance):
+    """
+    计算特征与代码本之间的相似度，越大越接近。
+
+    参数:
+    - z_flattened: [B, embed_dim] 特征
+    - codebook: [num_embed, embed_dim] 代码本
+    - distance: 'l2' 或 'cos'
+
+    返回 [B, num_embed] 的相似度矩阵。
+    """
+    if distance == 'l2':
+        # L2距离计算
+        return - torch.sum(z_flattened.detach() ** 2, dim=1, keepdim=True) - \
+            torch.sum(codebook ** 2, dim=1) + \
+            2 * torch.einsum('bd, dn-> bn', z_flattened.detach(), rearrange(codebook, 'n d-> d n'))
+    elif distance == 'cos':
+        # 余弦距离计算
+        normed_z_flattened = F.normalize(z_flattened, dim=1).detach()
+        normed_codebook = F.normalize(codebook, dim=1)
+        return torch.einsum('bd,dn->bn', normed_z_flattened, rearrange(normed_codebook, 'n d -> d n'))
+    raise ValueError(f"Unknown distance: {distance}")
+
+
+def last_argmax(d, dim=1):
+    """
+    沿dim取最大值的索引，有多个最大值时取最后一个，与升序稳定排序后取最后一个元素的结果一致。
+    """
+    return d.size(dim) - 1 - d.flip(dim).argmax(dim=dim)
+
+
+def nearest_code_indices(z_flattened, codebook, distance, chunk_size=None):
+    """
+    逐块计算相似度并取最大值，峰值显存只有 chunk_size x num_embed。
+
+    注意：分块时矩阵乘法的规模不同，相似度可能在最后一位上与一次计算全部时不同，
+    只有在两个代码几乎同样接近时才会影响结果。chunk_size为None时与一次计算完全一致。
+    """
+    if chunk_size is None or z_flattened.size(0) <= chunk_size:
+        return last_argmax(code_distance(z_flattened, codebook, distance))
+    return torch.cat([
+        last_argmax(code_distance(z_chunk, codebook, distance))
+        for z_chunk in z_flattened.split(chunk_size, dim=0)
+    ])
+
+
+class CodebookReinitialiser:
+    """
+    在线聚类：把使用概率很低的"死"代码向锚点特征移动。
+
+    原实现在每次训练前向时对全部代码排序或采样，但衰减参数 exp(-embed_prob * num_embed * 10 / (1 - decay))
+    让绝大多数代码的更新量小到可以忽略。这里先用topk选出embed_prob最小的max_codes个代码，只为这些代码计算
+    锚点（相似度矩阵只取它们的列），再用index_copy_写回，其中embed_prob不低于阈值的代码保持不变；
+    并且可以每隔interval次才运行一次。选择的代码数量固定，更新没有依赖数据的Python分支，不需要和主机同步；
+    更新的代码数量也保存在设备上，只有调用stats()时才读回主机。死代码多于max_codes时，剩下的在之后的调用中更新。
+
+    锚点采样方法保存在anchor_samplers中，可以用register_anchor添加新的方法，方法的签名为
+    sampler(z_flattened, codebook, code_ids, distance, d) -> [len(code_ids), embed_dim]，d是当前批次与
+    code_ids对应代码的 [B, len(code_ids)] 相似度矩阵，没有时为None。
+
+    参数:
+    - num_embed: 代码本条目数量
+    - anchor: 锚定采样方法 ('probrandom', 'random', 'closest')
+    - decay: embed_prob的衰减率
+    - interval: 每隔多少次调用运行一次
+    - threshold: embed_prob低于该值的代码才会被更新，默认取衰减参数等于1e-3时的embed_prob
+    - pool: 'random'锚点使用的特征池
+    - max_codes: 每次运行最多更新的代码数量，默认取num_embed的1/8
+    """
+    def __init__(self, num_embed, anchor='probrandom', decay=0.99, interval=1, threshold=None, pool=None,
+                 max_codes=None):
+        self.num_embed = num_embed
+        self.anchor = anchor
+        self.decay = decay
+        self.interval = interval
+        if threshold is None:
+            threshold = (1 - decay) * (-math.log(1e-3) - 1e-3) / (10 * num_embed)
+        self.threshold = threshold
+        self.pool = pool
+        if max_codes is None:
+            max_codes = max(1, num_embed // 8)
+        self.max_codes = min(max_codes, num_embed)
+        self.anchor_samplers = {
+            'closest': self.closest_anchor,
+            'random': self.random_anchor,
+            'probrandom': self.probrandom_anchor,
+        }
+        self.distance_anchors = {'closest', 'probrandom'}  # 需要相似度矩阵的锚点采样方法
+        # 统计，运行后的更新数量是设备上的张量
+        self.num_calls = 0  # 调用次数
+        self.num_runs = 0  # 实际运行的次数
+        self.num_revived = 0  # 累计更新的代码数量
+        self.last_revived = 0  # 最近一次运行更新的代码数量
+        self.pool_features = None
+
+    def register_anchor(self, name, sampler, needs_distance=True):
+        """注册新的锚点采样方法，needs_distance表示它是否使用相似度矩阵。"""
+        self.anchor_samplers[name] = sampler
+        if needs_distance:
+            self.distance_anchors.add(name)
+        else:
+            self.distance_anchors.discard(name)
+
+    def runs_next_call(self):
+        """下一次调用是否会运行。"""
+        return self.num_calls % self.interval == 0
+
+    def needs_distance(self):
+        """当前的锚点采样方法是否使用相似度矩阵。"""
+        return self.anchor in self.distance_anchors
+
+    def __call__(self, codebook, embed_prob, z_flattened, distance, d=None):
+        """
+        原地更新codebook中的死代码，本次运行了返回True。
+
+        参数:
+        - codebook: [num_embed, embed_dim] 代码本权重（不需要梯度）
+        - embed_prob: [num_embed] 代码的平均使用概率
+        - z_flattened: [B, embed_dim] 当前批次的特征（不需要梯度）
+        - distance: 'l2' 或 'cos'
+        - d: [B, num_embed] 当前批次与codebook的相似度矩阵，为None时只为选出的代码计算
+        """
+        if self.anchor == 'random':
+            # 特征池需要看到每一个批次
+            self.pool_features = self.pool.query(z_flattened)
+        self.num_calls += 1
+        if (self.num_calls - 1) % self.interval != 0:
+            return False
+        self.num_runs += 1
+
+        # 固定数量的候选代码，其中低于阈值的才是死代码
+        code_prob, code_ids = embed_prob.topk(self.max_codes, largest=False, sorted=False)
+        mask = (code_prob < self.threshold).unsqueeze(1)
+        d_codes = None if d is None else d.index_select(1, code_ids)
+        anchor_feat = self.anchor_samplers[self.anchor](z_flattened, codebook, code_ids, distance, d_codes)
+        # 基于平均使用情况的衰减参数
+        decay = torch.exp(-(code_prob * self.num_embed * 10) / (1 - self.decay) - 1e-3).unsqueeze(1)
+        codes = codebook.index_select(0, code_ids)
+        blended = codes * (1 - decay) + anchor_feat.to(codebook.dtype) * decay
+        codebook.index_copy_(0, code_ids, torch.where(mask, blended, codes))
+
+        self.last_revived = mask.sum()
+        self.num_revived = self.num_revived + self.last_revived
+        return True
+
+    def closest_anchor(self, z_flattened, codebook, code_ids, distance, d=None):
+        """最近采样：每个代码取与它最接近的特征。"""
+        if d is None:
+            d = code_distance(z_flattened, codebook[code_ids], distance)
+        return z_flattened[last_argmax(d, dim=0)]
+
+    def random_anchor(self, z_flattened, codebook, code_ids, distance, d=None):
+        """基于特征池的随机采样。"""
+        return self.pool_features[code_ids]
+
+    def probrandom_anchor(self, z_flattened, codebook, code_ids, distance, d=None):
+        """基于概率的随机采样：越接近的特征被选中的概率越大。"""
+        if d is None:
+            d = code_distance(z_flattened, codebook[code_ids], distance)
+        prob = torch.multinomial(F.softmax(d.t(), dim=1), num_samples=1).view(-1)
+        return z_flattened[prob]
+
+    def stats(self):
+        """返回统计信息，会读回设备上的更新数量。"""
+        return {
+            "calls": self.num_calls,
+            "runs": self.num_runs,
+            "revived": int(self.num_revived),
+            "last_revived": int(self.last_revived),
+        }
+
+
 class FeaturePool():
     """
     实现一个特征缓冲区，用于存储先前编码的特征。
     
     该缓冲区使我们能够使用生成特征的历史记录来初始化代码本，而不是最新编码器生成的特征。
+
+    缓冲区是预先分配的环形缓冲区，第一次query时移动到特征所在的设备上，之后所有的采样和写入都在该设备上完成，
+    不会重新分配内存，也不需要和主机同步：
+    - 未满时按顺序写入空位；
+    - 已满时把新特征写入随机选取的、互不相同的槽位；
+    - 批量大于池的大小时，用从批量中有放回采样的特征覆盖整个池。
     """
     def __init__(self, pool_size, dim=64):
         """
@@ -137,23 +307,28 @@ class FeaturePool():
         """
         从池中返回特征。
         """
-        self.features = self.features.to(features.device)
+        if self.features.device != features.device:
+            self.features = self.features.to(features.device)
+        # 混合精度下特征可能是半精度，池始终保持自己的精度
+        features = features.to(self.features.dtype)
+        batch_size = features.size(0)
+        if batch_size > self.pool_size:
+            # 如果批量足够大，直接更新整个池
+            random_feat_id = torch.randint(0, batch_size, (self.pool_size,), device=features.device)
+            torch.index_select(features, 0, random_feat_id, out=self.features)
+            self.nums_features = self.pool_size
+            return self.features
+
         if self.nums_features < self.pool_size:
-            if features.size(0) > self.pool_size:  # 如果批量足够大，直接更新整个代码本
-                random_feat_id = torch.randint(0, features.size(0), (int(self.pool_size),))
-                self.features = features[random_feat_id]
-                self.nums_features = self.pool_size
-            else:
-                # 如果批量不够大，暂时存储以备下次更新
-                num = self.nums_features + features.size(0)
-                self.features[self.nums_features:num] = features
-                self.nums_features = num
-        else:
-            if features.size(0) > int(self.pool_size):
-                random_feat_id = torch.randint(0, features.size(0), (int(self.pool_size),))
-                self.features = features[random_feat_id]
-            else:
-                random_id = torch.randperm(self.pool_size)
-                self.features[random_id[:features.size(0)]] = features
+            # 如果池还没满，先按顺序写入空位
+            num = min(self.nums_features + batch_size, self.pool_size)
+            num_written = num - self.nums_features
+            self.features[self.nums_features:num] = features[:num_written]
+            self.nums_features = num
+            features = features[num_written:]
+        if features.size(0) > 0:
+            # 池已满，写入随机选取的互不相同的槽位
+            random_id = torch.rand(self.pool_size, device=features.device).argsort()[:features.size(0)]
+            self.features[random_id] = features
         
-        return self.features
\ No newline at end of file
+        return self.features
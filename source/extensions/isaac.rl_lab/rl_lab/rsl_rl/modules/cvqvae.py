@@ -89,7 +89,7 @@ class CVQVAE(nn.Module):
             self.codebook.weight, -1.0 / z_settings.num_embeddings, 1.0 / encoder_output
         )
         """
-        self.codebook = VectorQuantiser(self.num_embeddings, encoder_output,beta = 0.25)
+        self.codebook = VectorQuantiser(self.num_embeddings, encoder_output,beta = 0.25, return_encodings=False)
         
         # separate embed layer 
         observation_embd_layers = []
@@ -11,7 +11,7 @@ from torch import nn
 class EmpiricalNormalization(nn.Module):
     """Normalize mean and variance of values based on empirical values."""
 
-    def __init__(self, shape, eps=1e-2, until=None):
+    def __init__(self, shape, eps=1e-2, until=None, update_interval=1):
         """Initialize EmpiricalNormalization module.
 
         Args:
@@ -19,10 +19,14 @@ class EmpiricalNormalization(nn.Module):
             eps (float): Small value for stability.
             until (int or None): If this arg is specified, the link learns input values until the sum of batch sizes
             exceeds it.
+            update_interval (int): Learn from every ``update_interval``-th batch only. The other batches are just
+            normalized.
         """
         super().__init__()
         self.eps = eps
         self.until = until
+        self.update_interval = update_interval
+        self._num_updates = 0
         self.register_buffer("_mean", torch.zeros(shape).unsqueeze(0))
         self.register_buffer("_var", torch.ones(shape).unsqueeze(0))
         self.register_buffer("_std", torch.ones(shape).unsqueeze(0))
@@ -56,18 +60,38 @@ class EmpiricalNormalization(nn.Module):
 
         if self.until is not None and self.count >= self.until:
             return
+        self._num_updates += 1
+        if (self._num_updates - 1) % self.update_interval != 0:
+            return
 
         count_x = x.shape[0]
         self.count += count_x
         rate = count_x / self.count
 
-        var_x = torch.var(x, dim=0, unbiased=False, keepdim=True)
-        mean_x = torch.mean(x, dim=0, keepdim=True)
+        # single-pass batch moments, merged into the running ones (Chan et al. parallel Welford update)
+        var_x, mean_x = torch.var_mean(x, dim=0, correction=0, keepdim=True)
         delta_mean = mean_x - self._mean
-        self._mean += rate * delta_mean
-        self._var += rate * (var_x - self._var + delta_mean * (mean_x - self._mean))
-        self._std = torch.sqrt(self._var)
+        self._mean.add_(delta_mean, alpha=rate)
+        self._var.add_(rate * (var_x - self._var + delta_mean * (mean_x - self._mean)))
+        torch.sqrt(self._var, out=self._std)
 
     @torch.jit.unused
     def inverse(self, y):
         return y * (self._std + self.eps) + self._mean
+
+    @torch.jit.unused
+    def fold_into(self, linear: nn.Linear) -> nn.Linear:
+        """Return a copy of ``linear`` that normalizes its input with the current statistics.
+
+        ``linear((x - mean) / (std + eps))`` equals ``folded(x)`` with ``W' = W / (std + eps)`` and
+        ``b' = b - W' @ mean``, so a deployed policy saves the elementwise normalization pass.
+        """
+        with torch.no_grad():
+            weight = linear.weight / (self._std + self.eps)
+            bias = -(weight @ self._mean.squeeze(0))
+            if linear.bias is not None:
+                bias += linear.bias
+            folded = nn.Linear(linear.in_features, linear.out_features, device=weight.device, dtype=weight.dtype)
+            folded.weight.copy_(weight)
+            folded.bias.copy_(bias)
+        return folded
@@ -29,11 +29,11 @@
 # Copyright (c) 2021 ETH Zurich, Nikita Rudin
 
 import torch
-import torch.nn as nn
 import torch.optim as optim
 
 from ..modules import ActorCritic
 from ..storage import RolloutStorage
+from .update_accelerator import UpdateAccelerator
 from ..storage.replay_buffer import ReplayBuffer
 from .amp_discriminator import AMPDiscriminator
 from ...assets.loder_for_algs import AmpMotion
@@ -48,6 +48,8 @@ class AMPPPO:
         amp_normalizer,
         min_std=None,
         amp_replay_buffer_size=100000,
+        amp_replay_buffer_dtype=None,
+        amp_prioritized_replay=False,
         num_learning_epochs=1,
         num_mini_batches=1,
         clip_param=0.2,
@@ -61,8 +63,16 @@ class AMPPPO:
         schedule="fixed",
         desired_kl=0.01,
         device="cpu",
+        packed_storage=False,
+        pre_shuffle_minibatches=False,
+        accelerated_update=False,
+        update_precision="bf16",
+        update_compile_mode=None,
     ):
         self.device = device
+        # rollout storage 使用单个连续缓冲区，并在每个epoch预先打乱一次
+        self.packed_storage = packed_storage
+        self.pre_shuffle_minibatches = pre_shuffle_minibatches
 
         self.desired_kl = desired_kl
         self.schedule = schedule
@@ -73,7 +83,15 @@ class AMPPPO:
         self.discriminator = discriminator
         self.discriminator.to(self.device)
         self.amp_transition = RolloutStorage.Transition()
-        self.amp_storage = ReplayBuffer(discriminator.input_dim // 2, amp_replay_buffer_size, device)
+        # amp_replay_buffer_dtype: e.g. torch.float16 / torch.bfloat16 to store the replay buffer in half precision.
+        # amp_prioritized_replay: sample policy transitions proportional to their discriminator error.
+        self.amp_storage = ReplayBuffer(
+            discriminator.input_dim // 2,
+            amp_replay_buffer_size,
+            device,
+            dtype=amp_replay_buffer_dtype,
+            prioritized=amp_prioritized_replay,
+        )
         self.amp_data = amp_data
         self.amp_normalizer = amp_normalizer
 
@@ -89,6 +107,16 @@ class AMPPPO:
             {"params": self.discriminator.amp_linear.parameters(), "weight_decay": 10e-2, "name": "amp_head"},
         ]
         self.optimizer = optim.Adam(params, lr=learning_rate)
+        # opt-in mixed precision / on-device adaptive learning rate / compiled losses, see UpdateAccelerator
+        self.accelerator = UpdateAccelerator(
+            self.optimizer,
+            learning_rate,
+            device,
+            enabled=accelerated_update,
+            precision=update_precision,
+            compile_mode=update_compile_mode,
+        )
+        self.optimizer = self.accelerator.optimizer
         # self.optimizer = optim.Adam(self.actor_critic.parameters(), lr=learning_rate)
         self.transition = RolloutStorage.Transition()
 
@@ -105,7 +133,8 @@ class AMPPPO:
 
     def init_storage(self, num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape):
         self.storage = RolloutStorage(
-            num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape, self.device
+            num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape, self.device,
+            packed=self.packed_storage, pre_shuffle=self.pre_shuffle_minibatches,
         )
 
     def test_mode(self):
@@ -189,110 +218,84 @@ class AMPPPO:
             sample_amp_policy,
             sample_amp_expert,
         ) in zip(generator, amp_policy_generator, amp_expert_generator):
-            self.actor_critic.act(obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0])
-            actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
-            value_batch = self.actor_critic.evaluate(
-                critic_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[1]
-            )
-            mu_batch = self.actor_critic.action_mean
-            sigma_batch = self.actor_critic.action_std
-            entropy_batch = self.actor_critic.entropy
-
-            # KL
-            if self.desired_kl is not None and self.schedule == "adaptive":
-                with torch.inference_mode():
-                    kl = torch.sum(
-                        torch.log(sigma_batch / old_sigma_batch + 1.0e-5)
-                        + (torch.square(old_sigma_batch) + torch.square(old_mu_batch - mu_batch))
-                        / (2.0 * torch.square(sigma_batch))
-                        - 0.5,
-                        axis=-1,
-                    )
-                    kl_mean = torch.mean(kl)
-
-                    if kl_mean > self.desired_kl * 2.0:
-                        self.learning_rate = max(1e-5, self.learning_rate / 1.5)
-                    elif kl_mean < self.desired_kl / 2.0 and kl_mean > 0.0:
-                        self.learning_rate = min(1e-2, self.learning_rate * 1.5)
-
-                    for param_group in self.optimizer.param_groups:
-                        param_group["lr"] = self.learning_rate
-
-            # Surrogate loss
-            ratio = torch.exp(actions_log_prob_batch - torch.squeeze(old_actions_log_prob_batch))
-            surrogate = -torch.squeeze(advantages_batch) * ratio
-            surrogate_clipped = -torch.squeeze(advantages_batch) * torch.clamp(
-                ratio, 1.0 - self.clip_param, 1.0 + self.clip_param
-            )
-            surrogate_loss = torch.max(surrogate, surrogate_clipped).mean()
-
-            # Value function loss
-            if self.use_clipped_value_loss:
-                value_clipped = target_values_batch + (value_batch - target_values_batch).clamp(
-                    -self.clip_param, self.clip_param
+            with self.accelerator.autocast():
+                self.actor_critic.act(obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0])
+                actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
+                value_batch = self.actor_critic.evaluate(
+                    critic_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[1]
+                )
+                mu_batch = self.actor_critic.action_mean
+                sigma_batch = self.actor_critic.action_std
+                entropy_batch = self.actor_critic.entropy
+
+                # KL
+                if self.desired_kl is not None and self.schedule == "adaptive":
+                    with torch.inference_mode():
+                        kl_mean = self.accelerator.kl_mean(mu_batch, sigma_batch, old_mu_batch, old_sigma_batch)
+                        self.accelerator.adapt_learning_rate(kl_mean, self.desired_kl)
+
+                # Surrogate loss
+                surrogate_loss = self.accelerator.surrogate_loss(
+                    actions_log_prob_batch, old_actions_log_prob_batch, advantages_batch, self.clip_param
                 )
-                value_losses = (value_batch - returns_batch).pow(2)
-                value_losses = torch.clamp(value_losses, -1e5, 1e5)
-                
-                value_losses_clipped = (value_clipped - returns_batch).pow(2)
-                
-                value_losses_clipped = torch.clamp(value_losses_clipped, -1e5, 1e5)
-                
-                value_loss = torch.max(value_losses, value_losses_clipped).mean()
-
-                # Print max and min of value_loss
-
-
-            else:
-                value_loss = (returns_batch - value_batch).pow(2).mean()
-
-            # Discriminator loss.
-            policy_state, policy_next_state = sample_amp_policy
-            expert_state, expert_next_state = sample_amp_expert
-
-            policy_state_unnorm = torch.clone(policy_state)
-            expert_state_unnorm = torch.clone(expert_state)
 
-            if self.amp_normalizer is not None:
-                with torch.no_grad():
-                    policy_state = self.amp_normalizer.normalize_torch(policy_state, self.device)
-                    policy_next_state = self.amp_normalizer.normalize_torch(policy_next_state, self.device)
-                    expert_state = self.amp_normalizer.normalize_torch(expert_state, self.device)
-                    expert_next_state = self.amp_normalizer.normalize_torch(expert_next_state, self.device)
-            policy_d = self.discriminator(torch.cat([policy_state, policy_next_state], dim=-1))
-            expert_d = self.discriminator(torch.cat([expert_state, expert_next_state], dim=-1))
-            expert_loss = torch.nn.MSELoss()(expert_d, torch.ones(expert_d.size(), device=self.device))
-            policy_loss = torch.nn.MSELoss()(policy_d, -1 * torch.ones(policy_d.size(), device=self.device))
-            amp_loss = 0.5 * (expert_loss + policy_loss)
-            grad_pen_loss = self.discriminator.compute_grad_pen(expert_state, expert_next_state, lambda_=10)
-            # Check for NaN values in losses
+                # Value function loss
+                value_loss = self.accelerator.value_loss(
+                    value_batch,
+                    target_values_batch,
+                    returns_batch,
+                    self.clip_param,
+                    self.use_clipped_value_loss,
+                    loss_bound=1e5,
+                )
 
-            # Compute total loss.
-            loss = (
-                surrogate_loss
-                + self.value_loss_coef * value_loss
-                - self.entropy_coef * entropy_batch.mean()
-                + amp_loss
-                + grad_pen_loss
-            )
+                # Discriminator loss.
+                policy_state, policy_next_state = sample_amp_policy
+                expert_state, expert_next_state = sample_amp_expert
+
+                policy_state_unnorm = policy_state
+                expert_state_unnorm = expert_state
+
+                if self.amp_normalizer is not None:
+                    with torch.no_grad():
+                        policy_state = self.amp_normalizer.normalize_torch(policy_state, self.device)
+                        policy_next_state = self.amp_normalizer.normalize_torch(policy_next_state, self.device)
+                        expert_state = self.amp_normalizer.normalize_torch(expert_state, self.device)
+                        expert_next_state = self.amp_normalizer.normalize_torch(expert_next_state, self.device)
+                policy_d = self.discriminator(torch.cat([policy_state, policy_next_state], dim=-1))
+                expert_d = self.discriminator(torch.cat([expert_state, expert_next_state], dim=-1))
+                if self.amp_storage.prioritized:
+                    # 判别器越容易识别的策略样本（离 -1 越远）越优先被采样
+                    self.amp_storage.update_priorities(self.amp_storage.last_idxs, (policy_d.detach() + 1.0).square())
+                expert_loss = torch.nn.MSELoss()(expert_d, torch.ones(expert_d.size(), device=self.device))
+                policy_loss = torch.nn.MSELoss()(policy_d, -1 * torch.ones(policy_d.size(), device=self.device))
+                amp_loss = 0.5 * (expert_loss + policy_loss)
+                grad_pen_loss = self.discriminator.compute_grad_pen(expert_state, expert_next_state, lambda_=10)
+                # Check for NaN values in losses
+
+                # Compute total loss.
+                loss = (
+                    surrogate_loss
+                    + self.value_loss_coef * value_loss
+                    - self.entropy_coef * entropy_batch.mean()
+                    + amp_loss
+                    + grad_pen_loss
+                )
 
             # Gradient step
-            self.optimizer.zero_grad()
-            loss.backward()
-            nn.utils.clip_grad_norm_(self.actor_critic.parameters(), self.max_grad_norm)
-            self.optimizer.step()
+            self.accelerator.step(loss, self.actor_critic.parameters(), self.max_grad_norm)
 
             self.actor_critic.std.data = self.actor_critic.std.data.clamp(min=self.min_std)
             if self.amp_normalizer is not None:
-                self.amp_normalizer.update(policy_state_unnorm.cpu().numpy())
-                self.amp_normalizer.update(expert_state_unnorm.cpu().numpy())
+                # stays on device, a frozen normalizer skips the update
+                self.amp_normalizer.update(torch.cat((policy_state_unnorm, expert_state_unnorm), dim=0))
 
-            mean_value_loss += value_loss.item()
-            mean_surrogate_loss += surrogate_loss.item()
-            mean_amp_loss += amp_loss.item()
-            mean_grad_pen_loss += grad_pen_loss.item()
-            mean_policy_pred += policy_d.mean().item()
-            mean_expert_pred += expert_d.mean().item()
+            mean_value_loss += value_loss.detach()
+            mean_surrogate_loss += surrogate_loss.detach()
+            mean_amp_loss += amp_loss.detach()
+            mean_grad_pen_loss += grad_pen_loss.detach()
+            mean_policy_pred += policy_d.mean().detach()
+            mean_expert_pred += expert_d.mean().detach()
 
         num_updates = self.num_learning_epochs * self.num_mini_batches
         mean_value_loss /= num_updates
@@ -301,6 +304,26 @@ class AMPPPO:
         mean_grad_pen_loss /= num_updates
         mean_policy_pred /= num_updates
         mean_expert_pred /= num_updates
+        # read the losses back once per update instead of once per minibatch
+        (
+            mean_value_loss,
+            mean_surrogate_loss,
+            mean_amp_loss,
+            mean_grad_pen_loss,
+            mean_policy_pred,
+            mean_expert_pred,
+        ) = (
+            float(value)
+            for value in (
+                mean_value_loss,
+                mean_surrogate_loss,
+                mean_amp_loss,
+                mean_grad_pen_loss,
+                mean_policy_pred,
+                mean_expert_pred,
+            )
+        )
+        self.learning_rate = self.accelerator.learning_rate
         self.storage.clear()
 
         return (
@@ -4,11 +4,11 @@
 from __future__ import annotations
 
 import torch
-import torch.nn as nn
 import torch.optim as optim
 
 from ..modules import ASEagent
 from ..storage import ASERolloutStorage
+from .update_accelerator import UpdateAccelerator
 from ..storage.replay_buffer import ReplayBuffer
 from rl_lab.assets.loder_for_algs import AmpMotion
 from ..utils.amp_utils import Normalizer
@@ -32,6 +32,9 @@ class ASEPPO:
         schedule="fixed",
         desired_kl=0.01,
         device="cpu",
+        accelerated_update=False,
+        update_precision="bf16",
+        update_compile_mode=None,
         amp_data:AmpMotion = None,
         amp_replay_buffer_size = 100000,
         *args, **kwargs
@@ -49,13 +52,23 @@ class ASEPPO:
         
         self.amp_storage = ReplayBuffer(amp_data.amp_obs_num, amp_replay_buffer_size, device)
         self.amp_data = amp_data
-        self.amp_normalizer = Normalizer(amp_data.amp_obs_num)
+        self.amp_normalizer = Normalizer(amp_data.amp_obs_num, device=device)
 
         # PPO components
         self.actor_critic = actor_critic
         self.actor_critic.to(self.device)
         self.storage = None  # initialized later
         self.optimizer = optim.Adam(self.actor_critic.parameters(), lr=learning_rate)
+        # 可选的加速更新：混合精度、设备上的自适应学习率和编译后的损失函数，见 UpdateAccelerator
+        self.accelerator = UpdateAccelerator(
+            self.optimizer,
+            learning_rate,
+            device,
+            enabled=accelerated_update,
+            precision=update_precision,
+            compile_mode=update_compile_mode,
+        )
+        self.optimizer = self.accelerator.optimizer
         self.transition = ASERolloutStorage.Transition()
 
         # PPO parameters
@@ -191,103 +204,78 @@ class ASEPPO:
             rl_state_trans,
             data_state_trans,
         ) in zip(generator,amp_rl_trans_generator,amp_motion_data_trans_generator):
-            self.actor_critic.train_mod = True
-            #使用ase_forward
+            with self.accelerator.autocast():
+                self.actor_critic.train_mod = True
+                #使用ase_forward
             
-            #预处理amp obs
-            policy_state, policy_next_state = rl_state_trans
-            expert_state, expert_next_state = data_state_trans 
-            rl_state_trans = torch.cat([policy_state, policy_next_state], dim=-1)
-            data_state_trans = torch.cat([expert_state, expert_next_state], dim=-1)     
-            rl_state_trans = self.actor_critic._preproc_amp_obs(rl_state_trans)
-            data_state_trans = self.actor_critic._preproc_amp_obs(data_state_trans)
-            data_state_trans.requires_grad_(True)
+                #预处理amp obs
+                policy_state, policy_next_state = rl_state_trans
+                expert_state, expert_next_state = data_state_trans 
+                rl_state_trans = torch.cat([policy_state, policy_next_state], dim=-1)
+                data_state_trans = torch.cat([expert_state, expert_next_state], dim=-1)     
+                rl_state_trans = self.actor_critic._preproc_amp_obs(rl_state_trans)
+                data_state_trans = self.actor_critic._preproc_amp_obs(data_state_trans)
+                data_state_trans.requires_grad_(True)
             
-            self.actor_critic.ase_forward(obs_batch,ase_latent_batch,rl_state_trans,data_state_trans)
+                self.actor_critic.ase_forward(obs_batch,ase_latent_batch,rl_state_trans,data_state_trans)
             
-            actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
-            value_batch = self.actor_critic.evaluate(
-                critic_obs_batch, masks=masks_batch, ase_latents = ase_latent_batch,hidden_states=hid_states_batch[1]
-            )
-            mu_batch = self.actor_critic.action_mean
-            sigma_batch = self.actor_critic.action_std
-            entropy_batch = self.actor_critic.entropy
-
-            # KL
-            if self.desired_kl is not None and self.schedule == "adaptive":
-                with torch.inference_mode():
-                    kl = torch.sum(
-                        torch.log(sigma_batch / old_sigma_batch + 1.0e-5)
-                        + (torch.square(old_sigma_batch) + torch.square(old_mu_batch - mu_batch))
-                        / (2.0 * torch.square(sigma_batch))
-                        - 0.5,
-                        axis=-1,
-                    )
-                    kl_mean = torch.mean(kl)
-
-                    if kl_mean > self.desired_kl * 2.0:
-                        self.learning_rate = max(1e-5, self.learning_rate / 1.5)
-                    elif kl_mean < self.desired_kl / 2.0 and kl_mean > 0.0:
-                        self.learning_rate = min(1e-2, self.learning_rate * 1.5)
-
-                    for param_group in self.optimizer.param_groups:
-                        param_group["lr"] = self.learning_rate
-
-            # Surrogate loss
-            ratio = torch.exp(actions_log_prob_batch - torch.squeeze(old_actions_log_prob_batch))
-            surrogate = -torch.squeeze(advantages_batch) * ratio
-            surrogate_clipped = -torch.squeeze(advantages_batch) * torch.clamp(
-                ratio, 1.0 - self.clip_param, 1.0 + self.clip_param
-            )
-            surrogate_loss = torch.max(surrogate, surrogate_clipped).mean()
+                actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
+                value_batch = self.actor_critic.evaluate(
+                    critic_obs_batch, masks=masks_batch, ase_latents = ase_latent_batch,hidden_states=hid_states_batch[1]
+                )
+                mu_batch = self.actor_critic.action_mean
+                sigma_batch = self.actor_critic.action_std
+                entropy_batch = self.actor_critic.entropy
+
+                # KL
+                if self.desired_kl is not None and self.schedule == "adaptive":
+                    with torch.inference_mode():
+                        kl_mean = self.accelerator.kl_mean(mu_batch, sigma_batch, old_mu_batch, old_sigma_batch)
+                        self.accelerator.adapt_learning_rate(kl_mean, self.desired_kl)
+
+                # Surrogate loss
+                surrogate_loss = self.accelerator.surrogate_loss(
+                    actions_log_prob_batch, old_actions_log_prob_batch, advantages_batch, self.clip_param
+                )
 
-            # Value function loss
-            if self.use_clipped_value_loss:
-                value_clipped = target_values_batch + (value_batch - target_values_batch).clamp(
-                    -self.clip_param, self.clip_param
+                # Value function loss
+                value_loss = self.accelerator.value_loss(
+                    value_batch, target_values_batch, returns_batch, self.clip_param, self.use_clipped_value_loss
                 )
-                value_losses = (value_batch - returns_batch).pow(2)
-                value_losses_clipped = (value_clipped - returns_batch).pow(2)
-                value_loss = torch.max(value_losses, value_losses_clipped).mean()
-            else:
-                value_loss = (returns_batch - value_batch).pow(2).mean()
 
-            bound_loss = self.actor_critic.bound_loss(mu_batch)
+                bound_loss = self.actor_critic.bound_loss(mu_batch)
             
-            # 计算判别器损失
-            disc_info = self.actor_critic._disc_loss(self.actor_critic.disc_agent_logit,
-                                                     self.actor_critic.disc_demo_logit, 
-                                                     data_state_trans)
-            disc_loss = disc_info['disc_loss'] 
+                # 计算判别器损失
+                disc_info = self.actor_critic._disc_loss(self.actor_critic.disc_agent_logit,
+                                                         self.actor_critic.disc_demo_logit, 
+                                                         data_state_trans)
+                disc_loss = disc_info['disc_loss'] 
 
-            # 计算编码器损失
-            enc_latents = ase_latent_batch
-            enc_info = self.actor_critic._enc_loss(self.actor_critic.enc_pred, enc_latents, rl_state_trans)
-            enc_loss = enc_info['enc_loss']
+                # 计算编码器损失
+                enc_latents = ase_latent_batch
+                enc_info = self.actor_critic._enc_loss(self.actor_critic.enc_pred, enc_latents, rl_state_trans)
+                enc_loss = enc_info['enc_loss']
 
 
-            loss = surrogate_loss + self.value_loss_coef * value_loss - self.entropy_coef * entropy_batch.mean() \
-                + self.actor_critic.aseconf.bounds_loss_coef * bound_loss.mean() + \
-                self.actor_critic.aseconf.disc_coef * disc_loss + self.actor_critic.aseconf.enc_coef * enc_loss
+                loss = surrogate_loss + self.value_loss_coef * value_loss - self.entropy_coef * entropy_batch.mean() \
+                    + self.actor_critic.aseconf.bounds_loss_coef * bound_loss.mean() + \
+                    self.actor_critic.aseconf.disc_coef * disc_loss + self.actor_critic.aseconf.enc_coef * enc_loss
 
-            if self.actor_critic._enable_amp_diversity_bonus():
-                diversity_loss = self.actor_critic._diversity_loss(obs_batch, mu_batch, ase_latent_batch)
-                loss += self.actor_critic.aseconf.amp_diversity_bonus * diversity_loss.mean()
+                if self.actor_critic._enable_amp_diversity_bonus():
+                    diversity_loss = self.actor_critic._diversity_loss(obs_batch, mu_batch, ase_latent_batch)
+                    loss += self.actor_critic.aseconf.amp_diversity_bonus * diversity_loss.mean()
 
             # Gradient step
-            self.optimizer.zero_grad()
-            loss.backward()
-            nn.utils.clip_grad_norm_(self.actor_critic.parameters(), self.max_grad_norm)
-            self.optimizer.step()
-
-            mean_value_loss += value_loss.item()
-            mean_surrogate_loss += surrogate_loss.item()
-            mean_entropy_loss += entropy_batch.mean().item()
-            mean_bound_loss += bound_loss.mean().item()
-            mean_disc_loss += disc_loss.item()
-            mean_enc_loss += enc_loss.item()
+            self.accelerator.step(loss, self.actor_critic.parameters(), self.max_grad_norm)
+
+            mean_value_loss += value_loss.detach()
+            mean_surrogate_loss += surrogate_loss.detach()
+            mean_entropy_loss += entropy_batch.mean().detach()
+            mean_bound_loss += bound_loss.mean().detach()
+            mean_disc_loss += disc_loss.detach()
+            mean_enc_loss += enc_loss.detach()
             if self.actor_critic._enable_amp_diversity_bonus():
-                mean_diversity_loss += diversity_loss.mean().item()
+                mean_diversity_loss += diversity_loss.mean().detach()
             else:
                 mean_diversity_loss = 0.0
 
@@ -299,6 +287,28 @@ class ASEPPO:
         mean_disc_loss /= num_updates
         mean_enc_loss /= num_updates
         mean_diversity_loss /= num_updates
+        # 每次更新只把损失读回一次，而不是每个小批量一次
+        (
+            mean_value_loss,
+            mean_surrogate_loss,
+            mean_entropy_loss,
+            mean_bound_loss,
+            mean_disc_loss,
+            mean_enc_loss,
+            mean_diversity_loss,
+        ) = (
+            float(value)
+            for value in (
+                mean_value_loss,
+                mean_surrogate_loss,
+                mean_entropy_loss,
+                mean_bound_loss,
+                mean_disc_loss,
+                mean_enc_loss,
+                mean_diversity_loss,
+            )
+        )
+        self.learning_rate = self.accelerator.learning_rate
 
         self.storage.clear()
         return (
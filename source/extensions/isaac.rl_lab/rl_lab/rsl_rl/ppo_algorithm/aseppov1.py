@@ -48,7 +48,7 @@ class ASEPPOV1:
         
         self.amp_storage = ReplayBuffer(amp_data.amp_obs_num, amp_replay_buffer_size, device)
         self.amp_data = amp_data
-        self.amp_normalizer = Normalizer(amp_data.amp_obs_num)
+        self.amp_normalizer = Normalizer(amp_data.amp_obs_num, device=device)
 
         # PPO components
         self.actor_critic = actor_critic
@@ -285,8 +285,7 @@ class ASEPPOV1:
 
             self.actor_critic.std.data = self.actor_critic.std.data.clamp(min=self.min_std)
             if self.amp_normalizer is not None:
-                self.amp_normalizer.update(policy_state_unnorm.cpu().numpy())
-                self.amp_normalizer.update(expert_state_unnorm.cpu().numpy())
+                self.amp_normalizer.update(torch.cat((policy_state_unnorm, expert_state_unnorm), dim=0))
 
             mean_value_loss += value_loss.item()
             mean_surrogate_loss += surrogate_loss.item()
@@ -4,11 +4,11 @@
 from __future__ import annotations
 
 import torch
-import torch.nn as nn
 import torch.optim as optim
 
 from ..modules import CVQVAE
 from ..storage import RolloutStorage
+from .update_accelerator import UpdateAccelerator
 
 class CVQVAEPPO:
     actor_critic: CVQVAE
@@ -29,9 +29,17 @@ class CVQVAEPPO:
         schedule="fixed",
         desired_kl=0.015,
         device="cpu",
+        packed_storage=False,
+        pre_shuffle_minibatches=False,
+        accelerated_update=False,
+        update_precision="bf16",
+        update_compile_mode=None,
         vqvaebeta = 0.25
     ):
         self.device = device
+        # rollout storage 使用单个连续缓冲区，并在每个epoch预先打乱一次
+        self.packed_storage = packed_storage
+        self.pre_shuffle_minibatches = pre_shuffle_minibatches
 
         self.desired_kl = desired_kl
         self.schedule = schedule
@@ -42,6 +50,16 @@ class CVQVAEPPO:
         self.actor_critic.to(self.device)
         self.storage = None  # initialized later
         self.optimizer = optim.Adam(self.actor_critic.parameters(), lr=learning_rate)
+        # 可选的加速更新：混合精度、设备上的自适应学习率和编译后的损失函数，见 UpdateAccelerator
+        self.accelerator = UpdateAccelerator(
+            self.optimizer,
+            learning_rate,
+            device,
+            enabled=accelerated_update,
+            precision=update_precision,
+            compile_mode=update_compile_mode,
+        )
+        self.optimizer = self.accelerator.optimizer
         self.transition = RolloutStorage.Transition()
 
         # PPO parameters
@@ -62,7 +80,8 @@ class CVQVAEPPO:
 
     def init_storage(self, num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape):
         self.storage = RolloutStorage(
-            num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape, self.device
+            num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape, self.device,
+            packed=self.packed_storage, pre_shuffle=self.pre_shuffle_minibatches,
         )
 
     def test_mode(self):
@@ -128,89 +147,67 @@ class CVQVAEPPO:
             hid_states_batch,
             masks_batch,
         ) in generator:
-            # 计算当前动作的概率分布
-            distribution_action = self.actor_critic.act(obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0], env=env)
-            # 评估            
-            # 获取当前动作的日志概率
-            actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
-            value_batch = self.actor_critic.evaluate(critic_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[1])
+            with self.accelerator.autocast():
+                # 计算当前动作的概率分布
+                distribution_action = self.actor_critic.act(obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0], env=env)
+                # 评估            
+                # 获取当前动作的日志概率
+                actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
+                value_batch = self.actor_critic.evaluate(critic_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[1])
             
-            # 获取当前动作的均值和标准差
-            mu_batch = self.actor_critic.action_mean
-            sigma_batch = self.actor_critic.action_std
+                # 获取当前动作的均值和标准差
+                mu_batch = self.actor_critic.action_mean
+                sigma_batch = self.actor_critic.action_std
             
-            # 计算熵
-            entropy_batch = self.actor_critic.entropy
-
-            # 计算KL散度
-            if self.desired_kl is not None and self.schedule == "adaptive":
-                with torch.inference_mode():
-                    kl = torch.sum(
-                        torch.log(sigma_batch / old_sigma_batch + 1.0e-5)
-                        + (torch.square(old_sigma_batch) 
-                        + torch.square(old_mu_batch - mu_batch))/ (2.0 * torch.square(sigma_batch))
-                        - 0.5,
-                        axis=-1,
-                    )
-                    kl_mean = torch.mean(kl)
-
-                    # 根据KL散度调整学习率
-                    if kl_mean > self.desired_kl * 2.0:
-                        self.learning_rate = max(1e-5, self.learning_rate / 1.5)
-                    elif kl_mean < self.desired_kl / 2.0 and kl_mean > 0.0:
-                        self.learning_rate = min(1e-2, self.learning_rate * 1.5)
-
-                    # 更新优化器的学习率
-                    for param_group in self.optimizer.param_groups:
-                        param_group["lr"] = self.learning_rate
-
-            # 计算策略损失（代理损失）
-            ratio = torch.exp(actions_log_prob_batch - torch.squeeze(old_actions_log_prob_batch))
-            surrogate = -torch.squeeze(advantages_batch) * ratio
-            surrogate_clipped = -torch.squeeze(advantages_batch) * torch.clamp(
-                ratio, 1.0 - self.clip_param, 1.0 + self.clip_param
-            )
-            surrogate_loss = torch.max(surrogate, surrogate_clipped).mean()
+                # 计算熵
+                entropy_batch = self.actor_critic.entropy
+
+                # 计算KL散度
+                if self.desired_kl is not None and self.schedule == "adaptive":
+                    with torch.inference_mode():
+                        kl_mean = self.accelerator.kl_mean(mu_batch, sigma_batch, old_mu_batch, old_sigma_batch)
+                        self.accelerator.adapt_learning_rate(kl_mean, self.desired_kl)
+
+                # 计算策略损失（代理损失）
+                surrogate_loss = self.accelerator.surrogate_loss(
+                    actions_log_prob_batch, old_actions_log_prob_batch, advantages_batch, self.clip_param
+                )
             
-            # 计算CVQVAE损失
-            cvqvaeloss = self.actor_critic.cvqvae_loss
-            mean_perplexity = self.actor_critic.perplexity.mean()
+                # 计算CVQVAE损失
+                cvqvaeloss = self.actor_critic.cvqvae_loss
+                mean_perplexity = self.actor_critic.perplexity.mean()
 
                     
-            # 计算价值函数损失
-            if self.use_clipped_value_loss:
-                value_clipped = target_values_batch + (value_batch - target_values_batch).clamp(
-                    -self.clip_param, self.clip_param
+                # 计算价值函数损失
+                value_loss = self.accelerator.value_loss(
+                    value_batch, target_values_batch, returns_batch, self.clip_param, self.use_clipped_value_loss
                 )
-                value_losses = (value_batch - returns_batch).pow(2)
-                value_losses_clipped = (value_clipped - returns_batch).pow(2)
-                value_loss = torch.max(value_losses, value_losses_clipped).mean()
-            else:
-                value_loss = (returns_batch - value_batch).pow(2).mean()
  
 
 
-            # 计算总损失
-            loss = surrogate_loss + self.value_loss_coef * value_loss \
-                - self.entropy_coef * entropy_batch.mean() + cvqvaeloss
+                # 计算总损失
+                loss = surrogate_loss + self.value_loss_coef * value_loss \
+                    - self.entropy_coef * entropy_batch.mean() + cvqvaeloss
 
 
             # 执行梯度下降步骤
-            self.optimizer.zero_grad()
-            loss.backward()
-            nn.utils.clip_grad_norm_(self.actor_critic.parameters(), self.max_grad_norm)
-            self.optimizer.step()
+            self.accelerator.step(loss, self.actor_critic.parameters(), self.max_grad_norm)
 
             # 累加损失值
-            mean_value_loss += value_loss.item()
-            mean_surrogate_loss += surrogate_loss.item()
-            mean_vqvae_loss += cvqvaeloss.item()
+            mean_value_loss += value_loss.detach()
+            mean_surrogate_loss += surrogate_loss.detach()
+            mean_vqvae_loss += cvqvaeloss.detach()
         # 计算平均损失
         num_updates = self.num_learning_epochs * self.num_mini_batches
         mean_value_loss /= num_updates
         mean_surrogate_loss /= num_updates
         mean_vqvae_loss /= num_updates
         mean_perplexity /= num_updates
+        # 每次更新只把损失读回一次，而不是每个小批量一次
+        mean_value_loss, mean_surrogate_loss, mean_vqvae_loss, mean_perplexity = (
+            float(value) for value in (mean_value_loss, mean_surrogate_loss, mean_vqvae_loss, mean_perplexity)
+        )
+        self.learning_rate = self.accelerator.learning_rate
         # 清空存储器
         self.storage.clear()
 
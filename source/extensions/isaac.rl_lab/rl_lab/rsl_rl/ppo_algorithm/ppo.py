@@ -29,12 +29,13 @@
 # Copyright (c) 2021 ETH Zurich, Nikita Rudin
 
 import torch
-import torch.nn as nn
 import torch.optim as optim
 
 from rsl_rl.modules import ActorCritic
 from rsl_rl.storage import RolloutStorage
 
+from .update_accelerator import UpdateAccelerator
+
 class PPO:
     actor_critic: ActorCritic
     def __init__(self,
@@ -52,9 +53,17 @@ class PPO:
                  schedule="fixed",
                  desired_kl=0.01,
                  device='cpu',
+                 packed_storage=False,
+                 pre_shuffle_minibatches=False,
+                 accelerated_update=False,
+                 update_precision="bf16",
+                 update_compile_mode=None,
                  ):
 
         self.device = device
+        # pack the rollout storage into one [T, N, F] buffer and optionally reshuffle it once per epoch
+        self.packed_storage = packed_storage
+        self.pre_shuffle_minibatches = pre_shuffle_minibatches
 
         self.desired_kl = desired_kl
         self.schedule = schedule
@@ -65,6 +74,16 @@ class PPO:
         self.actor_critic.to(self.device)
         self.storage = None # initialized later
         self.optimizer = optim.Adam(self.actor_critic.parameters(), lr=learning_rate)
+        # opt-in mixed precision / on-device adaptive learning rate / compiled losses, see UpdateAccelerator
+        self.accelerator = UpdateAccelerator(
+            self.optimizer,
+            learning_rate,
+            device,
+            enabled=accelerated_update,
+            precision=update_precision,
+            compile_mode=update_compile_mode,
+        )
+        self.optimizer = self.accelerator.optimizer
         self.transition = RolloutStorage.Transition()
 
         # PPO parameters
@@ -79,7 +98,8 @@ class PPO:
         self.use_clipped_value_loss = use_clipped_value_loss
 
     def init_storage(self, num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape):
-        self.storage = RolloutStorage(num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape, self.device)
+        self.storage = RolloutStorage(num_envs, num_transitions_per_env, actor_obs_shape, critic_obs_shape, action_shape, self.device,
+                                      packed=self.packed_storage, pre_shuffle=self.pre_shuffle_minibatches)
 
     def test_mode(self):
         self.actor_critic.test()
@@ -128,60 +148,47 @@ class PPO:
             old_mu_batch, old_sigma_batch, hid_states_batch, masks_batch in generator:
 
 
-                self.actor_critic.act(obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0])
-                actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
-                value_batch = self.actor_critic.evaluate(critic_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[1])
-                mu_batch = self.actor_critic.action_mean
-                sigma_batch = self.actor_critic.action_std
-                entropy_batch = self.actor_critic.entropy
-
-                # KL
-                if self.desired_kl != None and self.schedule == 'adaptive':
-                    with torch.inference_mode():
-                        kl = torch.sum(
-                            torch.log(sigma_batch / old_sigma_batch + 1.e-5) + (torch.square(old_sigma_batch) + torch.square(old_mu_batch - mu_batch)) / (2.0 * torch.square(sigma_batch)) - 0.5, axis=-1)
-                        kl_mean = torch.mean(kl)
-
-                        if kl_mean > self.desired_kl * 2.0:
-                            self.learning_rate = max(1e-5, self.learning_rate / 1.5)
-                        elif kl_mean < self.desired_kl / 2.0 and kl_mean > 0.0:
-                            self.learning_rate = min(1e-2, self.learning_rate * 1.5)
-                        
-                        for param_group in self.optimizer.param_groups:
-                            param_group['lr'] = self.learning_rate
-
-
-                # Surrogate loss
-                ratio = torch.exp(actions_log_prob_batch - torch.squeeze(old_actions_log_prob_batch))
-                surrogate = -torch.squeeze(advantages_batch) * ratio
-                surrogate_clipped = -torch.squeeze(advantages_batch) * torch.clamp(ratio, 1.0 - self.clip_param,
-                                                                                1.0 + self.clip_param)
-                surrogate_loss = torch.max(surrogate, surrogate_clipped).mean()
-
-                # Value function loss
-                if self.use_clipped_value_loss:
-                    value_clipped = target_values_batch + (value_batch - target_values_batch).clamp(-self.clip_param,
-                                                                                                    self.clip_param)
-                    value_losses = (value_batch - returns_batch).pow(2)
-                    value_losses_clipped = (value_clipped - returns_batch).pow(2)
-                    value_loss = torch.max(value_losses, value_losses_clipped).mean()
-                else:
-                    value_loss = (returns_batch - value_batch).pow(2).mean()
-
-                loss = surrogate_loss + self.value_loss_coef * value_loss - self.entropy_coef * entropy_batch.mean()
+                with self.accelerator.autocast():
+                    self.actor_critic.act(obs_batch, masks=masks_batch, hidden_states=hid_states_batch[0])
+                    actions_log_prob_batch = self.actor_critic.get_actions_log_prob(actions_batch)
+                    value_batch = self.actor_critic.evaluate(critic_obs_batch, masks=masks_batch, hidden_states=hid_states_batch[1])
+                    mu_batch = self.actor_critic.action_mean
+                    sigma_batch = self.actor_critic.action_std
+                    entropy_batch = self.actor_critic.entropy
+
+                    # KL
+                    if self.desired_kl is not None and self.schedule == "adaptive":
+                        with torch.inference_mode():
+                            kl_mean = self.accelerator.kl_mean(mu_batch, sigma_batch, old_mu_batch, old_sigma_batch)
+                            self.accelerator.adapt_learning_rate(kl_mean, self.desired_kl)
+
+
+                    # Surrogate loss
+                    surrogate_loss = self.accelerator.surrogate_loss(
+                        actions_log_prob_batch, old_actions_log_prob_batch, advantages_batch, self.clip_param
+                    )
+
+                    # Value function loss
+                    value_loss = self.accelerator.value_loss(
+                        value_batch, target_values_batch, returns_batch, self.clip_param, self.use_clipped_value_loss
+                    )
+
+                    loss = surrogate_loss + self.value_loss_coef * value_loss - self.entropy_coef * entropy_batch.mean()
 
                 # Gradient step
-                self.optimizer.zero_grad()
-                loss.backward()
-                nn.utils.clip_grad_norm_(self.actor_critic.parameters(), self.max_grad_norm)
-                self.optimizer.step()
+                self.accelerator.step(loss, self.actor_critic.parameters(), self.max_grad_norm)
 
-                mean_value_loss += value_loss.item()
-                mean_surrogate_loss += surrogate_loss.item()
+                mean_value_loss += value_loss.detach()
+                mean_surrogate_loss += surrogate_loss.detach()
 
         num_updates = self.num_learning_epochs * self.num_mini_batches
         mean_value_loss /= num_updates
         mean_surrogate_loss /= num_updates
+        # read the losses back once per update instead of once per minibatch
+        mean_value_loss, mean_surrogate_loss = (
+            float(value) for value in (mean_value_loss, mean_surrogate_loss)
+        )
+        self.learning_rate = self.accelerator.learning_rate
         self.storage.clear()
 
         return mean_value_loss, mean_surrogate_loss
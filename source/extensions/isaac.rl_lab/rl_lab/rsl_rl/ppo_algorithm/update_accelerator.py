@@ -0,0 +1,189 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Shared PPO loss terms and the opt-in accelerated update path of the PPO algorithms."""
+
+from __future__ import annotations
+
+import contextlib
+
+import torch
+import torch.nn as nn
+
+
+def gaussian_kl_mean(mu, sigma, old_mu, old_sigma):
+    """Mean KL divergence between the old and the current diagonal Gaussian policies."""
+    kl = torch.sum(
+        torch.log(sigma / old_sigma + 1.0e-5)
+        + (torch.square(old_sigma) + torch.square(old_mu - mu)) / (2.0 * torch.square(sigma))
+        - 0.5,
+        axis=-1,
+    )
+    return torch.mean(kl)
+
+
+def clipped_surrogate_loss(actions_log_prob, old_actions_log_prob, advantages, clip_param: float):
+    """PPO clipped surrogate loss."""
+    ratio = torch.exp(actions_log_prob - torch.squeeze(old_actions_log_prob))
+    surrogate = -torch.squeeze(advantages) * ratio
+    surrogate_clipped = -torch.squeeze(advantages) * torch.clamp(ratio, 1.0 - clip_param, 1.0 + clip_param)
+    return torch.max(surrogate, surrogate_clipped).mean()
+
+
+def value_function_loss(
+    value, target_values, returns, clip_param: float, use_clipped_value_loss: bool, loss_bound: float | None = None
+):
+    """Value function loss, optionally clipped around the old values.
+
+    ``loss_bound`` clamps the per-sample losses to [-loss_bound, loss_bound] before the mean (used by AMP-PPO).
+    """
+    if not use_clipped_value_loss:
+        return (returns - value).pow(2).mean()
+    value_clipped = target_values + (value - target_values).clamp(-clip_param, clip_param)
+    value_losses = (value - returns).pow(2)
+    value_losses_clipped = (value_clipped - returns).pow(2)
+    if loss_bound is not None:
+        value_losses = torch.clamp(value_losses, -loss_bound, loss_bound)
+        value_losses_clipped = torch.clamp(value_losses_clipped, -loss_bound, loss_bound)
+    return torch.max(value_losses, value_losses_clipped).mean()
+
+
+class UpdateAccelerator:
+    """Runs the optimizer side of a PPO update, either eagerly (default) or in the accelerated mode.
+
+    Disabled, it reproduces the original update exactly: fp32 eager losses, Python-side adaptive learning rate and a
+    plain ``zero_grad`` / ``backward`` / ``clip_grad_norm_`` / ``step``.
+
+    Enabled, it
+      * runs the forward pass and the losses under :func:`torch.autocast` (``"bf16"`` or ``"fp16"``; fp16 uses a
+        :class:`torch.amp.GradScaler`),
+      * keeps the learning rate in a device tensor shared by all optimizer param groups and adapts it to the KL with
+        ``torch.where``, so no minibatch waits on ``kl_mean``,
+      * optionally compiles the KL, surrogate and value loss terms with :func:`torch.compile` (static shapes, as
+        the minibatch size does not change within an update). Only these terms are compiled: the actor/critic
+        forward, the backward pass and the optimizer step stay eager, so no ``compile_mode`` captures the whole
+        minibatch step in a CUDA graph.
+
+    On CPU it falls back to bf16 autocast without a grad scaler, an unfused optimizer that receives a float copy of
+    the learning rate before every step, and ``"reduce-overhead"`` to the default compile mode, so the same
+    configuration can be tested without a GPU.
+    """
+
+    def __init__(
+        self,
+        optimizer: torch.optim.Optimizer,
+        learning_rate: float,
+        device="cpu",
+        enabled: bool = False,
+        precision: str | None = "bf16",
+        compile_mode: str | None = None,
+        min_lr: float = 1e-5,
+        max_lr: float = 1e-2,
+    ):
+        self.device = torch.device(device)
+        self.enabled = enabled
+        self.min_lr = min_lr
+        self.max_lr = max_lr
+        self.on_cuda = self.device.type == "cuda"
+
+        self.autocast_dtype = None
+        self.scaler = None
+        self.kl_mean = gaussian_kl_mean
+        self.surrogate_loss = clipped_surrogate_loss
+        self.value_loss = value_function_loss
+
+        if not enabled:
+            self.optimizer = optimizer
+            self._learning_rate = learning_rate
+            return
+
+        if precision is not None:
+            if precision not in ("bf16", "fp16"):
+                raise ValueError(f"Unknown update precision: {precision}")
+            self.autocast_dtype = torch.float16 if precision == "fp16" and self.on_cuda else torch.bfloat16
+        if self.autocast_dtype == torch.float16:
+            self.scaler = torch.amp.GradScaler(self.device.type)
+
+        # learning rate on device, shared by every param group; a fused Adam accepts it without syncing.
+        # The unfused CPU optimizers take a float, copied from the CPU tensor before every step.
+        self.lr = torch.tensor(float(learning_rate), device=self.device)
+        self.fused = self.on_cuda
+        group_lr = self.lr if self.fused else float(learning_rate)
+        self._group_lr = group_lr
+        groups = []
+        for group in optimizer.param_groups:
+            group = {k: v for k, v in group.items() if k not in ("lr", "foreach", "fused", "capturable")}
+            group["lr"] = group_lr
+            groups.append(group)
+        self.optimizer = type(optimizer)(groups, lr=group_lr, fused=self.fused)
+
+        if compile_mode is not None:
+            # only the loss terms are compiled, see the class docstring
+            if compile_mode == "reduce-overhead" and not self.on_cuda:
+                compile_mode = "default"
+            self.kl_mean = torch.compile(gaussian_kl_mean, mode=compile_mode, dynamic=False)
+            self.surrogate_loss = torch.compile(clipped_surrogate_loss, mode=compile_mode, dynamic=False)
+            self.value_loss = torch.compile(value_function_loss, mode=compile_mode, dynamic=False)
+
+    @property
+    def learning_rate(self) -> float:
+        """Current learning rate. Reads the device value back in the accelerated mode."""
+        if self.enabled:
+            return self.lr.item()
+        return self._learning_rate
+
+    def autocast(self):
+        """Context for the forward pass and the losses."""
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype)
+
+    def adapt_learning_rate(self, kl_mean, desired_kl: float):
+        """Adaptive-KL learning rate schedule: divide by 1.5 above 2x the target KL, multiply below half of it."""
+        if not self.enabled:
+            if kl_mean > desired_kl * 2.0:
+                self._learning_rate = max(self.min_lr, self._learning_rate / 1.5)
+            elif kl_mean < desired_kl / 2.0 and kl_mean > 0.0:
+                self._learning_rate = min(self.max_lr, self._learning_rate * 1.5)
+            for param_group in self.optimizer.param_groups:
+                param_group["lr"] = self._learning_rate
+            return
+        kl_mean = kl_mean.float()
+        increase = (kl_mean < desired_kl / 2.0) & (kl_mean > 0.0)
+        new_lr = torch.where(
+            kl_mean > desired_kl * 2.0,
+            (self.lr / 1.5).clamp(min=self.min_lr),
+            torch.where(increase, (self.lr * 1.5).clamp(max=self.max_lr), self.lr),
+        )
+        self.lr.copy_(new_lr)
+
+    def step(self, loss, clip_parameters, max_grad_norm: float):
+        """Backward pass, gradient clipping of ``clip_parameters`` and optimizer step."""
+        if not self.enabled:
+            self.optimizer.zero_grad()
+            loss.backward()
+            nn.utils.clip_grad_norm_(clip_parameters, max_grad_norm)
+            self.optimizer.step()
+            return
+        self._attach_learning_rate()
+        self.optimizer.zero_grad(set_to_none=True)
+        if self.scaler is None:
+            loss.backward()
+            nn.utils.clip_grad_norm_(clip_parameters, max_grad_norm)
+            self.optimizer.step()
+        else:
+            self.scaler.scale(loss).backward()
+            self.scaler.unscale_(self.optimizer)
+            nn.utils.clip_grad_norm_(clip_parameters, max_grad_norm)
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
+
+    def _attach_learning_rate(self):
+        # optimizer.load_state_dict() puts the saved float learning rate back into the param groups
+        for param_group in self.optimizer.param_groups:
+            if param_group["lr"] is not self._group_lr:
+                self.lr.fill_(float(param_group["lr"]))
+                break
+        self._group_lr = self.lr if self.fused else self.lr.item()
+        for param_group in self.optimizer.param_groups:
+            param_group["lr"] = self._group_lr
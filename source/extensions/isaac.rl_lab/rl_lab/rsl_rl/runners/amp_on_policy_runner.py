@@ -4,7 +4,6 @@ import os
 import statistics
 import time
 import torch
-from collections import deque
 from torch.utils.tensorboard import SummaryWriter as TensorboardSummaryWriter
 
 
@@ -14,7 +13,7 @@ from ..modules import ActorCritic, ActorCriticRecurrent, EmpiricalNormalization
 from ..ppo_algorithm import AMPPPO
 from ..ppo_algorithm import AMPDiscriminator
 from ..datasets_for_txt.motion_loader import AMPLoader
-from ..utils import store_code_state
+from ..utils import EpisodeStatistics, store_code_state
 from ..utils.amp_utils import Normalizer
 from ...assets.loder_for_algs import AmpMotion
 
@@ -41,7 +40,7 @@ class AmpOnPolicyRunner:
 
         amp_data = self.env.unwrapped.amp_loader
         
-        amp_normalizer = Normalizer(amp_data.amp_obs_num)
+        amp_normalizer = Normalizer(amp_data.amp_obs_num, device=self.device)
         discriminator = AMPDiscriminator(
             amp_data.amp_obs_num * 2,
             self.cfg["amp_reward_coef"],
@@ -65,8 +64,12 @@ class AmpOnPolicyRunner:
         self.save_interval = self.cfg["save_interval"]
         self.empirical_normalization = self.cfg["empirical_normalization"]
         if self.empirical_normalization:
-            self.obs_normalizer = EmpiricalNormalization(shape=[num_obs], until=1.0e8).to(self.device)
-            self.critic_obs_normalizer = EmpiricalNormalization(shape=[num_critic_obs], until=1.0e8).to(self.device)
+            self.obs_normalizer = EmpiricalNormalization(
+                shape=[num_obs], until=1.0e8, update_interval=self.cfg.get("empirical_normalization_interval", 1)
+            ).to(self.device)
+            self.critic_obs_normalizer = EmpiricalNormalization(
+                shape=[num_critic_obs], until=1.0e8, update_interval=self.cfg.get("empirical_normalization_interval", 1)
+            ).to(self.device)
         else:
             self.obs_normalizer = torch.nn.Identity()  # no normalization
             self.critic_obs_normalizer = torch.nn.Identity()  # no normalization
@@ -122,10 +125,7 @@ class AmpOnPolicyRunner:
         self.train_mode()  # switch to train mode (for dropout for example)
 
         ep_infos = []
-        rewbuffer = deque(maxlen=100)
-        lenbuffer = deque(maxlen=100)
-        cur_reward_sum = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
-        cur_episode_length = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
+        episode_stats = EpisodeStatistics(self.env.num_envs, buffer_size=100, device=self.device)
 
         start_iter = self.current_learning_iteration
         tot_iter = start_iter + num_learning_iterations
@@ -168,13 +168,7 @@ class AmpOnPolicyRunner:
                             ep_infos.append(infos["episode"])
                         elif "log" in infos:
                             ep_infos.append(infos["log"])
-                        cur_reward_sum += rewards
-                        cur_episode_length += 1
-                        new_ids = (dones > 0).nonzero(as_tuple=False)
-                        rewbuffer.extend(cur_reward_sum[new_ids][:, 0].cpu().numpy().tolist())
-                        lenbuffer.extend(cur_episode_length[new_ids][:, 0].cpu().numpy().tolist())
-                        cur_reward_sum[new_ids] = 0
-                        cur_episode_length[new_ids] = 0
+                        episode_stats.update(rewards, dones)
 
                 stop = time.time()
                 collection_time = stop - start
@@ -210,6 +204,7 @@ class AmpOnPolicyRunner:
         self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration + 1}.pt"))
 
     def log(self, locs: dict, width: int = 80, pad: int = 35):
+        rewbuffer, lenbuffer = locs["episode_stats"].read()
         self.tot_timesteps += self.num_steps_per_env * self.env.num_envs
         self.tot_time += locs["collection_time"] + locs["learn_time"]
         iteration_time = locs["collection_time"] + locs["learn_time"]
@@ -245,20 +240,20 @@ class AmpOnPolicyRunner:
         self.writer.add_scalar("Perf/total_fps", fps, locs["it"])
         self.writer.add_scalar("Perf/collection time", locs["collection_time"], locs["it"])
         self.writer.add_scalar("Perf/learning_time", locs["learn_time"], locs["it"])
-        if len(locs["rewbuffer"]) > 0:
-            self.writer.add_scalar("Train/mean_reward", statistics.mean(locs["rewbuffer"]), locs["it"])
-            self.writer.add_scalar("Train/mean_episode_length", statistics.mean(locs["lenbuffer"]), locs["it"])
+        if len(rewbuffer) > 0:
+            self.writer.add_scalar("Train/mean_reward", statistics.mean(rewbuffer), locs["it"])
+            self.writer.add_scalar("Train/mean_episode_length", statistics.mean(lenbuffer), locs["it"])
             if self.logger_type != "wandb":  # wandb does not support non-integer x-axis logging
-                self.writer.add_scalar("Train/mean_reward/time", statistics.mean(locs["rewbuffer"]), self.tot_time)
+                self.writer.add_scalar("Train/mean_reward/time", statistics.mean(rewbuffer), self.tot_time)
                 self.writer.add_scalar(
-                    "Train/mean_episode_length/time", statistics.mean(locs["lenbuffer"]), self.tot_time
+                    "Train/mean_episode_length/time", statistics.mean(lenbuffer), self.tot_time
                 )
         self.writer.add_scalar("Loss/AMP", locs["mean_amp_loss"], locs["it"])
         self.writer.add_scalar("Loss/AMP_grad", locs["mean_grad_pen_loss"], locs["it"])
 
         str = f" \033[1m Learning iteration {locs['it']}/{locs['tot_iter']} \033[0m "
 
-        if len(locs["rewbuffer"]) > 0:
+        if len(rewbuffer) > 0:
             log_string = (
                 f"""{'#' * width}\n"""
                 f"""{str.center(width, ' ')}\n\n"""
@@ -267,8 +262,8 @@ class AmpOnPolicyRunner:
                 f"""{'Value function loss:':>{pad}} {locs['mean_value_loss']:.4f}\n"""
                 f"""{'Surrogate loss:':>{pad}} {locs['mean_surrogate_loss']:.4f}\n"""
                 f"""{'Mean action noise std:':>{pad}} {mean_std.item():.2f}\n"""
-                f"""{'Mean reward:':>{pad}} {statistics.mean(locs['rewbuffer']):.2f}\n"""
-                f"""{'Mean episode length:':>{pad}} {statistics.mean(locs['lenbuffer']):.2f}\n"""
+                f"""{'Mean reward:':>{pad}} {statistics.mean(rewbuffer):.2f}\n"""
+                f"""{'Mean episode length:':>{pad}} {statistics.mean(lenbuffer):.2f}\n"""
                 f"""{'AMP loss:':>{pad}} {locs['mean_amp_loss']:.4f}\n"""
                 f"""{'AMP grad pen loss:':>{pad}} {locs['mean_grad_pen_loss']:.4f}\n"""
                 f"""{'AMP mean policy pred:':>{pad}} {locs['mean_policy_pred']:.4f}\n"""
@@ -359,12 +354,14 @@ class AmpOnPolicyRunner:
 
     def train_mode(self):
         self.alg.actor_critic.train()
+        self.alg.amp_normalizer.unfreeze()
         if self.empirical_normalization:
             self.obs_normalizer.train()
             self.critic_obs_normalizer.train()
 
     def eval_mode(self):
         self.alg.actor_critic.eval()
+        self.alg.amp_normalizer.freeze()
         if self.empirical_normalization:
             self.obs_normalizer.eval()
             self.critic_obs_normalizer.eval()
@@ -7,14 +7,13 @@ import os
 import statistics
 import time
 import torch
-from collections import deque
 from torch.utils.tensorboard import SummaryWriter as TensorboardSummaryWriter
 
 from ... import rsl_rl
 from ..ppo_algorithm import ASEPPO
 from ..env import VecEnv
 from ..modules import ActorCritic, ActorCriticRecurrent, EmpiricalNormalization, PMC ,ASEagent
-from ..utils import store_code_state
+from ..utils import EpisodeStatistics, store_code_state
 from ..datasets_for_txt.motion_loader import AMPLoader
 
 class ASEOnPolicyRunner:
@@ -46,8 +45,12 @@ class ASEOnPolicyRunner:
         self.save_interval = self.cfg["save_interval"]
         self.empirical_normalization = self.cfg["empirical_normalization"]
         if self.empirical_normalization:
-            self.obs_normalizer = EmpiricalNormalization(shape=[num_obs], until=1.0e8).to(self.device)
-            self.critic_obs_normalizer = EmpiricalNormalization(shape=[num_critic_obs], until=1.0e8).to(self.device)
+            self.obs_normalizer = EmpiricalNormalization(
+                shape=[num_obs], until=1.0e8, update_interval=self.cfg.get("empirical_normalization_interval", 1)
+            ).to(self.device)
+            self.critic_obs_normalizer = EmpiricalNormalization(
+                shape=[num_critic_obs], until=1.0e8, update_interval=self.cfg.get("empirical_normalization_interval", 1)
+            ).to(self.device)
         else:
             self.obs_normalizer = torch.nn.Identity()  # no normalization
             self.critic_obs_normalizer = torch.nn.Identity()  # no normalization
@@ -113,10 +116,8 @@ class ASEOnPolicyRunner:
         self.train_mode()  # switch to train mode (for dropout for example)
 
         ep_infos = []
-        rewbuffer = deque(maxlen=100)
-        lenbuffer = deque(maxlen=100)
-        cur_reward_sum = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
-        cur_episode_length = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
+        episode_stats = EpisodeStatistics(self.env.num_envs, buffer_size=100, device=self.device)
+        cur_episode_length = episode_stats.cur_episode_length
         
         start_iter = self.current_learning_iteration
         tot_iter = start_iter + num_learning_iterations
@@ -166,13 +167,7 @@ class ASEOnPolicyRunner:
                             ep_infos.append(infos["episode"])
                         elif "log" in infos:
                             ep_infos.append(infos["log"])
-                        cur_reward_sum += rewards
-                        cur_episode_length += 1
-                        new_ids = (dones > 0).nonzero(as_tuple=False)
-                        rewbuffer.extend(cur_reward_sum[new_ids][:, 0].cpu().numpy().tolist())
-                        lenbuffer.extend(cur_episode_length[new_ids][:, 0].cpu().numpy().tolist())
-                        cur_reward_sum[new_ids] = 0
-                        cur_episode_length[new_ids] = 0
+                        episode_stats.update(rewards, dones)
 
                 stop = time.time()
                 collection_time = stop - start
@@ -209,6 +204,7 @@ class ASEOnPolicyRunner:
         self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration}.pt"))
 
     def log(self, locs: dict, width: int = 80, pad: int = 35):
+        rewbuffer, lenbuffer = locs["episode_stats"].read()
         self.tot_timesteps += self.num_steps_per_env * self.env.num_envs
         self.tot_time += locs["collection_time"] + locs["learn_time"]
         iteration_time = locs["collection_time"] + locs["learn_time"]
@@ -249,18 +245,18 @@ class ASEOnPolicyRunner:
         self.writer.add_scalar("Perf/total_fps", fps, locs["it"])
         self.writer.add_scalar("Perf/collection time", locs["collection_time"], locs["it"])
         self.writer.add_scalar("Perf/learning_time", locs["learn_time"], locs["it"])
-        if len(locs["rewbuffer"]) > 0:
-            self.writer.add_scalar("Train/mean_reward", statistics.mean(locs["rewbuffer"]), locs["it"])
-            self.writer.add_scalar("Train/mean_episode_length", statistics.mean(locs["lenbuffer"]), locs["it"])
+        if len(rewbuffer) > 0:
+            self.writer.add_scalar("Train/mean_reward", statistics.mean(rewbuffer), locs["it"])
+            self.writer.add_scalar("Train/mean_episode_length", statistics.mean(lenbuffer), locs["it"])
             if self.logger_type != "wandb":  # wandb does not support non-integer x-axis logging
-                self.writer.add_scalar("Train/mean_reward/time", statistics.mean(locs["rewbuffer"]), self.tot_time)
+                self.writer.add_scalar("Train/mean_reward/time", statistics.mean(rewbuffer), self.tot_time)
                 self.writer.add_scalar(
-                    "Train/mean_episode_length/time", statistics.mean(locs["lenbuffer"]), self.tot_time
+                    "Train/mean_episode_length/time", statistics.mean(lenbuffer), self.tot_time
                 )
 
         str = f" \033[1m Learning iteration {locs['it']}/{locs['tot_iter']} \033[0m "
 
-        if len(locs["rewbuffer"]) > 0:
+        if len(rewbuffer) > 0:
             log_string = (
                 f"""{'#' * width}\n"""
                 f"""{str.center(width, ' ')}\n\n"""
@@ -274,8 +270,8 @@ class ASEOnPolicyRunner:
                 f"""{'Encoder loss:':>{pad}} {locs['mean_enc_loss']:.4f}\n"""
                 f"""{'Diversity loss:':>{pad}} {locs['mean_diversity_loss']:.4f}\n"""
                 f"""{'Mean action noise std:':>{pad}} {mean_std.item():.2f}\n"""
-                f"""{'Mean reward:':>{pad}} {statistics.mean(locs['rewbuffer']):.2f}\n"""
-                f"""{'Mean episode length:':>{pad}} {statistics.mean(locs['lenbuffer']):.2f}\n"""
+                f"""{'Mean reward:':>{pad}} {statistics.mean(rewbuffer):.2f}\n"""
+                f"""{'Mean episode length:':>{pad}} {statistics.mean(lenbuffer):.2f}\n"""
             ) 
             #   f"""{'Mean reward/step:':>{pad}} {locs['mean_reward']:.2f}\n"""
             #   f"""{'Mean episode length/episode:':>{pad}} {locs['mean_trajectory_length']:.2f}\n""")
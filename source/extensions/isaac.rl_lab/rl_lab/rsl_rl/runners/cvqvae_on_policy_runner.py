@@ -7,14 +7,13 @@ import os
 import statistics
 import time
 import torch
-from collections import deque
 from torch.utils.tensorboard import SummaryWriter as TensorboardSummaryWriter
 import csv
 from ... import rsl_rl
 from ..ppo_algorithm import CVQVAEPPO as PPO
 from ..env import VecEnv
 from ..modules import ActorCritic, ActorCriticRecurrent, EmpiricalNormalization, CVQVAE
-from ..utils import store_code_state
+from ..utils import EpisodeStatistics, store_code_state
 
 class CvqvaeOnPolicyRunner:
     """On-policy runner for training and evaluation."""
@@ -42,8 +41,12 @@ class CvqvaeOnPolicyRunner:
         self.save_interval = self.cfg["save_interval"]
         self.empirical_normalization = self.cfg["empirical_normalization"]
         if self.empirical_normalization:
-            self.obs_normalizer = EmpiricalNormalization(shape=[num_obs], until=1.0e8).to(self.device)
-            self.critic_obs_normalizer = EmpiricalNormalization(shape=[num_critic_obs], until=1.0e8).to(self.device)
+            self.obs_normalizer = EmpiricalNormalization(
+                shape=[num_obs], until=1.0e8, update_interval=self.cfg.get("empirical_normalization_interval", 1)
+            ).to(self.device)
+            self.critic_obs_normalizer = EmpiricalNormalization(
+                shape=[num_critic_obs], until=1.0e8, update_interval=self.cfg.get("empirical_normalization_interval", 1)
+            ).to(self.device)
         else:
             self.obs_normalizer = torch.nn.Identity()  # no normalization
             self.critic_obs_normalizer = torch.nn.Identity()  # no normalization
@@ -96,10 +99,7 @@ class CvqvaeOnPolicyRunner:
         self.train_mode()  # switch to train mode (for dropout for example)
 
         ep_infos = []
-        rewbuffer = deque(maxlen=100)
-        lenbuffer = deque(maxlen=100)
-        cur_reward_sum = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
-        cur_episode_length = torch.zeros(self.env.num_envs, dtype=torch.float, device=self.device)
+        episode_stats = EpisodeStatistics(self.env.num_envs, buffer_size=100, device=self.device)
 
         start_iter = self.current_learning_iteration
         tot_iter = start_iter + num_learning_iterations
@@ -133,13 +133,7 @@ class CvqvaeOnPolicyRunner:
                             ep_infos.append(infos["episode"])
                         elif "log" in infos:
                             ep_infos.append(infos["log"])
-                        cur_reward_sum += rewards
-                        cur_episode_length += 1
-                        new_ids = (dones > 0).nonzero(as_tuple=False)
-                        rewbuffer.extend(cur_reward_sum[new_ids][:, 0].cpu().numpy().tolist())
-                        lenbuffer.extend(cur_episode_length[new_ids][:, 0].cpu().numpy().tolist())
-                        cur_reward_sum[new_ids] = 0
-                        cur_episode_length[new_ids] = 0
+                        episode_stats.update(rewards, dones)
 
                 stop = time.time()
                 collection_time = stop - start
@@ -168,6 +162,7 @@ class CvqvaeOnPolicyRunner:
         self.save(os.path.join(self.log_dir, f"model_{self.current_learning_iteration}.pt"))
 
     def log(self, locs: dict, width: int = 80, pad: int = 35):
+        rewbuffer, lenbuffer = locs["episode_stats"].read()
         self.tot_timesteps += self.num_steps_per_env * self.env.num_envs
         self.tot_time += locs["collection_time"] + locs["learn_time"]
         iteration_time = locs["collection_time"] + locs["learn_time"]
@@ -203,18 +198,26 @@ class CvqvaeOnPolicyRunner:
         self.writer.add_scalar("Perf/total_fps", fps, locs["it"])
         self.writer.add_scalar("Perf/collection time", locs["collection_time"], locs["it"])
         self.writer.add_scalar("Perf/learning_time", locs["learn_time"], locs["it"])
-        if len(locs["rewbuffer"]) > 0:
-            self.writer.add_scalar("Train/mean_reward", statistics.mean(locs["rewbuffer"]), locs["it"])
-            self.writer.add_scalar("Train/mean_episode_length", statistics.mean(locs["lenbuffer"]), locs["it"])
+        codebook_string = ""
+        codebook = getattr(self.alg.actor_critic, "codebook", None)
+        if codebook is not None:
+            # reading the stats syncs with the device once per iteration
+            reinit_stats = codebook.reinit.stats()
+            for key, value in reinit_stats.items():
+                self.writer.add_scalar("Codebook/reinit_" + key, value, locs["it"])
+            codebook_string = f"""{'Revived codes (last/total):':>{pad}} {reinit_stats['last_revived']}/{reinit_stats['revived']}\n"""
+        if len(rewbuffer) > 0:
+            self.writer.add_scalar("Train/mean_reward", statistics.mean(rewbuffer), locs["it"])
+            self.writer.add_scalar("Train/mean_episode_length", statistics.mean(lenbuffer), locs["it"])
             if self.logger_type != "wandb":  # wandb does not support non-integer x-axis logging
-                self.writer.add_scalar("Train/mean_reward/time", statistics.mean(locs["rewbuffer"]), self.tot_time)
+                self.writer.add_scalar("Train/mean_reward/time", statistics.mean(rewbuffer), self.tot_time)
                 self.writer.add_scalar(
-                    "Train/mean_episode_length/time", statistics.mean(locs["lenbuffer"]), self.tot_time
+                    "Train/mean_episode_length/time", statistics.mean(lenbuffer), self.tot_time
                 )
 
         str = f" \033[1m Learning iteration {locs['it']}/{locs['tot_iter']} \033[0m "
 
-        if len(locs["rewbuffer"]) > 0:
+        if len(rewbuffer) > 0:
             log_string = (
                 f"""{'#' * width}\n"""
                 f"""{str.center(width, ' ')}\n\n"""
@@ -226,8 +229,8 @@ class CvqvaeOnPolicyRunner:
                 f"""{'Surrogate loss:':>{pad}} {locs['mean_surrogate_loss']}\n"""
                 f"""{'Mean action noise std:':>{pad}} {mean_std.item()}\n"""
                 f"""{'learning_rate:':>{pad}} {self.alg.learning_rate}\n"""
-                f"""{'Mean reward:':>{pad}} {statistics.mean(locs['rewbuffer'])}\n"""
-                f"""{'Mean episode length:':>{pad}} {statistics.mean(locs['lenbuffer'])}\n"""
+                f"""{'Mean reward:':>{pad}} {statistics.mean(rewbuffer)}\n"""
+                f"""{'Mean episode length:':>{pad}} {statistics.mean(lenbuffer)}\n"""
             )
             #   f"""{'Mean reward/step:':>{pad}} {locs['mean_reward']:.2f}\n"""
             #   f"""{'Mean episode length/episode:':>{pad}} {locs['mean_trajectory_length']:.2f}\n""")
@@ -244,6 +247,7 @@ class CvqvaeOnPolicyRunner:
             #   f"""{'Mean reward/step:':>{pad}} {locs['mean_reward']:.2f}\n"""
             #   f"""{'Mean episode length/episode:':>{pad}} {locs['mean_trajectory_length']:.2f}\n""")
 
+        log_string += codebook_string
         log_string += ep_string
         log_string += (
             f"""{'-' * width}\n"""
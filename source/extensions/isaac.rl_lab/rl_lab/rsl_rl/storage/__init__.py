@@ -7,9 +7,10 @@ from .rollout_storage import RolloutStorage
 from .ASEstorage import ASERolloutStorage
 from .replay_buffer import ReplayBuffer
 from .him_rollout_storage import HIMRolloutStorage
+from .gae import compute_gae
 
 
 __all__ = [
     "RolloutStorage","ASERolloutStorage","ReplayBuffer",
-    "HIMRolloutStorage",
+    "HIMRolloutStorage","compute_gae",
     ]
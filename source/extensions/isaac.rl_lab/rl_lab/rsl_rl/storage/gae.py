@@ -0,0 +1,67 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+"""Generalized Advantage Estimation shared by the rollout storages."""
+
+from __future__ import annotations
+
+import torch
+
+
+@torch.jit.script
+def _reverse_discounted_scan(deltas: torch.Tensor, discounts: torch.Tensor, advantages: torch.Tensor):
+    """advantages[t] = deltas[t] + discounts[t] * advantages[t + 1], written in place, one kernel per step."""
+    num_steps = deltas.shape[0]
+    advantages[num_steps - 1].copy_(deltas[num_steps - 1])
+    for step in range(num_steps - 2, -1, -1):
+        torch.addcmul(deltas[step], discounts[step], advantages[step + 1], out=advantages[step])
+
+
+def compute_gae(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    dones: torch.Tensor,
+    last_values: torch.Tensor,
+    gamma: float,
+    lam: float,
+    returns: torch.Tensor,
+    advantages: torch.Tensor,
+    time_outs: torch.Tensor | None = None,
+    normalize: str | None = "global",
+):
+    """Compute the GAE returns and advantages of a rollout in place.
+
+    The TD errors of all steps are computed in one batched expression, only the reverse recursion is a loop.
+
+    Args:
+        rewards: Rewards of shape (num_steps, num_envs, 1).
+        values: Value estimates of shape (num_steps, num_envs, 1).
+        dones: Episode terminations of shape (num_steps, num_envs, 1).
+        last_values: Value estimate of the observation after the last step, shape (num_envs, 1).
+        gamma: Discount factor.
+        lam: GAE lambda.
+        returns: Output buffer for the returns, same shape as ``values``.
+        advantages: Output buffer for the advantages, same shape as ``values``.
+        time_outs: Optional truncations of shape (num_steps, num_envs, 1). A timed-out step is bootstrapped with
+            its own value estimate instead of being treated as terminal. Leave this as None when the rewards were
+            already bootstrapped in ``process_env_step``.
+        normalize: ``"global"`` to normalize the advantages over the whole rollout, ``"per_env"`` to normalize
+            every environment over its own steps, or None to keep them unnormalized.
+    """
+    not_done = 1.0 - dones.float()
+    if time_outs is not None:
+        rewards = rewards + gamma * values * time_outs.float()
+    next_values = torch.cat((values[1:], last_values.unsqueeze(0)), dim=0)
+    deltas = rewards + not_done * gamma * next_values - values
+    _reverse_discounted_scan(deltas, not_done.mul_(gamma * lam), advantages)
+    torch.add(advantages, values, out=returns)
+
+    if normalize == "global":
+        mean, std = advantages.mean(), advantages.std()
+        advantages.sub_(mean).div_(std + 1e-8)
+    elif normalize == "per_env":
+        mean, std = advantages.mean(dim=0, keepdim=True), advantages.std(dim=0, keepdim=True)
+        advantages.sub_(mean).div_(std + 1e-8)
+    elif normalize is not None:
+        raise ValueError(f"Unknown advantage normalization: {normalize}")
+    return returns, advantages
@@ -33,6 +33,8 @@ import numpy as np
 
 from rsl_rl.utils import split_and_pad_trajectories
 
+from .gae import compute_gae
+
 class HIMRolloutStorage:
     class Transition:
         def __init__(self):
@@ -101,21 +103,19 @@ class HIMRolloutStorage:
     def clear(self):
         self.step = 0
 
-    def compute_returns(self, last_values, gamma, lam):
-        advantage = 0
-        for step in reversed(range(self.num_transitions_per_env)):
-            if step == self.num_transitions_per_env - 1:
-                next_values = last_values
-            else:
-                next_values = self.values[step + 1]
-            next_is_not_terminal = 1.0 - self.dones[step].float()
-            delta = self.rewards[step] + next_is_not_terminal * gamma * next_values - self.values[step]
-            advantage = delta + next_is_not_terminal * gamma * lam * advantage
-            self.returns[step] = advantage + self.values[step]
-
-        # Compute and normalize the advantages
-        self.advantages = self.returns - self.values
-        self.advantages = (self.advantages - self.advantages.mean()) / (self.advantages.std() + 1e-8)
+    def compute_returns(self, last_values, gamma, lam, time_outs=None, normalize_advantages="global"):
+        compute_gae(
+            self.rewards,
+            self.values,
+            self.dones,
+            last_values,
+            gamma,
+            lam,
+            self.returns,
+            self.advantages,
+            time_outs=time_outs,
+            normalize=normalize_advantages,
+        )
 
     def get_statistics(self):
         done = self.dones
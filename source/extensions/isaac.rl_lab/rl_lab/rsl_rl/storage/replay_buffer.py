@@ -1,23 +1,51 @@
-import numpy as np
 import torch
 
 
 class ReplayBuffer:
-    """Fixed-size buffer to store experience tuples."""
+    """Fixed-size buffer to store experience tuples.
 
-    def __init__(self, obs_dim, buffer_size, device):
+    All sampling happens on ``device``: the indices of every mini-batch of an update are drawn in one
+    ``torch.randint`` (or ``torch.multinomial`` when prioritized) call and gathered into a persistent
+    block, so iterating the generator neither copies indices from the host nor allocates new tensors.
+    """
+
+    def __init__(self, obs_dim, buffer_size, device, dtype=None, prioritized=False, priority_alpha=0.6, priority_eps=1e-3):
         """Initialize a ReplayBuffer object.
         Arguments:
+            obs_dim (int): dimension of a single state
             buffer_size (int): maximum size of buffer
+            device (str): device of the storage and of the sampled batches
+            dtype (torch.dtype): storage dtype, e.g. torch.float16 / torch.bfloat16 to halve the memory.
+                Sampled batches are always returned as float32. Default is float32.
+            prioritized (bool): sample transitions proportional to ``priority ** priority_alpha``
+                instead of uniformly, see :meth:`update_priorities`.
+            priority_alpha (float): how strongly the priorities shape the sampling distribution.
+            priority_eps (float): lower bound added to every priority so no transition starves.
         """
-        self.states = torch.zeros(buffer_size, obs_dim).to(device)
-        self.next_states = torch.zeros(buffer_size, obs_dim).to(device)
+        self.dtype = torch.float32 if dtype is None else dtype
+        self.states = torch.zeros(buffer_size, obs_dim, dtype=self.dtype, device=device)
+        self.next_states = torch.zeros(buffer_size, obs_dim, dtype=self.dtype, device=device)
         self.buffer_size = buffer_size
         self.device = device
 
+        self.prioritized = prioritized
+        self.priority_alpha = priority_alpha
+        self.priority_eps = priority_eps
+        if self.prioritized:
+            self.priorities = torch.zeros(buffer_size, device=device)
+            # 0 维设备张量，更新和写入都不需要和主机同步
+            self.max_priority = torch.ones((), device=device)
+
         self.step = 0
         self.num_samples = 0
 
+        # 采样缓冲区，按需扩容后在之后的每次更新中复用
+        self._sample_idxs = None
+        self._sample_block = None
+        self._sample_block_fp32 = None
+        # 当前 mini-batch 在缓冲区中的索引，供 update_priorities 使用
+        self.last_idxs = None
+
     def insert(self, states, next_states):
         """Add new states to memory."""
 
@@ -35,10 +63,16 @@ class ReplayBuffer:
             # 将剩余的新状态放入缓冲区的后半部分
             self.states[: end_idx - self.buffer_size] = states[self.buffer_size - self.step :]
             self.next_states[: end_idx - self.buffer_size] = next_states[self.buffer_size - self.step :]
+            if self.prioritized:
+                self.priorities[self.step :] = self.max_priority
+                self.priorities[: end_idx - self.buffer_size] = self.max_priority
         else:
             # 直接将新状态放入缓冲区
             self.states[start_idx:end_idx] = states
             self.next_states[start_idx:end_idx] = next_states
+            if self.prioritized:
+                # 新样本使用当前最大优先级，保证至少被采到一次
+                self.priorities[start_idx:end_idx] = self.max_priority
 
         # 更新样本数量
         self.num_samples = min(self.buffer_size, max(end_idx, self.num_samples))
@@ -46,10 +80,49 @@ class ReplayBuffer:
         # 更新步长索引
         self.step = (self.step + num_states) % self.buffer_size
 
+    def update_priorities(self, idxs, scores):
+        """Set the priorities of the transitions at ``idxs``.
+
+        Arguments:
+            idxs (torch.Tensor): buffer indices, usually :attr:`last_idxs`
+            scores (torch.Tensor): non-negative scores of the transitions, e.g. the discriminator error
+                ``(D(s, s') + 1) ** 2`` of policy samples. Higher scores are sampled more often.
+        """
+        if not self.prioritized:
+            return
+        priorities = scores.detach().reshape(-1).float() + self.priority_eps
+        self.priorities[idxs] = priorities
+        torch.maximum(self.max_priority, priorities.max(), out=self.max_priority)
+
+    def _draw_indices(self, num_total):
+        if self.prioritized:
+            weights = self.priorities[: self.num_samples].pow(self.priority_alpha)
+            return torch.multinomial(weights, num_total, replacement=True)
+        if self._sample_idxs is None or self._sample_idxs.numel() != num_total:
+            self._sample_idxs = torch.empty(num_total, dtype=torch.long, device=self.device)
+        return torch.randint(0, self.num_samples, (num_total,), device=self.device, out=self._sample_idxs)
+
+    def _get_block(self, num_total):
+        shape = (2, num_total, self.states.shape[1])
+        if self._sample_block is None or self._sample_block.shape != shape:
+            self._sample_block = torch.empty(shape, dtype=self.dtype, device=self.device)
+            if self.dtype != torch.float32:
+                self._sample_block_fp32 = torch.empty(shape, dtype=torch.float32, device=self.device)
+        return self._sample_block
+
     def feed_forward_generator(self, num_mini_batch, mini_batch_size):
+        num_total = num_mini_batch * mini_batch_size
+        # 一次性在设备上采样所有 mini-batch 的索引并取出数据
+        sample_idxs = self._draw_indices(num_total)
+        block = self._get_block(num_total)
+        torch.index_select(self.states, 0, sample_idxs, out=block[0])
+        torch.index_select(self.next_states, 0, sample_idxs, out=block[1])
+        if self.dtype != torch.float32:
+            block = self._sample_block_fp32.copy_(block)
+
         # 遍历每一个mini-batch
-        for _ in range(num_mini_batch):
-            # 从所有样本中随机选择mini_batch_size个样本的索引
-            sample_idxs = np.random.choice(self.num_samples, size=mini_batch_size)
-            # 生成一个包含当前状态和下一个状态的元组，并将其移动到指定的设备上
-            yield (self.states[sample_idxs].to(self.device), self.next_states[sample_idxs].to(self.device))
+        for i in range(num_mini_batch):
+            batch = slice(i * mini_batch_size, (i + 1) * mini_batch_size)
+            self.last_idxs = sample_idxs[batch]
+            # 生成一个包含当前状态和下一个状态的元组，均为采样缓冲区的视图
+            yield block[0, batch], block[1, batch]
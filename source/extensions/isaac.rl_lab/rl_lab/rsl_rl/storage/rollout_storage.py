@@ -8,6 +8,8 @@ import torch
 
 from rsl_rl.utils import split_and_pad_trajectories
 
+from .gae import compute_gae
+
 
 class RolloutStorage:
     class Transition:
@@ -26,33 +28,53 @@ class RolloutStorage:
         def clear(self):
             self.__init__()
 
-    def __init__(self, num_envs, num_transitions_per_env, obs_shape, privileged_obs_shape, actions_shape, device="cpu"):
+    def __init__(
+        self,
+        num_envs,
+        num_transitions_per_env,
+        obs_shape,
+        privileged_obs_shape,
+        actions_shape,
+        device="cpu",
+        packed=False,
+        pre_shuffle=False,
+    ):
+        """
+        packed: 把每个transition的所有字段存放在一个连续的 [T, N, F] 张量中，observations、actions 等属性是它的视图，
+                mini_batch_generator 每个小批量只需要一次gather
+        pre_shuffle: 每个epoch重新打乱一次数据（仅packed模式），之后每个小批量都是连续的切片，不再需要gather
+        """
         self.device = device
 
         self.obs_shape = obs_shape
         self.privileged_obs_shape = privileged_obs_shape
         self.actions_shape = actions_shape
+        self.packed = packed
+        self.pre_shuffle = pre_shuffle
 
-        # Core
-        self.observations = torch.zeros(num_transitions_per_env, num_envs, *obs_shape, device=self.device)
-        if privileged_obs_shape[0] is not None:
-            self.privileged_observations = torch.zeros(
-                num_transitions_per_env, num_envs, *privileged_obs_shape, device=self.device
-            )
+        if packed:
+            self._init_packed_buffer(num_envs, num_transitions_per_env)
         else:
-            self.privileged_observations = None
-        self.rewards = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
-        self.actions = torch.zeros(num_transitions_per_env, num_envs, *actions_shape, device=self.device)
+            # Core
+            self.observations = torch.zeros(num_transitions_per_env, num_envs, *obs_shape, device=self.device)
+            if privileged_obs_shape[0] is not None:
+                self.privileged_observations = torch.zeros(
+                    num_transitions_per_env, num_envs, *privileged_obs_shape, device=self.device
+                )
+            else:
+                self.privileged_observations = None
+            self.rewards = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
+            self.actions = torch.zeros(num_transitions_per_env, num_envs, *actions_shape, device=self.device)
+
+            # For PPO
+            self.actions_log_prob = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
+            self.values = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
+            self.returns = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
+            self.advantages = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
+            self.mu = torch.zeros(num_transitions_per_env, num_envs, *actions_shape, device=self.device)
+            self.sigma = torch.zeros(num_transitions_per_env, num_envs, *actions_shape, device=self.device)
         self.dones = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device).byte()
 
-        # For PPO
-        self.actions_log_prob = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
-        self.values = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
-        self.returns = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
-        self.advantages = torch.zeros(num_transitions_per_env, num_envs, 1, device=self.device)
-        self.mu = torch.zeros(num_transitions_per_env, num_envs, *actions_shape, device=self.device)
-        self.sigma = torch.zeros(num_transitions_per_env, num_envs, *actions_shape, device=self.device)
-
         self.num_transitions_per_env = num_transitions_per_env
         self.num_envs = num_envs
 
@@ -62,6 +84,35 @@ class RolloutStorage:
 
         self.step = 0
 
+    # packed模式下各字段在特征维上的排列顺序，没有特权观测时 privileged_observations 的宽度为0
+    PACKED_FIELDS = ("observations", "privileged_observations", "actions", "values", "advantages", "returns",
+                     "actions_log_prob", "mu", "sigma", "rewards")
+
+    def _init_packed_buffer(self, num_envs, num_transitions_per_env):
+        # 每个字段在特征维上占据的宽度
+        widths = {
+            "observations": self.obs_shape[0],
+            "privileged_observations": self.privileged_obs_shape[0] or 0,
+            "actions": self.actions_shape[0],
+            "values": 1,
+            "advantages": 1,
+            "returns": 1,
+            "actions_log_prob": 1,
+            "mu": self.actions_shape[0],
+            "sigma": self.actions_shape[0],
+            "rewards": 1,
+        }
+        self.field_slices = {}
+        start = 0
+        for name in self.PACKED_FIELDS:
+            self.field_slices[name] = slice(start, start + widths[name])
+            start += widths[name]
+        self.buffer = torch.zeros(num_transitions_per_env, num_envs, start, device=self.device)
+        for name, field in self.field_slices.items():
+            setattr(self, name, self.buffer[..., field])
+        if widths["privileged_observations"] == 0:
+            self.privileged_observations = None
+
     def add_transitions(self, transition: Transition):
         # 如果当前步骤数已经超过了每个环境的过渡数，则抛出异常
         if self.step >= self.num_transitions_per_env:
@@ -124,32 +175,22 @@ class RolloutStorage:
     def clear(self):
         self.step = 0
 
-    def compute_returns(self, last_values, gamma, lam):
-        advantage = 0
-        # 遍历每一步
-        for step in reversed(range(self.num_transitions_per_env)):
-            # 如果当前步是最后一步
-            if step == self.num_transitions_per_env - 1:
-                # 下一状态的值等于最后的状态值
-                next_values = last_values
-            else:
-                # 否则，下一状态的值从values数组中获取
-                next_values = self.values[step + 1]
-            # 判断当前步是否非终止状态
-            next_is_not_terminal = 1.0 - self.dones[step].float()
-            # 计算TD误差
-            delta = self.rewards[step] + next_is_not_terminal * gamma * next_values - self.values[step]
-            # 更新advantage
-            advantage = delta + next_is_not_terminal * gamma * lam * advantage
-            # 计算当前步的回报
-            self.returns[step] = advantage + self.values[step]
-
-        # 计算并标准化advantage
-        # 计算advantage
-        self.advantages = self.returns - self.values
-    
-        # 对advantage进行标准化处理
-        self.advantages = (self.advantages - self.advantages.mean()) / (self.advantages.std() + 1e-8)
+    def compute_returns(self, last_values, gamma, lam, time_outs=None, normalize_advantages="global"):
+        # 计算GAE回报和标准化后的advantage，结果直接写入self.returns和self.advantages
+        # time_outs: 超时掩码，超时的步用自身的value进行bootstrap（奖励已在process_env_step中bootstrap时保持为None）
+        # normalize_advantages: "global" 整个rollout一起标准化，"per_env" 每个环境单独标准化，None 不标准化
+        compute_gae(
+            self.rewards,
+            self.values,
+            self.dones,
+            last_values,
+            gamma,
+            lam,
+            self.returns,
+            self.advantages,
+            time_outs=time_outs,
+            normalize=normalize_advantages,
+        )
 
     def get_statistics(self):
         done = self.dones
@@ -162,6 +203,10 @@ class RolloutStorage:
         return trajectory_lengths.float().mean(), self.rewards.mean()
 
     def mini_batch_generator(self, num_mini_batches, num_epochs=8):
+        if self.packed:
+            yield from self._packed_mini_batch_generator(num_mini_batches, num_epochs)
+            return
+
         # 计算每个小批量的大小
         batch_size = self.num_envs * self.num_transitions_per_env
         mini_batch_size = batch_size // num_mini_batches
@@ -213,6 +258,32 @@ class RolloutStorage:
                     None,
                 ), None
 
+    def _packed_mini_batch_generator(self, num_mini_batches, num_epochs):
+        batch_size = self.num_envs * self.num_transitions_per_env
+        mini_batch_size = batch_size // num_mini_batches
+        flat_buffer = self.buffer.view(batch_size, -1)
+        critic_field = "privileged_observations" if self.privileged_observations is not None else "observations"
+        fields = [self.field_slices[name] for name in (
+            "observations", critic_field, "actions", "values", "advantages", "returns", "actions_log_prob", "mu", "sigma",
+        )]
+
+        indices = torch.randperm(num_mini_batches * mini_batch_size, requires_grad=False, device=self.device)
+        for epoch in range(num_epochs):
+            if self.pre_shuffle:
+                # 每个epoch一次gather，小批量直接取连续切片
+                if epoch > 0:
+                    indices = torch.randperm(num_mini_batches * mini_batch_size, requires_grad=False, device=self.device)
+                shuffled = flat_buffer[indices]
+            for i in range(num_mini_batches):
+                start = i * mini_batch_size
+                end = (i + 1) * mini_batch_size
+                if self.pre_shuffle:
+                    batch = shuffled[start:end]
+                else:
+                    # 一次gather取出小批量的所有字段
+                    batch = flat_buffer[indices[start:end]]
+                yield (*(batch[:, field] for field in fields), (None, None), None)
+
     # for RNNs only
     def reccurent_mini_batch_generator(self, num_mini_batches, num_epochs=8):
         padded_obs_trajectories, trajectory_masks = split_and_pad_trajectories(self.observations, self.dones)
@@ -3,4 +3,5 @@
 
 """Helper functions."""
 
+from .episode_statistics import EpisodeStatistics
 from .utils import split_and_pad_trajectories, store_code_state, unpad_trajectories
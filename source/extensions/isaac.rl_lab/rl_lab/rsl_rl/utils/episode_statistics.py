@@ -0,0 +1,52 @@
+#  Copyright 2021 ETH Zurich, NVIDIA CORPORATION
+#  SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import torch
+
+
+class EpisodeStatistics:
+    """Device-side bookkeeping of episode returns and lengths for the on-policy runners.
+
+    Replaces the ``rewbuffer``/``lenbuffer`` deques that were filled with ``(dones > 0).nonzero()`` and
+    ``.cpu().numpy().tolist()`` on every env step. :meth:`update` only launches device kernels. The returns and
+    lengths of the last ``buffer_size`` finished episodes are kept in a ring on ``device`` and copied to the host
+    in a single transfer by :meth:`read`, once per logging call.
+    """
+
+    def __init__(self, num_envs: int, buffer_size: int = 100, device: str = "cpu"):
+        self.num_envs = num_envs
+        self.buffer_size = buffer_size
+        self.device = device
+
+        # running sums of the unfinished episodes, columns are (return, length)
+        self._running = torch.zeros(num_envs, 2, dtype=torch.float, device=device)
+        self.cur_reward_sum = self._running[:, 0]
+        self.cur_episode_length = self._running[:, 1]
+        # ring of finished episodes; the extra last row absorbs the writes of envs that are not done
+        self._finished = torch.zeros(buffer_size + 1, 2, dtype=torch.float, device=device)
+        # total number of finished episodes, the ring write position is this value modulo buffer_size
+        self.num_finished = torch.zeros(1, dtype=torch.long, device=device)
+
+    def update(self, rewards: torch.Tensor, dones: torch.Tensor):
+        """Accumulate one env step. Does not synchronize with the device."""
+        self.cur_reward_sum += rewards
+        self.cur_episode_length += 1
+        done = dones.view(-1) > 0
+        # finished envs write to consecutive ring rows, the others to the spare row
+        slots = (self.num_finished + torch.cumsum(done, dim=0) - 1) % self.buffer_size
+        slots = torch.where(done, slots, self.buffer_size)
+        self._finished.index_copy_(0, slots, self._running)
+        self.num_finished += done.sum()
+        self._running *= (~done).unsqueeze(-1)
+
+    def read(self) -> tuple[list[float], list[float]]:
+        """Return the returns and lengths of the last ``buffer_size`` finished episodes.
+
+        This is the only place where the statistics are copied to the host.
+        """
+        host = torch.cat((self._finished[: self.buffer_size].flatten(), self.num_finished.float())).cpu()
+        count = min(int(host[-1].item()), self.buffer_size)
+        finished = host[:-1].view(self.buffer_size, 2)[:count]
+        return finished[:, 0].tolist(), finished[:, 1].tolist()
@@ -1,3 +1,4 @@
 from .chain import *
+from .compiled_chain import *
 from .transforms import *
 from .urdf import *
@@ -0,0 +1,398 @@
+from typing import List, Optional, Tuple
+
+import torch
+
+
+@torch.jit.script
+def joint_motion(theta: torch.Tensor, joint_axes: torch.Tensor, joint_is_revolute: torch.Tensor) -> torch.Tensor:
+  """
+    Motion of revolute and prismatic joints as transforms.
+
+    Revolute joints rotate by theta about their axis (rodrigues formula), prismatic joints translate
+    by theta along it. A prismatic joint with a zero axis gives the identity, which is used for fixed joints.
+
+    Parameters
+    ----------
+    theta : torch.Tensor
+        Joint values, shape (..., J).
+    joint_axes : torch.Tensor
+        Unit joint axes, shape (J, 3) or broadcastable to (..., J, 3).
+    joint_is_revolute : torch.Tensor
+        True for revolute joints, shape (J,) or broadcastable to (..., J).
+
+    Returns
+    -------
+    torch.Tensor
+        The joint transforms, shape (..., J, 4, 4).
+    """
+  angle = theta.unsqueeze(-1).unsqueeze(-1)
+  revolute = joint_is_revolute.unsqueeze(-1).unsqueeze(-1)
+  x, y, z = joint_axes.unbind(-1)
+  zero = torch.zeros_like(x)
+  skew = torch.stack([zero, -z, y, z, zero, -x, -y, x, zero], dim=-1).view(joint_axes.shape[:-1] + (3, 3))
+  outer = joint_axes.unsqueeze(-1) * joint_axes.unsqueeze(-2)
+  eye = torch.eye(3, dtype=theta.dtype, device=theta.device)
+  rotation = eye + torch.sin(angle) * skew + (1.0 - torch.cos(angle)) * (outer - eye)
+  rotation = torch.where(revolute, rotation, eye.expand_as(rotation))
+  translation = torch.where(revolute.squeeze(-1), torch.zeros_like(joint_axes), angle.squeeze(-1) * joint_axes)
+  motion = torch.cat([rotation, translation.unsqueeze(-1)], dim=-1)
+  bottom = torch.zeros_like(motion[..., :1, :])
+  bottom[..., 3] = 1.0
+  return torch.cat([motion, bottom], dim=-2)
+
+
+@torch.jit.script
+def serial_chains_forward(theta: torch.Tensor,
+                          joint_offsets: torch.Tensor,
+                          joint_axes: torch.Tensor,
+                          joint_is_revolute: torch.Tensor,
+                          end_offsets: torch.Tensor,
+                          with_jacobian: bool = False
+                         ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+  """
+    Forward kinematics of C serial chains with D joints each, for a batch of N configurations.
+
+    Parameters
+    ----------
+    theta : torch.Tensor
+        Joint values, shape (N, C, D).
+    joint_offsets : torch.Tensor
+        Transform from the previous joint frame to each joint frame, before the joint motion, shape (C, D, 4, 4).
+    joint_axes : torch.Tensor
+        Unit joint axes in the joint frames, shape (C, D, 3).
+    joint_is_revolute : torch.Tensor
+        True for revolute joints and False for prismatic joints, shape (C, D).
+    end_offsets : torch.Tensor
+        Transform from the last joint frame to the end frame, shape (C, 4, 4).
+    with_jacobian : bool
+        Whether to also compute the Jacobian of the end positions.
+
+    Returns
+    -------
+    Tuple[torch.Tensor, Optional[torch.Tensor]]
+        The end transforms, shape (N, C, 4, 4), and the positional Jacobians d(end position)/d(theta),
+        shape (N, C, 3, D), or None.
+    """
+  num_joints = joint_axes.shape[1]
+  motion = joint_motion(theta, joint_axes, joint_is_revolute)
+
+  transform = joint_offsets[:, 0].expand(theta.shape[0], -1, -1, -1)
+  joint_origins = []
+  joint_directions = []
+  for d in range(num_joints):
+    if d > 0:
+      transform = transform @ joint_offsets[:, d]
+    if with_jacobian:
+      joint_origins.append(transform[..., :3, 3])
+      joint_directions.append((transform[..., :3, :3] @ joint_axes[:, d].unsqueeze(-1)).squeeze(-1))
+    transform = transform @ motion[:, :, d]
+  end = transform @ end_offsets
+
+  jacobian: Optional[torch.Tensor] = None
+  if with_jacobian:
+    origins = torch.stack(joint_origins, dim=-1)
+    directions = torch.stack(joint_directions, dim=-1)
+    lever = end[..., :3, 3].unsqueeze(-1) - origins
+    jacobian = torch.where(joint_is_revolute.unsqueeze(-2), torch.cross(directions, lever, dim=-2), directions)
+  return end, jacobian
+
+
+@torch.jit.script
+def serial_chains_end_positions(theta: torch.Tensor,
+                                joint_offsets: torch.Tensor,
+                                joint_axes: torch.Tensor,
+                                joint_is_revolute: torch.Tensor,
+                                end_offsets: torch.Tensor) -> torch.Tensor:
+  """
+    End positions of C serial chains with D joints each, for a batch of N configurations.
+
+    The arguments are the same as for :func:`serial_chains_forward`. Only the end point is carried,
+    from the end frame back to the root, so every step is a rotation of a (N, C, 3) point instead of
+    a product of transforms.
+
+    Returns
+    -------
+    torch.Tensor
+        The end positions, shape (N, C, 3).
+    """
+  num_joints = joint_axes.shape[1]
+  sin = torch.sin(theta).unsqueeze(-1)
+  cos = torch.cos(theta).unsqueeze(-1)
+  revolute = joint_is_revolute.unsqueeze(-1)
+  offset_rot = joint_offsets[..., :3, :3]
+  offset_pos = joint_offsets[..., :3, 3]
+  point = end_offsets[:, :3, 3].expand(theta.shape[0], -1, -1)
+  for d in range(num_joints - 1, -1, -1):
+    # joint motion: rodrigues rotation for revolute joints, translation along the axis for prismatic joints
+    axis = joint_axes[:, d]
+    rotated = (point * cos[:, :, d] + torch.cross(axis.expand_as(point), point, dim=-1) * sin[:, :, d] +
+               axis * (point * axis).sum(-1, keepdim=True) * (1.0 - cos[:, :, d]))
+    point = torch.where(revolute[:, d], rotated, point + theta[:, :, d].unsqueeze(-1) * axis)
+    # joint offset
+    point = offset_pos[:, d] + (offset_rot[:, d] * point.unsqueeze(-2)).sum(-1)
+  return point
+
+
+@torch.jit.script
+def chain_forward(theta: torch.Tensor,
+                  joint_offsets: torch.Tensor,
+                  joint_frames: torch.Tensor,
+                  joint_axes: torch.Tensor,
+                  joint_is_revolute: torch.Tensor,
+                  link_offsets: Optional[torch.Tensor],
+                  level_nodes: List[torch.Tensor],
+                  level_parents: List[torch.Tensor]) -> torch.Tensor:
+  """
+    Forward kinematics of a kinematic tree with L frames, J of them with a joint, for a batch of B configurations.
+
+    The local transform of every frame is its joint offset, times the joint motion for the frames
+    with a joint, computed in one batched pass. The frames are then composed with their parents one
+    tree depth at a time, so the number of sequential steps is the depth of the tree and not the
+    number of frames.
+
+    Parameters
+    ----------
+    theta : torch.Tensor
+        Joint values of the frames with a joint, shape (B, J).
+    joint_offsets : torch.Tensor
+        Transform from the parent frame to each frame, before the joint motion, shape (L, 4, 4).
+    joint_frames : torch.Tensor
+        Indices of the frames with a joint, shape (J,).
+    joint_axes : torch.Tensor
+        Unit joint axes, shape (J, 3).
+    joint_is_revolute : torch.Tensor
+        True for revolute joints and False for prismatic joints, shape (J,).
+    link_offsets : torch.Tensor, optional
+        Transform from each frame to its link, shape (L, 4, 4). None if they are all the identity.
+    level_nodes : list of torch.Tensor
+        For every tree depth from 1, the indices of the frames at that depth.
+    level_parents : list of torch.Tensor
+        For every tree depth from 1, the indices of the parents of these frames.
+
+    Returns
+    -------
+    torch.Tensor
+        The link transforms, shape (B, L, 4, 4).
+    """
+  transform = joint_offsets.expand(theta.shape[0], -1, -1, -1).clone()
+  transform.index_copy_(1, joint_frames,
+                        joint_offsets[joint_frames] @ joint_motion(theta, joint_axes, joint_is_revolute))
+  for nodes, parents in zip(level_nodes, level_parents):
+    transform.index_copy_(1, nodes, transform.index_select(1, parents) @ transform.index_select(1, nodes))
+  if link_offsets is not None:
+    transform = transform @ link_offsets
+  return transform
+
+
+class CompiledSerialChains(object):
+  """
+    Several serial chains with the same number of joints, compiled into flat per-joint tensors.
+
+    The frames of each chain are walked once: fixed joints are folded into the offset of the next
+    joint or into the end offset, so that only the actuated joints remain. All the chains are then
+    evaluated together by :func:`serial_chains_forward`, which gives the same end transforms as
+    calling :meth:`SerialChain.forward_kinematics` on every chain.
+
+    Parameters
+    ----------
+    chains : list of chain.SerialChain
+        The serial chains, e.g. one per leg. They must have the same number of actuated joints.
+    dtype : torch.dtype, optional
+        The dtype of the compiled tensors. Defaults to the dtype of the first chain.
+    device : str or torch.device, optional
+        The device of the compiled tensors. Defaults to the device of the first chain.
+    """
+
+  def __init__(self, chains, dtype=None, device=None):
+    self.dtype = chains[0].dtype if dtype is None else dtype
+    self.device = chains[0].device if device is None else device
+    self.joint_names = [c.get_joint_parameter_names() for c in chains]
+    num_joints = set(len(names) for names in self.joint_names)
+    if len(num_joints) != 1:
+      raise ValueError("All the chains must have the same number of joints, got %s." %
+                       [len(names) for names in self.joint_names])
+    self.num_chains = len(chains)
+    self.num_joints = num_joints.pop()
+
+    joint_offsets, joint_axes, joint_is_revolute, end_offsets = [], [], [], []
+    for c in chains:
+      offsets, axes, revolute = [], [], []
+      pending = torch.eye(4, dtype=torch.float64)
+      for f in c._serial_frames:
+        pending = pending @ f.joint.offset.get_matrix()[0].to(dtype=torch.float64, device="cpu")
+        if f.joint.joint_type == "fixed":
+          continue
+        offsets.append(pending)
+        axes.append(f.joint.axis.to(dtype=torch.float64, device="cpu"))
+        revolute.append(f.joint.joint_type == "revolute")
+        pending = torch.eye(4, dtype=torch.float64)
+      end_link = c._serial_frames[-1].link
+      end_offsets.append(pending @ end_link.offset.get_matrix()[0].to(dtype=torch.float64, device="cpu"))
+      joint_offsets.append(torch.stack(offsets))
+      joint_axes.append(torch.stack(axes))
+      joint_is_revolute.append(revolute)
+    self.joint_offsets = torch.stack(joint_offsets)
+    self.joint_axes = torch.stack(joint_axes)
+    self.joint_is_revolute = torch.tensor(joint_is_revolute, dtype=torch.bool)
+    self.end_offsets = torch.stack(end_offsets)
+    self.to(dtype=self.dtype, device=self.device)
+
+  def to(self, dtype=None, device=None):
+    if dtype is not None:
+      self.dtype = dtype
+    if device is not None:
+      self.device = device
+    self.joint_offsets = self.joint_offsets.to(dtype=self.dtype, device=self.device)
+    self.joint_axes = self.joint_axes.to(dtype=self.dtype, device=self.device)
+    self.joint_is_revolute = self.joint_is_revolute.to(device=self.device)
+    self.end_offsets = self.end_offsets.to(dtype=self.dtype, device=self.device)
+    return self
+
+  def _joint_values(self, th):
+    if not torch.is_tensor(th):
+      th = torch.tensor(th, dtype=self.dtype, device=self.device)
+    th = th.to(dtype=self.dtype, device=self.device)
+    return th.reshape(-1, self.num_chains, self.num_joints)
+
+  def forward_kinematics(self, th):
+    """
+      End transforms of all the chains.
+
+      Parameters
+      ----------
+      th : torch.Tensor
+          Joint values, shape (N, C * D) with the joints of the chains one after the other,
+          (N, C, D) or (C * D,).
+
+      Returns
+      -------
+      torch.Tensor
+          End transforms, shape (N, C, 4, 4).
+      """
+    end, _ = serial_chains_forward(self._joint_values(th), self.joint_offsets, self.joint_axes,
+                                   self.joint_is_revolute, self.end_offsets, False)
+    return end
+
+  def end_positions(self, th):
+    """ End positions of all the chains, shape (N, C, 3). """
+    return serial_chains_end_positions(self._joint_values(th), self.joint_offsets, self.joint_axes,
+                                       self.joint_is_revolute, self.end_offsets)
+
+  def end_positions_and_jacobians(self, th):
+    """ End positions, shape (N, C, 3), and their Jacobians w.r.t. the joints of each chain, shape (N, C, 3, D). """
+    end, jacobian = serial_chains_forward(self._joint_values(th), self.joint_offsets, self.joint_axes,
+                                          self.joint_is_revolute, self.end_offsets, True)
+    return end[..., :3, 3], jacobian
+
+  def end_velocities(self, th, th_dot):
+    """ End positions and velocities of all the chains, both of shape (N, C, 3). """
+    positions, jacobian = self.end_positions_and_jacobians(th)
+    velocities = (jacobian @ self._joint_values(th_dot).unsqueeze(-1)).squeeze(-1)
+    return positions, velocities
+
+
+class CompiledChain(object):
+  """
+    A kinematic tree compiled into flat per-frame tensors, with a parent index per frame.
+
+    The frames of the chain are walked once, in the order of :meth:`Chain.forward_kinematics`. Every
+    frame gets its parent index, joint offset and link offset, and every frame with a joint its joint
+    axis and type and the index of its joint value. :meth:`forward_kinematics` then evaluates all the link transforms with
+    :func:`chain_forward`, which gives the same transforms as the recursive :meth:`Chain.forward_kinematics`.
+
+    Parameters
+    ----------
+    chain : chain.Chain
+        The kinematic tree.
+    dtype : torch.dtype, optional
+        The dtype of the compiled tensors. Defaults to the dtype of the chain.
+    device : str or torch.device, optional
+        The device of the compiled tensors. Defaults to the device of the chain.
+    """
+
+  def __init__(self, chain, dtype=None, device=None):
+    self.dtype = chain.dtype if dtype is None else dtype
+    self.device = chain.device if device is None else device
+    self.joint_names = chain.get_joint_parameter_names()
+    joint_index_map = dict((name, i) for i, name in enumerate(self.joint_names))
+
+    frames, parents = [], []
+    stack = [(chain._root, -1)]
+    while len(stack) > 0:
+      frame, parent = stack.pop()
+      parents.append(parent)
+      frames.append(frame)
+      stack.extend((child, len(frames) - 1) for child in reversed(frame.children))
+    self.link_names = [f.link.name for f in frames]
+    self.link_indices = dict((name, i) for i, name in enumerate(self.link_names))
+    self.parent_indices = torch.tensor(parents, dtype=torch.long)
+
+    self.joint_offsets = torch.stack([f.joint.offset.get_matrix()[0].to(device="cpu") for f in frames])
+    # only the frames with a joint move, the others are their joint offset
+    joint_frames = [i for i, f in enumerate(frames) if f.joint.joint_type != "fixed"]
+    self.joint_frames = torch.tensor(joint_frames, dtype=torch.long)
+    self.frame_joint_indices = torch.tensor([joint_index_map[frames[i].joint.name] for i in joint_frames],
+                                            dtype=torch.long)
+    self.joint_axes = torch.stack([frames[i].joint.axis.to(device="cpu") for i in joint_frames])
+    self.joint_is_revolute = torch.tensor([frames[i].joint.joint_type == "revolute" for i in joint_frames],
+                                          dtype=torch.bool)
+    link_offsets = torch.stack([f.link.offset.get_matrix()[0].to(device="cpu") for f in frames])
+    self.link_offsets = None if torch.equal(link_offsets, torch.eye(4).expand_as(link_offsets)) else link_offsets
+
+    # frames grouped by depth, each group only depends on the previous ones
+    depth = [0] * len(frames)
+    for i, parent in enumerate(parents):
+      if parent >= 0:
+        depth[i] = depth[parent] + 1
+    self.level_nodes, self.level_parents = [], []
+    for level in range(1, max(depth) + 1):
+      nodes = [i for i, d in enumerate(depth) if d == level]
+      self.level_nodes.append(torch.tensor(nodes, dtype=torch.long))
+      self.level_parents.append(torch.tensor([parents[i] for i in nodes], dtype=torch.long))
+    self.to(dtype=self.dtype, device=self.device)
+
+  @property
+  def num_links(self):
+    return len(self.link_names)
+
+  def to(self, dtype=None, device=None):
+    if dtype is not None:
+      self.dtype = dtype
+    if device is not None:
+      self.device = device
+    self.parent_indices = self.parent_indices.to(device=self.device)
+    self.joint_frames = self.joint_frames.to(device=self.device)
+    self.frame_joint_indices = self.frame_joint_indices.to(device=self.device)
+    self.joint_offsets = self.joint_offsets.to(dtype=self.dtype, device=self.device)
+    self.joint_axes = self.joint_axes.to(dtype=self.dtype, device=self.device)
+    self.joint_is_revolute = self.joint_is_revolute.to(device=self.device)
+    if self.link_offsets is not None:
+      self.link_offsets = self.link_offsets.to(dtype=self.dtype, device=self.device)
+    self.level_nodes = [nodes.to(device=self.device) for nodes in self.level_nodes]
+    self.level_parents = [parents.to(device=self.device) for parents in self.level_parents]
+    return self
+
+  def forward_kinematics(self, th):
+    """
+      Transforms of all the links.
+
+      Parameters
+      ----------
+      th : torch.Tensor or dict
+          Joint values, shape (B, J) or (J,) in the order of :attr:`joint_names`, or a dict from
+          joint names to values of shape (B,) or scalars. Missing joints are 0.
+
+      Returns
+      -------
+      torch.Tensor
+          Link transforms, shape (B, L, 4, 4), in the order of :attr:`link_names`.
+      """
+    if isinstance(th, dict):
+      values = [torch.as_tensor(th.get(name, 0.0), dtype=self.dtype, device=self.device) for name in self.joint_names]
+      batch_size = max([v.numel() for v in values] + [1])
+      th = torch.stack([v.reshape(-1).expand(batch_size) for v in values], dim=-1)
+    elif not torch.is_tensor(th):
+      th = torch.tensor(th, dtype=self.dtype, device=self.device)
+    th = th.to(dtype=self.dtype, device=self.device).reshape(-1, len(self.joint_names))
+    return chain_forward(th[:, self.frame_joint_indices], self.joint_offsets, self.joint_frames, self.joint_axes,
+                         self.joint_is_revolute, self.link_offsets, self.level_nodes, self.level_parents)
@@ -66,6 +66,99 @@ class PMCEnvCfg(DirectRLEnvCfg):
     #contact_forces = ContactSensorCfg(prim_path="{ENV_REGEX_NS}/Robot/.*", history_length=3, track_air_time=True)
 
 
+class ReferenceStateCache:
+    """Reference frames of every env for all the substeps of one environment step.
+
+    An environment step reads the reference frame ``pmc_data_frameinplay + k`` in every decimation substep ``k`` of
+    :meth:`PMCEnv._apply_action`, the frame ``pmc_data_frameinplay + decimation`` in :meth:`PMCEnv._get_rewards` and
+    the future frames of ``time_list`` after it in the observations. :meth:`prefetch` gathers all of them at the start
+    of the step in one :meth:`MotionData_Base.get_frame_window` call and shifts the root and foot positions by the env
+    origins once. :meth:`advance` moves to the next substep together with ``pmc_data_frameinplay``.
+
+    Resets gather the observation frames of the reset envs with :meth:`update_envs`. Before the first prefetch, or
+    when the motion data has no ``time_list``, :meth:`observe` gathers the frames itself.
+    The returned tensors are shared and must not be modified in-place.
+    """
+
+    def __init__(self, motion_data: MotionData_Base, env_origins: torch.Tensor, num_substeps: int):
+        self.motion_data = motion_data
+        self.env_origins = env_origins
+        self.num_substeps = num_substeps
+        # frame offsets of the observations, relative to the frame after the last substep
+        self.obs_offsets = motion_data.timelist_offsets() if hasattr(motion_data, "time_list") else None
+        offsets = torch.arange(num_substeps + 1, dtype=torch.float64)
+        if self.obs_offsets is not None:
+            offsets = torch.cat([offsets, num_substeps + self.obs_offsets])
+        self.frame_offsets = offsets
+        self.substep = -1
+        """Substep the cached state belongs to, -1 before the first prefetch."""
+        self.states: list[tuple[torch.Tensor, ...]] = []
+        self.obs_frames: torch.Tensor = None
+        # counters since the last call to :meth:`pop_stats`
+        self.num_requests = 0
+        self.num_gathers = 0
+
+    def prefetch(self, motion_ids: torch.Tensor, frame_idx: torch.Tensor):
+        """Gather the frames of all the substeps and of the observations of the coming step."""
+        self.num_gathers += 1
+        window = self.motion_data.get_frame_window(motion_ids, frame_idx, self.frame_offsets)
+        self.states = [self._split(window[:, k], self.env_origins) for k in range(self.num_substeps + 1)]
+        self.obs_frames = window[:, self.num_substeps + 1 :] if self.obs_offsets is not None else None
+        self.substep = 0
+
+    def advance(self):
+        """Move to the frame of the next substep."""
+        if self.substep >= 0:
+            self.substep += 1
+
+    def current(self):
+        """Return the root state, joint position, joint velocity and foot positions of the current substep."""
+        self.num_requests += 1
+        return self.states[self.substep]
+
+    def observe(self, motion_ids: torch.Tensor, frame_idx: torch.Tensor, state: torch.Tensor) -> torch.Tensor:
+        """Same as :meth:`MotionData_Base.get_frame_batch_by_timelist`, served from the prefetched frames."""
+        self.num_requests += 1
+        if self.obs_frames is None or self.substep != self.num_substeps:
+            self.num_gathers += 1
+            return self.motion_data.get_frame_batch_by_timelist(motion_ids, frame_idx, state)
+        frames = self.obs_frames.clone()
+        frames[..., : state.shape[-1]] -= state.unsqueeze(1)
+        return frames.flatten(1)
+
+    def update_envs(self, env_ids: torch.Tensor, frames: torch.Tensor, motion_ids: torch.Tensor, frame_idx: torch.Tensor):
+        """Split the new reference frames of reset envs and gather the observation frames of their new motions.
+
+        The substep states of the reset envs are not needed again, the next step prefetches them.
+        """
+        if self.obs_frames is not None:
+            self.num_gathers += 1
+            self.obs_frames[env_ids] = self.motion_data.get_frame_window(motion_ids, frame_idx, self.obs_offsets)
+        return self._split(frames, self.env_origins[env_ids])
+
+    def pop_stats(self) -> dict[str, int]:
+        """Return the number of requests and gathers since the last call and reset the counters."""
+        stats = {
+            "reference_cache/requests": self.num_requests,
+            "reference_cache/gathers": self.num_gathers,
+            "reference_cache/saved_gathers": self.num_requests - self.num_gathers,
+        }
+        self.num_requests = self.num_gathers = 0
+        return stats
+
+    def _split(self, frames: torch.Tensor, env_origins: torch.Tensor):
+        root_state = self.motion_data.root_state_w(frames)
+        root_state[:, :2] += env_origins[:, :2]
+        foot_pos = self.motion_data.foot_position_w(frames)
+        foot_pos.view(-1, 4, 3)[:, :, :2] += env_origins[:, None, :2]
+        return (
+            root_state,
+            self.motion_data.joint_position_w(frames),
+            self.motion_data.joint_velocity_w(frames),
+            foot_pos,
+        )
+
+
 class PMCEnv(DirectRLEnv):
     cfg: PMCEnvCfg
 
@@ -78,6 +171,7 @@ class PMCEnv(DirectRLEnv):
         self.pmc_data_frameinplay = torch.zeros(self.scene.num_envs, device=self.device,dtype=torch.float32)
         self.pmc_data_maxtime = torch.zeros(self.scene.num_envs, device=self.device,dtype=torch.float32)
         self.pmc_data_selected = torch.zeros(self.scene.num_envs, device=self.device,dtype=torch.int)
+        self.reference_cache = ReferenceStateCache(self.MotionData_Base, self.scene.env_origins, self.cfg.decimation)
         
         self.robot_foot_id = self.robot.find_bodies(['FL_foot','FR_foot','RL_foot','RR_foot'])         
         
@@ -104,11 +198,9 @@ class PMCEnv(DirectRLEnv):
         self.robot.set_joint_position_target(self.actions) 
         #self.robot.set_joint_position_target(self.actions)
         #update marker
-        frame = self.MotionData_Base.get_frame_batch(self.pmc_data_selected,self.pmc_data_frameinplay)
-        rootstate = self.MotionData_Base.root_state_w(frame)
-        rootstate[:,:2] = rootstate[:,:2] + self.scene.env_origins[:,:2]
-        self.marker.write_root_state_to_sim(rootstate)
-        self.marker.write_joint_state_to_sim(self.MotionData_Base.joint_position_w(frame),self.MotionData_Base.joint_velocity_w(frame))
+        root_state, joint_pos, joint_vel, _ = self.reference_cache.current()
+        self.marker.write_root_state_to_sim(root_state)
+        self.marker.write_joint_state_to_sim(joint_pos, joint_vel)
         
     def _get_observations(self) -> dict:      
         obs = torch.cat(#45 in total
@@ -128,7 +220,7 @@ class PMCEnv(DirectRLEnv):
         robot_state[:, :2] = robot_state[:, :2] - self.scene.env_origins[:, :2]
         
         # 获取数据集get dataset
-        dataset = self.MotionData_Base.get_frame_batch_by_timelist(#72
+        dataset = self.reference_cache.observe(#72
             self.pmc_data_selected,
             self.pmc_data_frameinplay,
             robot_state
@@ -166,7 +258,7 @@ class PMCEnv(DirectRLEnv):
         robot_state[:, :2] = robot_state[:, :2] - self.scene.env_origins[:, :2]
         
         # 获取数据集get dataset
-        dataset = self.MotionData_Base.get_frame_batch_by_timelist(#72
+        dataset = self.reference_cache.observe(#72
             self.pmc_data_selected,
             self.pmc_data_frameinplay,
             robot_state
@@ -181,12 +273,8 @@ class PMCEnv(DirectRLEnv):
 
     def _get_rewards(self) -> torch.Tensor:
 
-        reference_frame = self.MotionData_Base.get_frame_batch(
-        self.pmc_data_selected, 
-        self.pmc_data_frameinplay)  
+        root_state, joint_pos, joint_vel, foot_positions = self.reference_cache.current()
         # base position
-        root_state = self.MotionData_Base.root_state_w(reference_frame)
-        root_state[:, :2] = root_state[:, :2] + self.scene.env_origins[:, :2] 
    
         root_pos = root_state[:, :3] 
 
@@ -194,17 +282,6 @@ class PMCEnv(DirectRLEnv):
         # base velocities
         lin_vel = root_state[:,7:10]
         ang_vel = root_state[:,10:13]
-        #joint position
-        joint_pos = self.MotionData_Base.joint_position_w(reference_frame)
-        joint_vel = self.MotionData_Base.joint_velocity_w(reference_frame)   
-        
-        #foot_position
-        foot_positions = self.MotionData_Base.foot_position_w(reference_frame)
-        foot_positions[:,0:2] = foot_positions[:,0:2] + self.scene.env_origins[:, 0:2]
-        foot_positions[:,3:5] = foot_positions[:,3:5] + self.scene.env_origins[:, 0:2]
-        foot_positions[:,6:8] = foot_positions[:,6:8] + self.scene.env_origins[:, 0:2]
-        foot_positions[:,9:11] = foot_positions[:,9:11] + self.scene.env_origins[:, 0:2]
-        
         root_pos_error,root_quat_error = compute_pose_error(
             self.robot.data.root_pos_w, self.robot.data.root_quat_w, root_pos, root_orn
         )
@@ -251,12 +328,8 @@ class PMCEnv(DirectRLEnv):
         super()._reset_idx(env_ids)
         
         frames,data_idx,rand_frame,data_length = self.MotionData_Base.get_random_frame_batch(len(env_ids))
-        root_state = self.MotionData_Base.root_state_w(frames)
-        root_state[:, :2] = root_state[:, :2] + self.scene.env_origins[env_ids, :2]        
-
-        #joint position
-        joint_pos = self.MotionData_Base.joint_position_w(frames)
-        joint_vel = self.MotionData_Base.joint_velocity_w(frames)
+        # the new frames also refresh the reference cache of the reset envs
+        root_state, joint_pos, joint_vel, _ = self.reference_cache.update_envs(env_ids, frames, data_idx, rand_frame)
         
         # set into the physics simulation
         self.robot.write_root_state_to_sim(root_state,env_ids=env_ids)
@@ -305,6 +378,9 @@ class PMCEnv(DirectRLEnv):
         # note: checked here once to avoid multiple checks within the loop
         is_rendering = self.sim.has_gui() or self.sim.has_rtx_sensors()
 
+        # gather the reference frames of all the substeps and of the observations at once
+        self.reference_cache.prefetch(self.pmc_data_selected, self.pmc_data_frameinplay)
+
         # perform physics stepping
         for _ in range(self.cfg.decimation):
             self._sim_step_counter += 1
@@ -322,6 +398,7 @@ class PMCEnv(DirectRLEnv):
             # update buffers at sim dt
             self.scene.update(dt=self.physics_dt)
             self.pmc_data_frameinplay = self.pmc_data_frameinplay + 1
+            self.reference_cache.advance()
 
         # post-step:
         # -- update env counters (used for curriculum generation)
@@ -355,6 +432,8 @@ class PMCEnv(DirectRLEnv):
         # note: we apply no noise to the state space (since it is used for critic networks)
         if self.cfg.observation_noise_model:
             self.obs_buf["policy"] = self._observation_noise_model.apply(self.obs_buf["policy"])
+
+        self.extras.setdefault("log", {}).update(self.reference_cache.pop_stats())
             
         # return observations, rewards, resets and extras
         return self.obs_buf, self.reward_buf, self.reset_terminated, self.reset_time_outs, self.extras
@@ -13,7 +13,7 @@ from omni.isaac.lab.envs.common import VecEnvStepReturn
 from omni.isaac.lab.envs.manager_based_rl_env import ManagerBasedRLEnv
 from omni.isaac.lab.envs.manager_based_rl_env_cfg import ManagerBasedRLEnvCfg
 
-from rl_lab.rsl_rl.utils.kinematics import urdf
+from rl_lab.rsl_rl.utils.kinematics import CompiledSerialChains, urdf
 from rl_lab.assets.loder_for_algs import AmpMotion
 
 
@@ -29,6 +29,8 @@ class ManagerBasedRLAmpEnv(ManagerBasedRLEnv, gym.Env):
                 urdf_content = urdf_file.read()
                 chain_ee_instance = urdf.build_serial_chain_from_urdf(urdf_content, ee_name).to(device=self.device)
                 self.chain_ee.append(chain_ee_instance)
+        # all the feet evaluated together in one batched pass
+        self.feet_kinematics = CompiledSerialChains(self.chain_ee)
 
         if self.cfg.reference_state_initialization:
             print("motion_files dir: ")
@@ -58,11 +60,8 @@ class ManagerBasedRLAmpEnv(ManagerBasedRLEnv, gym.Env):
         joint_vel = group_obs["joint_vel"]
         joint_pos = self.amp_loader.reorder_from_isaacsim_to_isaacgym_tool(joint_pos)
         joint_vel = self.amp_loader.reorder_from_isaacsim_to_isaacgym_tool(joint_vel)
-        foot_pos = []
         with torch.no_grad():
-            for i, chain_ee in enumerate(self.chain_ee):
-                foot_pos.append(chain_ee.forward_kinematics(joint_pos[:, i * 3 : i * 3 + 3]).get_matrix()[:, :3, 3])
-        foot_pos = torch.cat(foot_pos, dim=-1)
+            foot_pos = self.feet_kinematics.end_positions(joint_pos).flatten(1)
         base_lin_vel = group_obs["base_lin_vel"]
         base_ang_vel = group_obs["base_ang_vel"]
         z_pos = group_obs["base_pos_z"]
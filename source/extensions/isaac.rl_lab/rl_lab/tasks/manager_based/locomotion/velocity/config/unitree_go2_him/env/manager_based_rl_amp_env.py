@@ -14,8 +14,9 @@ from omni.isaac.lab.envs.manager_based_rl_env import ManagerBasedRLEnv
 from omni.isaac.lab.envs.manager_based_rl_env_cfg import ManagerBasedRLEnvCfg
 
 
-from rl_lab.rsl_rl.utils.kinematics import urdf
+from rl_lab.rsl_rl.utils.kinematics import CompiledSerialChains, urdf
 from rl_lab.assets.loder_for_algs import AmpMotion
+from rl_lab.tasks.utils import ObservationHistory
 
 class ManagerBasedRLAmpEnv(ManagerBasedRLEnv, gym.Env):
     def __init__(self, cfg: ManagerBasedRLEnvCfg, render_mode: str | None = None, **kwargs):
@@ -29,6 +30,8 @@ class ManagerBasedRLAmpEnv(ManagerBasedRLEnv, gym.Env):
                 urdf_content = urdf_file.read()
                 chain_ee_instance = urdf.build_serial_chain_from_urdf(urdf_content, ee_name).to(device=self.device)
                 self.chain_ee.append(chain_ee_instance)
+        # all the feet evaluated together in one batched pass
+        self.feet_kinematics = CompiledSerialChains(self.chain_ee)
 
         if self.cfg.reference_state_initialization:
             print("motion_files dir: ")
@@ -49,9 +52,22 @@ class ManagerBasedRLAmpEnv(ManagerBasedRLEnv, gym.Env):
         self.privileged_obs_dim = self.cfg.num_privileged_obs
         self.num_one_step_observations = self.cfg.num_one_step_observations
         
+        # policy observation: history of one-step observations stacked newest first
+        self.policy_history = ObservationHistory(
+            history_length=self.num_observations // self.num_one_step_observations,
+            num_envs=self.num_envs,
+            obs_dim=self.num_one_step_observations,
+            device=self.device,
+        )
+        # critic observation: two preallocated buffers used in turn, the runner keeps the last step's tensor
+        self._critic_obs_bufs = [
+            torch.zeros((self.num_envs, self.privileged_obs_dim), device=self.device, dtype=torch.float32)
+            for _ in range(2)
+        ]
+        self._critic_obs_index = 0
         self.obs_buf = {
-            'policy': torch.zeros((self.num_envs, self.num_observations), device=self.device, dtype=torch.float32),
-            'critic': torch.zeros((self.num_envs, self.privileged_obs_dim), device=self.device, dtype=torch.float32)
+            'policy': self.policy_history.stacked(),
+            'critic': self._critic_obs_bufs[self._critic_obs_index]
         }
     """
     Properties
@@ -86,11 +102,8 @@ class ManagerBasedRLAmpEnv(ManagerBasedRLEnv, gym.Env):
         joint_vel = group_obs["joint_vel"]
         joint_pos = self.amp_loader.reorder_from_isaacsim_to_isaacgym_tool(joint_pos)
         joint_vel = self.amp_loader.reorder_from_isaacsim_to_isaacgym_tool(joint_vel)
-        foot_pos = []
         with torch.no_grad():
-            for i, chain_ee in enumerate(self.chain_ee):
-                foot_pos.append(chain_ee.forward_kinematics(joint_pos[:, i * 3 : i * 3 + 3]).get_matrix()[:, :3, 3])
-        foot_pos = torch.cat(foot_pos, dim=-1)
+            foot_pos = self.feet_kinematics.end_positions(joint_pos).flatten(1)
         base_lin_vel = group_obs["base_lin_vel"]
         base_ang_vel = group_obs["base_ang_vel"]
         z_pos = group_obs["base_pos_z"]
@@ -99,20 +112,31 @@ class ManagerBasedRLAmpEnv(ManagerBasedRLEnv, gym.Env):
 
     def compute_observations(self):
         obs_buf = self.observation_manager.compute()
-        self.obs_buf['policy'] = torch.cat((obs_buf['policy'], self.obs_buf['policy'][:, :-obs_buf['policy'].shape[1]]), dim=-1)
-        self.obs_buf['critic'] = torch.cat((obs_buf['policy'],obs_buf['privileged']), dim=-1)
+        self.policy_history.append(obs_buf['policy'])
+        self.obs_buf['policy'] = self.policy_history.stacked()
+        self._critic_obs_index = 1 - self._critic_obs_index
+        self.obs_buf['critic'] = torch.cat(
+            (obs_buf['policy'], obs_buf['privileged']), dim=-1, out=self._critic_obs_bufs[self._critic_obs_index]
+        )
         return self.obs_buf
     
     def compute_termination_observations(self, env_ids):
-        obs_buf = self.observation_manager.compute()
-        critic_obs = torch.cat((obs_buf['policy'][env_ids],obs_buf['privileged'][env_ids]), dim=-1)
-        return  critic_obs 
+        # only the critic groups of the environments that are reset, not the full observation of all environments
+        policy_obs = self.observation_manager.compute_group('policy', env_ids=env_ids)
+        privileged_obs = self.observation_manager.compute_group('privileged', env_ids=env_ids)
+        critic_obs = torch.cat((policy_obs, privileged_obs), dim=-1)
+        return critic_obs
          
 
     """
     Operations - MDP
     """
 
+    def _reset_idx(self, env_ids):
+        super()._reset_idx(env_ids)
+        # the next observation of the reset environments fills their whole history
+        self.policy_history.reset(env_ids)
+
     def step(self, action: torch.Tensor) -> VecEnvStepReturn:
         """Execute one time-step of the environment's dynamics and reset terminated environments.
 
@@ -1,2 +1,3 @@
 from .importer import import_packages
 from .parse_cfg import get_checkpoint_path, load_cfg_from_registry, parse_env_cfg
+from .observation_history import ObservationHistory
@@ -0,0 +1,139 @@
+# Copyright (c) 2022-2024, The Isaac Lab Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Stacked observation history for policies that consume several past observation frames."""
+
+from __future__ import annotations
+
+import torch
+from collections.abc import Sequence
+
+from omni.isaac.lab.utils.buffers import CircularBuffer
+
+
+class ObservationHistory(CircularBuffer):
+    """History of flat observation frames, stacked newest first.
+
+    The frames are kept in a mirrored ring of shape (num_envs, 2 * history_length, obs_dim): every frame is
+    written twice, ``history_length`` slots apart, and the write pointer walks backwards. The ``history_length``
+    newest frames of an environment are therefore always one contiguous window ordered newest first, and the
+    stacked history ``[o_t, o_{t-1}, ..., o_{t-H+1}]`` is a view of the ring. Appending a frame writes
+    2 x (num_envs, obs_dim) instead of re-concatenating the whole (num_envs, history_length * obs_dim) stack.
+
+    After :meth:`reset`, the first frame appended for an environment fills its whole history, so that a reset
+    environment does not observe frames of its previous episode.
+
+    The stacked history is available in two forms:
+
+    * :attr:`stacked_view` is a zero-copy view into the ring. It is only valid until the next :meth:`append`.
+    * :meth:`stacked` copies the view once into one of ``num_output_buffers`` preallocated buffers, used in turn.
+      With the default two buffers the tensor returned at one step stays valid while the next step is computed,
+      which is what the on-policy runners need since they keep the observations of the last step around until
+      the transition is stored.
+    """
+
+    def __init__(self, history_length: int, num_envs: int, obs_dim: int, device: str, num_output_buffers: int = 2):
+        """Initialize the observation history.
+
+        Args:
+            history_length: Number of stacked frames. The minimum allowed value is 1.
+            num_envs: Number of environments.
+            obs_dim: Dimension of one observation frame.
+            device: The device used for processing.
+            num_output_buffers: Number of preallocated buffers that :meth:`stacked` cycles through.
+        """
+        super().__init__(max_len=history_length, batch_size=num_envs, device=device)
+        self._history_length = history_length
+        self._obs_dim = obs_dim
+        # mirrored ring, slots ``i`` and ``i + history_length`` always hold the same frame
+        self._buffer = torch.zeros((num_envs, 2 * history_length, obs_dim), device=device)
+        self._pointer = 0
+        # environments reset since the last append, their history is filled with the next frame
+        self._reset_env_ids: list[torch.Tensor] = []
+        self._output_buffers = [
+            torch.zeros((num_envs, history_length * obs_dim), device=device) for _ in range(num_output_buffers)
+        ]
+        self._output_index = 0
+
+    """
+    Properties.
+    """
+
+    @property
+    def obs_dim(self) -> int:
+        """Dimension of one observation frame."""
+        return self._obs_dim
+
+    @property
+    def stacked_view(self) -> torch.Tensor:
+        """Zero-copy view of the stacked history, newest frame first. Shape is (num_envs, history_length * obs_dim).
+
+        The view aliases the ring and is only valid until the next call to :meth:`append`.
+        """
+        window = self._buffer[:, self._pointer : self._pointer + self._history_length]
+        return window.view(self.batch_size, self._history_length * self._obs_dim)
+
+    """
+    Operations.
+    """
+
+    def reset(self, batch_ids: Sequence[int] | None = None):
+        """Reset the history of the given environments. Their next frame fills the whole history.
+
+        Args:
+            batch_ids: Environments to reset. Default is None, which resets all the environments.
+        """
+        super().reset(batch_ids)
+        if batch_ids is None:
+            self._reset_env_ids = [self._ALL_INDICES]
+        else:
+            self._reset_env_ids.append(torch.as_tensor(batch_ids, dtype=torch.long, device=self._device))
+
+    def append(self, data: torch.Tensor):
+        """Append one observation frame per environment.
+
+        Args:
+            data: The observation frame. Shape is (num_envs, obs_dim).
+
+        Raises:
+            ValueError: If the input data has a different batch size than the buffer.
+        """
+        if data.shape[0] != self.batch_size:
+            raise ValueError(f"The input data has {data.shape[0]} environments while expecting {self.batch_size}")
+        # move the head backwards so that the window starting at the head is ordered newest first
+        self._pointer = (self._pointer - 1) % self._history_length
+        self._buffer[:, self._pointer] = data
+        self._buffer[:, self._pointer + self._history_length] = data
+        # fill the whole history of the environments that were reset
+        if len(self._reset_env_ids) > 0:
+            env_ids = torch.cat(self._reset_env_ids)
+            self._buffer[env_ids] = data[env_ids].unsqueeze(1)
+            self._reset_env_ids = []
+        self._num_pushes += 1
+
+    def stacked(self) -> torch.Tensor:
+        """Copy the stacked history into the next preallocated output buffer and return it.
+
+        Returns:
+            The stacked history, newest frame first. Shape is (num_envs, history_length * obs_dim).
+        """
+        self._output_index = (self._output_index + 1) % len(self._output_buffers)
+        output = self._output_buffers[self._output_index]
+        output.copy_(self.stacked_view)
+        return output
+
+    def __getitem__(self, key: torch.Tensor) -> torch.Tensor:
+        """Retrieve the frame ``key`` steps in the past for every environment (0 is the newest frame).
+
+        Args:
+            key: The lag of the frame to retrieve. Shape is (num_envs,).
+
+        Returns:
+            The observation frames. Shape is (num_envs, obs_dim).
+        """
+        if len(key) != self.batch_size:
+            raise ValueError(f"The argument 'key' has length {key.shape[0]}, while expecting {self.batch_size}")
+        valid_keys = torch.minimum(key, self._num_pushes - 1).clamp(0, self._history_length - 1)
+        return self._buffer[self._ALL_INDICES, self._pointer + valid_keys]
@@ -5,7 +5,7 @@
 
 """Wrappers and utilities to configure an :class:`ManagerBasedRLEnv` for RSL-RL library."""
 
-from .exporter import export_policy_as_jit, export_policy_as_onnx
+from .exporter import export_policy_as_jit, export_policy_as_onnx, make_inference_policy
 from .rl_cfg import RslRlOnPolicyRunnerCfg, RslRlPpoActorCriticCfg, RslRlPpoAlgorithmCfg,RslRlPpoPMCCfg
 from .vqvae_cfg import Z_settings
 from .ase_rl_cfg import SpaceCfg,ASECfg,ASENetcfg
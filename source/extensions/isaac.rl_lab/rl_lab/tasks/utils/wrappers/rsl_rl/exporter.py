@@ -6,75 +6,278 @@
 import copy
 import os
 import torch
+import torch.nn.functional as F
 
 
-def export_policy_as_jit(actor_critic: object, normalizer: object | None, path: str, filename="policy.pt"):
+def export_policy_as_jit(
+    actor_critic: object,
+    normalizer: object | None,
+    path: str,
+    filename="policy.pt",
+    fold_normalizer=True,
+    batch_size=1,
+    num_obs: int | None = None,
+):
     """Export policy into a Torch JIT file.
 
+    Non-recurrent policies are traced through their inference path (see :func:`make_inference_policy`) with a static
+    batch size. Recurrent policies are scripted as before.
+
     Args:
         actor_critic: The actor-critic torch module.
         normalizer: The empirical normalizer module. If None, Identity is used.
         path: The path to the saving directory.
         filename: The name of exported JIT file. Defaults to "policy.pt".
+        fold_normalizer: Whether to fold the normalizer into the first linear layer of the policy when it has one.
+            Defaults to True.
+        batch_size: The batch size the policy is traced with. Defaults to 1.
+        num_obs: The observation dimension. Inferred from the normalizer or the policy if None.
     """
-    policy_exporter = _TorchPolicyExporter(actor_critic, normalizer)
+    policy_exporter = _TorchPolicyExporter(actor_critic, normalizer, fold_normalizer, batch_size, num_obs)
     policy_exporter.export(path, filename)
 
 
 def export_policy_as_onnx(
-    actor_critic: object, path: str, normalizer: object | None = None, filename="policy.onnx", verbose=False
+    actor_critic: object,
+    path: str,
+    normalizer: object | None = None,
+    filename="policy.onnx",
+    verbose=False,
+    fold_normalizer=True,
+    batch_size=1,
+    num_obs: int | None = None,
 ):
     """Export policy into a Torch ONNX file.
 
     Args:
         actor_critic: The actor-critic torch module.
-        normalizer: The empirical normalizer module. If None, Identity is used.
         path: The path to the saving directory.
+        normalizer: The empirical normalizer module. If None, Identity is used.
         filename: The name of exported ONNX file. Defaults to "policy.onnx".
         verbose: Whether to print the model summary. Defaults to False.
+        fold_normalizer: Whether to fold the normalizer into the first linear layer of the policy when it has one.
+            Defaults to True.
+        batch_size: The static batch size of the exported graph. Defaults to 1.
+        num_obs: The observation dimension. Inferred from the normalizer or the policy if None.
     """
     if not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
-    policy_exporter = _OnnxPolicyExporter(actor_critic, normalizer, verbose)
+    policy_exporter = _OnnxPolicyExporter(actor_critic, normalizer, verbose, fold_normalizer, batch_size, num_obs)
     policy_exporter.export(path, filename)
 
 
+def make_inference_policy(
+    actor_critic: object, normalizer: object | None = None, fold_normalizer=True, num_obs: int | None = None
+) -> torch.nn.Module:
+    """Build a stateless CPU module that maps (unnormalized) observations to the mean actions of a policy.
+
+    The module matches ``actor_critic.act_inference(normalizer(obs))`` of the eager model and can be traced:
+
+    * :class:`ActorCritic`: the actor MLP. The normalizer is folded into its first linear layer if requested.
+    * :class:`CVQVAE`: RMSNorm -> encoder -> nearest code of the :class:`VectorQuantiser` codebook (argmax of the
+      similarity) -> decoder on the code and the proprioceptive embedding.
+    * :class:`PMC`: RMSNorm -> encoder -> nearest codebook entry (L2) -> code and proprioceptive embeddings -> decoder.
+    * anything else (HIM, ASE, ...): ``act_inference`` itself.
+
+    The training-only parts of the vector-quantised policies (commitment loss, perplexity, codebook
+    re-initialisation) are left out of the graph.
+
+    Args:
+        actor_critic: The actor-critic torch module.
+        normalizer: The empirical normalizer module. If None, Identity is used.
+        fold_normalizer: Whether to fold the normalizer into the first linear layer of the policy when it has one.
+        num_obs: The observation dimension. Inferred from the normalizer or the policy if None.
+    """
+    from rl_lab.rsl_rl.modules.actor_critic import ActorCritic
+
+    actor_critic = copy.deepcopy(actor_critic).cpu().eval()
+    normalizer = copy.deepcopy(normalizer).cpu().eval() if normalizer else None
+
+    codebook = getattr(actor_critic, "codebook", None)
+    if isinstance(actor_critic, ActorCritic) and type(actor_critic).act_inference is ActorCritic.act_inference:
+        policy = _MlpPolicy(actor_critic)
+    elif codebook is not None and hasattr(codebook, "embedding"):
+        policy = _CvqvaePolicy(actor_critic)
+    elif isinstance(codebook, torch.nn.Embedding):
+        policy = _PmcPolicy(actor_critic)
+    else:
+        policy = _ActInferencePolicy(actor_critic)
+
+    if normalizer is not None:
+        if fold_normalizer and policy.first_linear is not None and hasattr(normalizer, "fold_into"):
+            policy.fold_normalizer(normalizer)
+        else:
+            policy = _NormalizedPolicy(normalizer, policy)
+
+    if num_obs is None and normalizer is not None and hasattr(normalizer, "_mean"):
+        num_obs = normalizer._mean.shape[-1]
+    policy.input_dim = num_obs or policy.input_dim
+    if policy.input_dim is None:
+        raise ValueError(f"Cannot infer the observation dimension of {type(actor_critic).__name__}, pass num_obs.")
+    return policy
+
+
 """
 Helper Classes - Private.
 """
 
 
-class _TorchPolicyExporter(torch.nn.Module):
-    """Exporter of actor-critic into JIT file."""
+def _rms_norm(x, rms):
+    """:class:`torch.nn.RMSNorm` over the last dimension, written out so the legacy ONNX exporter can lower it."""
+    eps = rms.eps if rms.eps is not None else torch.finfo(x.dtype).eps
+    x = x * torch.rsqrt(x.pow(2).mean(dim=-1, keepdim=True) + eps)
+    if rms.weight is not None:
+        x = x * rms.weight
+    return x
+
+
+class _ActInferencePolicy(torch.nn.Module):
+    """Traces ``act_inference`` of the wrapped module."""
+
+    first_linear = None
+
+    def __init__(self, actor_critic):
+        super().__init__()
+        self.actor_critic = actor_critic
+        self.input_dim = getattr(actor_critic, "num_actor_obs", None)
+
+    def forward(self, x):
+        return self.actor_critic.act_inference(x)
+
+
+class _MlpPolicy(torch.nn.Module):
+    """Actor MLP of :class:`ActorCritic`."""
 
-    def __init__(self, actor_critic, normalizer=None):
+    def __init__(self, actor_critic):
         super().__init__()
-        cloned_actor_critic = copy.deepcopy(actor_critic)
-        # 保存 actor_critic 的 forward 方法
-        
-        if hasattr(cloned_actor_critic, 'forward'):
-            self.forward = cloned_actor_critic.forward
+        self.actor = actor_critic.actor
+        self.input_dim = self.actor[0].in_features
+        self.first_linear = self.actor[0] if isinstance(self.actor[0], torch.nn.Linear) else None
+
+    def fold_normalizer(self, normalizer):
+        self.actor[0] = self.first_linear = normalizer.fold_into(self.actor[0])
+
+    def forward(self, x):
+        return self.actor(x)
+
+
+class _CvqvaePolicy(torch.nn.Module):
+    """Inference graph of :class:`CVQVAE`."""
+
+    first_linear = None
+
+    def __init__(self, actor_critic):
+        super().__init__()
+        quantiser = actor_critic.codebook
+        if quantiser.distance not in ("cos", "l2"):
+            raise ValueError(f"Unknown codebook distance: {quantiser.distance}")
+        self.rms = actor_critic.rms[0]
+        self.encoder = actor_critic.encoder
+        self.observation_embd = actor_critic.observation_embd
+        self.decoder = actor_critic.decoder
+        self.state_dimensions = actor_critic.State_Dimentions
+        self.distance = quantiser.distance
+        self.input_dim = self.rms.normalized_shape[0]
+        codebook = quantiser.embedding.weight.detach().clone()
+        self.register_buffer("codebook", codebook)
+        # the similarity only needs the normalized codebook (cos) or the squared norms of the codes (l2)
+        self.register_buffer("normed_codebook_t", F.normalize(codebook, dim=1).t().contiguous())
+        self.register_buffer("codebook_sq_norm", codebook.pow(2).sum(dim=1))
+
+    def forward(self, x):
+        observations = _rms_norm(x, self.rms)
+        z_e = self.encoder(observations)
+        if self.distance == "cos":
+            similarity = F.normalize(z_e, dim=1) @ self.normed_codebook_t
         else:
-            raise AttributeError("'actor_critic' object has no 'forward' method")
-        # 复制所有 nn.Module 类型的子模块
-        for name, module in cloned_actor_critic.named_children():
-            setattr(self, name, module)
+            similarity = 2.0 * z_e @ self.codebook.t() - self.codebook_sq_norm
+        # last index among ties, like VectorQuantiser
+        code_ids = similarity.size(1) - 1 - similarity.flip(1).argmax(dim=1)
+        z_q = F.embedding(code_ids, self.codebook)
+        observation_embd = self.observation_embd(observations[:, : self.state_dimensions])
+        return self.decoder(torch.cat((z_q, observation_embd), dim=1))
+
+
+class _PmcPolicy(torch.nn.Module):
+    """Inference graph of :class:`PMC` (and the E-PMC variant)."""
+
+    first_linear = None
+
+    def __init__(self, actor_critic):
+        super().__init__()
+        self.rms = actor_critic.rms[0]
+        self.encoder = actor_critic.encoder
+        self.z_embd = actor_critic.z_embd
+        self.observation_embd = actor_critic.observation_embd
+        self.decoder = actor_critic.decoder
+        self.state_dimensions = actor_critic.State_Dimentions
+        self.input_dim = self.rms.normalized_shape[0]
+        codebook = actor_critic.codebook.weight.detach().clone()
+        self.register_buffer("codebook", codebook)
+        self.register_buffer("codebook_sq_norm", codebook.pow(2).sum(dim=1))
+
+    def forward(self, x):
+        observations = _rms_norm(x, self.rms)
+        z_e = self.encoder(observations)
+        # argmin of the L2 distance without the per-row constant |z_e|^2 and without the square root
+        code_ids = torch.argmin(self.codebook_sq_norm - 2.0 * z_e @ self.codebook.t(), dim=1)
+        z_q = F.embedding(code_ids, self.codebook)
+        observation_embd = self.observation_embd(observations[:, : self.state_dimensions])
+        return self.decoder(torch.cat((self.z_embd(z_q), observation_embd), dim=1))
+
+
+class _NormalizedPolicy(torch.nn.Module):
+    """Applies the normalizer in front of a policy that it cannot be folded into."""
+
+    first_linear = None
+
+    def __init__(self, normalizer, policy):
+        super().__init__()
+        self.normalizer = normalizer
+        self.policy = policy
+        self.input_dim = policy.input_dim
+
+    def forward(self, x):
+        return self.policy(self.normalizer(x))
 
-            
 
+class _ScriptablePolicy(torch.nn.Module):
+    """Scripted shell around a traced policy so the exported file keeps the ``reset`` method."""
+
+    def __init__(self, traced_policy):
+        super().__init__()
+        self.policy = traced_policy
+
+    def forward(self, x):
+        return self.policy(x)
+
+    @torch.jit.export
+    def reset(self):
+        pass
+
+
+class _TorchPolicyExporter(torch.nn.Module):
+    """Exporter of actor-critic into JIT file."""
+
+    def __init__(self, actor_critic, normalizer=None, fold_normalizer=True, batch_size=1, num_obs=None):
+        super().__init__()
         self.is_recurrent = actor_critic.is_recurrent
+        self.batch_size = batch_size
         if self.is_recurrent:
+            self.actor = copy.deepcopy(actor_critic.actor)
             self.rnn = copy.deepcopy(actor_critic.memory_a.rnn)
             self.rnn.cpu()
             self.register_buffer("hidden_state", torch.zeros(self.rnn.num_layers, 1, self.rnn.hidden_size))
             self.register_buffer("cell_state", torch.zeros(self.rnn.num_layers, 1, self.rnn.hidden_size))
             self.forward = self.forward_lstm
             self.reset = self.reset_memory
-        # copy normalizer if exists
-        if normalizer:
-            self.normalizer = copy.deepcopy(normalizer)
+            # copy normalizer if exists
+            if normalizer:
+                self.normalizer = copy.deepcopy(normalizer)
+            else:
+                self.normalizer = torch.nn.Identity()
         else:
-            self.normalizer = torch.nn.Identity()
+            self.policy = make_inference_policy(actor_critic, normalizer, fold_normalizer, num_obs)
 
     def forward_lstm(self, x):
         x = self.normalizer(x)
@@ -82,7 +285,7 @@ class _TorchPolicyExporter(torch.nn.Module):
         self.hidden_state[:] = h
         self.cell_state[:] = c
         x = x.squeeze(0)
-        return self.actor_critic(x)
+        return self.actor(x)
 
     @torch.jit.export
     def reset(self):
@@ -96,26 +299,36 @@ class _TorchPolicyExporter(torch.nn.Module):
         os.makedirs(path, exist_ok=True)
         path = os.path.join(path, filename)
         self.to("cpu")
-        traced_script_module = torch.jit.script(self)
+        if self.is_recurrent:
+            traced_script_module = torch.jit.script(self)
+        else:
+            obs = torch.zeros(self.batch_size, self.policy.input_dim)
+            with torch.no_grad():
+                traced_policy = torch.jit.trace(self.policy, obs)
+            traced_script_module = torch.jit.script(_ScriptablePolicy(traced_policy))
         traced_script_module.save(path)
 
+
 class _OnnxPolicyExporter(torch.nn.Module):
     """Exporter of actor-critic into ONNX file."""
 
-    def __init__(self, actor_critic, normalizer=None, verbose=False):
+    def __init__(self, actor_critic, normalizer=None, verbose=False, fold_normalizer=True, batch_size=1, num_obs=None):
         super().__init__()
         self.verbose = verbose
-        self.actor = copy.deepcopy(actor_critic.actor)
+        self.batch_size = batch_size
         self.is_recurrent = actor_critic.is_recurrent
         if self.is_recurrent:
+            self.actor = copy.deepcopy(actor_critic.actor)
             self.rnn = copy.deepcopy(actor_critic.memory_a.rnn)
             self.rnn.cpu()
             self.forward = self.forward_lstm
-        # copy normalizer if exists
-        if normalizer:
-            self.normalizer = copy.deepcopy(normalizer)
+            # copy normalizer if exists
+            if normalizer:
+                self.normalizer = copy.deepcopy(normalizer)
+            else:
+                self.normalizer = torch.nn.Identity()
         else:
-            self.normalizer = torch.nn.Identity()
+            self.policy = make_inference_policy(actor_critic, normalizer, fold_normalizer, num_obs)
 
     def forward_lstm(self, x_in, h_in, c_in):
         x_in = self.normalizer(x_in)
@@ -124,7 +337,7 @@ class _OnnxPolicyExporter(torch.nn.Module):
         return self.actor(x), h, c
 
     def forward(self, x):
-        return self.actor(self.normalizer(x))
+        return self.policy(x)
 
     def export(self, path, filename):
         self.to("cpu")
@@ -145,7 +358,7 @@ class _OnnxPolicyExporter(torch.nn.Module):
                 dynamic_axes={},
             )
         else:
-            obs = torch.zeros(1, self.actor[0].in_features)
+            obs = torch.zeros(self.batch_size, self.policy.input_dim)
             torch.onnx.export(
                 self,
                 obs,
@@ -118,6 +118,9 @@ class RslRlOnPolicyRunnerCfg:
     empirical_normalization: bool = MISSING
     """Whether to use empirical normalization."""
 
+    empirical_normalization_interval: int = 1
+    """Update the empirical normalizers every this many environment steps. Default is 1."""
+
     policy: RslRlPpoActorCriticCfg | RslRlPpoPMCCfg= MISSING
     """The policy configuration."""
 
@@ -0,0 +1,142 @@
+# Copyright (c) 2022-2024, The Isaac Lab Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import torch
+import unittest
+
+"""Launch Isaac Sim Simulator first."""
+
+from omni.isaac.lab.app import AppLauncher, run_tests
+
+# launch omniverse app in headless mode
+simulation_app = AppLauncher(headless=True).app
+
+"""Rest everything follows from here."""
+
+from rl_lab.rsl_rl.utils.kinematics import CompiledChain, CompiledSerialChains, urdf
+
+# two legs with rotated joint origins, fixed joints in the middle and at the end, and a prismatic joint
+LEG = """
+  <joint name="{p}_hip_joint" type="revolute">
+    <parent link="base"/><child link="{p}_hip"/>
+    <origin rpy="0.1 0 0.2" xyz="0.19 {y} 0"/><axis xyz="1 0 0"/>
+  </joint>
+  <link name="{p}_hip"/>
+  <joint name="{p}_mount_joint" type="fixed">
+    <parent link="{p}_hip"/><child link="{p}_mount"/>
+    <origin rpy="0 0.3 0" xyz="0 {y} 0.01"/>
+  </joint>
+  <link name="{p}_mount"/>
+  <joint name="{p}_thigh_joint" type="revolute">
+    <parent link="{p}_mount"/><child link="{p}_thigh"/>
+    <origin rpy="0 0 0" xyz="0 0.09 0"/><axis xyz="0 1 1"/>
+  </joint>
+  <link name="{p}_thigh"/>
+  <joint name="{p}_calf_joint" type="{calf}">
+    <parent link="{p}_thigh"/><child link="{p}_calf"/>
+    <origin rpy="0 0 0" xyz="0 0 -0.21"/><axis xyz="0 1 0"/>
+  </joint>
+  <link name="{p}_calf"/>
+  <joint name="{p}_foot_joint" type="fixed">
+    <parent link="{p}_calf"/><child link="{p}_foot"/>
+    <origin rpy="0 0 0" xyz="0.01 0 -0.21"/>
+  </joint>
+  <link name="{p}_foot"/>
+"""
+URDF = (
+    '<robot name="legs"><link name="base"/>'
+    + LEG.format(p="FL", y=0.05, calf="revolute")
+    + LEG.format(p="FR", y=-0.05, calf="prismatic")
+    + "</robot>"
+)
+
+
+class TestCompiledSerialChains(unittest.TestCase):
+    """Batched leg kinematics against the per-chain ``SerialChain.forward_kinematics``."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.chains = [urdf.build_serial_chain_from_urdf(URDF, name) for name in ("FL_foot", "FR_foot")]
+        self.theta = torch.rand(64, 6, dtype=torch.float64) * 4.0 - 2.0
+
+    def _reference(self, theta):
+        return torch.stack(
+            [chain.forward_kinematics(theta[:, 3 * i : 3 * i + 3]).get_matrix() for i, chain in enumerate(self.chains)],
+            dim=1,
+        )
+
+    def test_forward_kinematics(self):
+        """End transforms and end positions match the serial chains."""
+        compiled = CompiledSerialChains(self.chains)
+        theta = self.theta.float()
+        expected = self._reference(theta)
+        torch.testing.assert_close(compiled.forward_kinematics(theta), expected, atol=1e-5, rtol=0.0)
+        torch.testing.assert_close(compiled.end_positions(theta), expected[..., :3, 3], atol=1e-5, rtol=0.0)
+        # a single configuration, as used by the retargeting script
+        torch.testing.assert_close(compiled.end_positions(theta[0]), expected[:1, :, :3, 3], atol=1e-5, rtol=0.0)
+
+    def test_jacobian(self):
+        """Jacobians and end velocities match autograd and finite differences."""
+        compiled = CompiledSerialChains(self.chains, dtype=torch.float64)
+        positions, jacobian = compiled.end_positions_and_jacobians(self.theta)
+        torch.testing.assert_close(positions, compiled.end_positions(self.theta))
+        for n in range(4):
+            expected = torch.autograd.functional.jacobian(compiled.end_positions, self.theta[n])[0]
+            for i in range(len(self.chains)):
+                torch.testing.assert_close(jacobian[n, i], expected[i, :, 3 * i : 3 * i + 3])
+
+        theta_dot = torch.randn_like(self.theta)
+        _, velocities = compiled.end_velocities(self.theta, theta_dot)
+        eps = 1e-6
+        finite_difference = (
+            compiled.end_positions(self.theta + eps * theta_dot) - compiled.end_positions(self.theta - eps * theta_dot)
+        ) / (2 * eps)
+        torch.testing.assert_close(velocities, finite_difference, atol=1e-6, rtol=0.0)
+
+    def test_different_number_of_joints(self):
+        """Chains with different numbers of joints cannot be compiled together."""
+        chain = urdf.build_serial_chain_from_urdf(URDF, "FR_thigh")
+        with self.assertRaises(ValueError):
+            CompiledSerialChains([self.chains[0], chain])
+
+
+class TestCompiledChain(unittest.TestCase):
+    """Level-ordered tree kinematics against the recursive ``Chain.forward_kinematics``."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.chain = urdf.build_chain_from_urdf(URDF)
+        self.compiled = CompiledChain(self.chain)
+        self.theta = torch.rand(64, len(self.compiled.joint_names)) * 4.0 - 2.0
+
+    def test_forward_kinematics(self):
+        """All the link transforms match the recursive chain."""
+        theta_dict = dict((name, self.theta[:, i : i + 1]) for i, name in enumerate(self.compiled.joint_names))
+        expected = self.chain.forward_kinematics(theta_dict)
+        link_transforms = self.compiled.forward_kinematics(self.theta)
+        self.assertEqual(link_transforms.shape, (64, self.compiled.num_links, 4, 4))
+        self.assertEqual(set(self.compiled.link_names), set(expected.keys()))
+        for i, name in enumerate(self.compiled.link_names):
+            # links without a joint above them have a batch size of 1 in the recursive chain
+            expected_transform = expected[name].get_matrix().expand_as(link_transforms[:, i])
+            torch.testing.assert_close(link_transforms[:, i], expected_transform, atol=1e-5, rtol=0.0)
+        # joint values given by name, missing joints are zero
+        theta_dict = {"FL_calf_joint": self.theta[:, 2], "FR_hip_joint": self.theta[:, 3]}
+        theta = torch.zeros_like(self.theta)
+        theta[:, 2:4] = self.theta[:, 2:4]
+        torch.testing.assert_close(self.compiled.forward_kinematics(theta_dict), self.compiled.forward_kinematics(theta))
+
+    def test_levels(self):
+        """Every frame is composed after its parent."""
+        self.assertEqual(self.compiled.parent_indices[0].item(), -1)
+        composed = {0}
+        for nodes, parents in zip(self.compiled.level_nodes, self.compiled.level_parents):
+            self.assertTrue(set(parents.tolist()) <= composed)
+            composed |= set(nodes.tolist())
+        self.assertEqual(composed, set(range(self.compiled.num_links)))
+
+
+if __name__ == "__main__":
+    run_tests()
@@ -0,0 +1,114 @@
+# Copyright (c) 2022-2024, The Isaac Lab Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import torch
+import unittest
+
+"""Launch Isaac Sim Simulator first."""
+
+from omni.isaac.lab.app import AppLauncher, run_tests
+
+# launch omniverse app in headless mode
+simulation_app = AppLauncher(headless=True).app
+
+"""Rest everything follows from here."""
+
+from rl_lab.rsl_rl.modules.Cvqvae.quantise import CodebookReinitialiser, VectorQuantiser, code_distance
+
+
+class LegacyClosestQuantiser:
+    """The training step of the sort-based quantiser with the 'closest' anchor, which updated every code."""
+
+    def __init__(self, weight, decay=0.99):
+        self.weight = weight.clone()
+        self.num_embed = weight.size(0)
+        self.decay = decay
+        self.embed_prob = torch.zeros(self.num_embed, device=weight.device)
+
+    def step(self, z, distance):
+        d = code_distance(z, self.weight, distance)
+        encoding_indices = d.sort(dim=1)[1][:, -1]
+        encodings = torch.zeros(z.size(0), self.num_embed, device=z.device)
+        encodings.scatter_(1, encoding_indices.unsqueeze(1), 1)
+        self.embed_prob.mul_(self.decay).add_(torch.mean(encodings, dim=0), alpha=1 - self.decay)
+        random_feat = z[d.sort(dim=0)[1][-1, :]]
+        decay = torch.exp(-(self.embed_prob * self.num_embed * 10) / (1 - self.decay) - 1e-3).unsqueeze(1)
+        self.weight = self.weight * (1 - decay) + random_feat * decay
+        return encoding_indices
+
+
+class TestCodebookReinitialiser(unittest.TestCase):
+    """Test fixture for the dead-code re-initialisation of the CVQVAE codebook."""
+
+    def setUp(self):
+        self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.num_embed = 32
+        self.embed_dim = 8
+
+    def test_matches_legacy_update(self):
+        """Test that selecting every code reproduces the legacy update of all the codes."""
+        for distance in ("cos", "l2"):
+            torch.manual_seed(0)
+            vq = VectorQuantiser(
+                self.num_embed, self.embed_dim, beta=0.25, distance=distance, anchor="closest",
+                reinit_threshold=float("inf"), reinit_max_codes=self.num_embed, return_encodings=False,
+            ).to(self.device)
+            vq.train()
+            legacy = LegacyClosestQuantiser(vq.embedding.weight.data)
+            for _ in range(5):
+                z = torch.randn(256, self.embed_dim, device=self.device)
+                with torch.no_grad():
+                    _, _, (_, _, encoding_indices) = vq(z)
+                legacy_indices = legacy.step(z, distance)
+                torch.testing.assert_close(encoding_indices, legacy_indices)
+                torch.testing.assert_close(vq.embed_prob, legacy.embed_prob)
+                torch.testing.assert_close(vq.embedding.weight.data, legacy.weight)
+                self.assertEqual(vq.reinit.stats()["last_revived"], self.num_embed)
+            self.assertEqual(vq.reinit.stats()["revived"], 5 * self.num_embed)
+
+    def test_revives_only_dead_codes(self):
+        """Test that only codes below the threshold move and that the revived count is the number of such codes."""
+        reinit = CodebookReinitialiser(self.num_embed, anchor="closest", max_codes=16)
+        codebook = torch.randn(self.num_embed, self.embed_dim, device=self.device)
+        embed_prob = torch.full((self.num_embed,), 1.0 / self.num_embed, device=self.device)
+        dead = torch.arange(0, self.num_embed, 4, device=self.device)
+        embed_prob[dead] = 0.0
+        z = torch.randn(128, self.embed_dim, device=self.device)
+
+        new_codebook = codebook.clone()
+        self.assertTrue(reinit(new_codebook, embed_prob, z, "cos"))
+        alive = torch.ones(self.num_embed, dtype=torch.bool, device=self.device)
+        alive[dead] = False
+        self.assertEqual(reinit.stats()["last_revived"], int((embed_prob < reinit.threshold).sum()))
+        torch.testing.assert_close(new_codebook[alive], codebook[alive], rtol=0.0, atol=0.0)
+        self.assertFalse(torch.isclose(new_codebook[dead], codebook[dead]).all(dim=1).any())
+
+    def test_max_codes_keeps_least_used(self):
+        """Test that with more dead codes than max_codes only the least used ones are revived in a call."""
+        reinit = CodebookReinitialiser(self.num_embed, anchor="closest", max_codes=8, threshold=1.0)
+        codebook = torch.randn(self.num_embed, self.embed_dim, device=self.device)
+        embed_prob = torch.linspace(0.0, 1e-5, self.num_embed, device=self.device)[torch.randperm(self.num_embed)]
+        z = torch.randn(128, self.embed_dim, device=self.device)
+
+        new_codebook = codebook.clone()
+        reinit(new_codebook, embed_prob, z, "l2")
+        moved = (new_codebook != codebook).any(dim=1)
+        self.assertEqual(reinit.stats()["last_revived"], 8)
+        torch.testing.assert_close(moved, embed_prob < embed_prob.sort().values[8])
+
+    def test_interval(self):
+        """Test that the re-initialisation runs once every interval calls and counts its runs."""
+        reinit = CodebookReinitialiser(self.num_embed, anchor="probrandom", interval=3)
+        codebook = torch.randn(self.num_embed, self.embed_dim, device=self.device)
+        embed_prob = torch.zeros(self.num_embed, device=self.device)
+        z = torch.randn(64, self.embed_dim, device=self.device)
+        ran = [reinit(codebook, embed_prob, z, "cos") for _ in range(7)]
+        self.assertEqual(ran, [True, False, False, True, False, False, True])
+        self.assertEqual(reinit.stats()["runs"], 3)
+        self.assertEqual(reinit.stats()["revived"], 3 * reinit.max_codes)
+
+
+if __name__ == "__main__":
+    run_tests()
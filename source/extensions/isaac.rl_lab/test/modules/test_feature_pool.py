@@ -0,0 +1,146 @@
+# Copyright (c) 2022-2024, The Isaac Lab Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import torch
+import unittest
+
+"""Launch Isaac Sim Simulator first."""
+
+from omni.isaac.lab.app import AppLauncher, run_tests
+
+# launch omniverse app in headless mode
+simulation_app = AppLauncher(headless=True).app
+
+"""Rest everything follows from here."""
+
+from rl_lab.rsl_rl.modules.Cvqvae.quantise import FeaturePool
+
+
+class LegacyFeaturePool:
+    """The host-sampled feature pool that :class:`FeaturePool` replaced, kept as the statistical reference."""
+
+    def __init__(self, pool_size, dim=64):
+        self.pool_size = pool_size
+        self.nums_features = 0
+        self.features = (torch.rand((pool_size, dim)) * 2 - 1) / pool_size
+
+    def query(self, features):
+        self.features = self.features.to(features.device)
+        if self.nums_features < self.pool_size:
+            if features.size(0) > self.pool_size:
+                random_feat_id = torch.randint(0, features.size(0), (int(self.pool_size),))
+                self.features = features[random_feat_id]
+                self.nums_features = self.pool_size
+            else:
+                num = self.nums_features + features.size(0)
+                self.features[self.nums_features:num] = features
+                self.nums_features = num
+        else:
+            if features.size(0) > int(self.pool_size):
+                random_feat_id = torch.randint(0, features.size(0), (int(self.pool_size),))
+                self.features = features[random_feat_id]
+            else:
+                random_id = torch.randperm(self.pool_size)
+                self.features[random_id[: features.size(0)]] = features
+        return self.features
+
+
+class TestFeaturePool(unittest.TestCase):
+    """Test fixture for the device-side feature pool of the CVQVAE codebook."""
+
+    def setUp(self):
+        self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.pool_size = 16
+        self.dim = 1
+
+    def _batch(self, start, size):
+        """Features whose single value is their global index, so pool contents can be traced back."""
+        return torch.arange(start, start + size, device=self.device, dtype=torch.float32).unsqueeze(1)
+
+    def test_fill_in_order(self):
+        """Test that a pool that is not full is filled slot by slot like the legacy pool."""
+        pool = FeaturePool(self.pool_size, self.dim)
+        legacy = LegacyFeaturePool(self.pool_size, self.dim)
+        for start in (0, 5, 10):
+            batch = self._batch(start, 5)
+            torch.testing.assert_close(pool.query(batch)[: start + 5], legacy.query(batch)[: start + 5])
+        self.assertEqual(pool.nums_features, 15)
+
+    def test_fill_overflow(self):
+        """Test that a batch crossing the end of a partially filled pool fills it and replaces random slots."""
+        pool = FeaturePool(self.pool_size, self.dim)
+        pool.query(self._batch(0, 12))
+        features = pool.query(self._batch(12, 8))
+        self.assertEqual(pool.nums_features, self.pool_size)
+        # all 20 features were seen, the 16 slots hold distinct ones and the 4 newest are always kept
+        values = features[:, 0].long()
+        self.assertEqual(values.unique().numel(), self.pool_size)
+        self.assertTrue(((values >= 0) & (values < 20)).all())
+        self.assertTrue(torch.isin(torch.arange(16, 20, device=self.device), values).all())
+
+    def test_no_reallocation(self):
+        """Test that the pool is written in-place once it lives on the query device."""
+        pool = FeaturePool(self.pool_size, self.dim)
+        features = pool.query(self._batch(0, 4))
+        data_ptr = features.data_ptr()
+        for start in range(4, 200, 20):
+            self.assertEqual(pool.query(self._batch(start, 20)).data_ptr(), data_ptr)
+        self.assertEqual(pool.query(self._batch(0, 4)).data_ptr(), data_ptr)
+
+    def test_large_batch_overwrites_pool(self):
+        """Test that a batch larger than the pool resamples the whole pool from the batch."""
+        pool = FeaturePool(self.pool_size, self.dim)
+        features = pool.query(self._batch(100, 64))
+        self.assertTrue(((features >= 100) & (features < 164)).all())
+
+    def test_half_precision_batch(self):
+        """Test that half precision batches from the mixed-precision update are stored at the pool precision."""
+        for dtype in (torch.bfloat16, torch.float16):
+            pool = FeaturePool(self.pool_size, self.dim)
+            features = pool.query(self._batch(0, 4).to(dtype))
+            data_ptr = features.data_ptr()
+            # in order, random slots and whole-pool resampling
+            for start, size in ((4, 12), (16, 4), (100, 64)):
+                features = pool.query(self._batch(start, size).to(dtype))
+                self.assertEqual(features.dtype, torch.float32)
+                self.assertEqual(features.data_ptr(), data_ptr)
+            self.assertTrue(((features >= 100) & (features < 164)).all())
+
+    def test_sampling_statistics(self):
+        """Test that the age distribution of the pool matches the legacy pool.
+
+        The pool is filled, then fed five batches of four features. For every trial the fraction of the pool that
+        comes from each batch, and how often each slot is replaced, are accumulated. Both pools must agree within
+        a few standard errors.
+        """
+        num_trials = 2000
+        num_batches, batch_size = 5, 4
+        torch.manual_seed(0)
+
+        def statistics(pool_cls):
+            batch_fraction = torch.zeros(num_batches + 1)
+            slot_replaced = torch.zeros(self.pool_size)
+            for _ in range(num_trials):
+                pool = pool_cls(self.pool_size, self.dim)
+                pool.query(self._batch(0, self.pool_size))
+                for i in range(num_batches):
+                    features = pool.query(self._batch(self.pool_size + i * batch_size, batch_size))
+                values = features[:, 0].long().cpu()
+                batch_id = torch.where(values < self.pool_size, 0, (values - self.pool_size) // batch_size + 1)
+                batch_fraction += torch.bincount(batch_id, minlength=num_batches + 1) / self.pool_size
+                slot_replaced += (values >= self.pool_size).float()
+            return batch_fraction / num_trials, slot_replaced / num_trials
+
+        fraction, replaced = statistics(FeaturePool)
+        legacy_fraction, legacy_replaced = statistics(LegacyFeaturePool)
+        # each fraction is a mean of num_trials values in [0, 1]
+        torch.testing.assert_close(fraction, legacy_fraction, atol=0.02, rtol=0.0)
+        torch.testing.assert_close(replaced, legacy_replaced, atol=0.06, rtol=0.0)
+        # newer batches survive more often than older ones
+        self.assertTrue((fraction[1:].diff() > 0).all())
+
+
+if __name__ == "__main__":
+    run_tests()
@@ -0,0 +1,102 @@
+# Copyright (c) 2022-2024, The Isaac Lab Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import copy
+import torch
+import unittest
+
+"""Launch Isaac Sim Simulator first."""
+
+from omni.isaac.lab.app import AppLauncher, run_tests
+
+# launch omniverse app in headless mode
+simulation_app = AppLauncher(headless=True).app
+
+"""Rest everything follows from here."""
+
+from rl_lab.rsl_rl.ppo_algorithm.update_accelerator import UpdateAccelerator
+
+
+class TestUpdateAccelerator(unittest.TestCase):
+    """Accelerated optimizer step and learning rate schedule against the eager path."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.learning_rate = 1e-3
+        self.desired_kl = 0.01
+
+    def _make(self, device="cpu", **kwargs):
+        model = torch.nn.Sequential(torch.nn.Linear(6, 16), torch.nn.ELU(), torch.nn.Linear(16, 3)).to(device)
+        optimizer = torch.optim.Adam(model.parameters(), lr=self.learning_rate)
+        return model, UpdateAccelerator(optimizer, self.learning_rate, device=device, **kwargs)
+
+    def _step(self, model, accelerator, x):
+        with accelerator.autocast():
+            loss = model(x).float().square().mean()
+        accelerator.step(loss, model.parameters(), max_grad_norm=1.0)
+
+    def test_enabled_matches_disabled_on_cpu(self):
+        """The unfused CPU optimizer of the enabled path follows the eager learning rate and parameter updates."""
+        model, eager = self._make(enabled=False)
+        accelerated_model = copy.deepcopy(model)
+        optimizer = torch.optim.Adam(accelerated_model.parameters(), lr=self.learning_rate)
+        accelerated = UpdateAccelerator(optimizer, self.learning_rate, device="cpu", enabled=True, precision=None)
+        initial = [p.detach().clone() for p in model.parameters()]
+        # above 2x the target, below half of it, in between and zero
+        for kl in (0.1, 0.1, 0.001, 0.01, 0.0):
+            kl_mean = torch.tensor(kl)
+            eager.adapt_learning_rate(kl_mean, self.desired_kl)
+            accelerated.adapt_learning_rate(kl_mean, self.desired_kl)
+            self.assertAlmostEqual(accelerated.learning_rate, eager.learning_rate, places=9)
+            x = torch.randn(32, 6)
+            self._step(model, eager, x)
+            self._step(accelerated_model, accelerated, x)
+            for p, q in zip(model.parameters(), accelerated_model.parameters()):
+                torch.testing.assert_close(q, p)
+        self.assertAlmostEqual(eager.learning_rate, self.learning_rate / 1.5, places=9)
+        self.assertFalse(all(torch.equal(p, q) for p, q in zip(initial, model.parameters())))
+
+    def test_load_state_dict_restores_learning_rate(self):
+        """A learning rate loaded into the rebuilt optimizer is picked up by the device learning rate."""
+        model, accelerated = self._make(enabled=True, precision=None)
+        state = copy.deepcopy(accelerated.optimizer.state_dict())
+        accelerated.adapt_learning_rate(torch.tensor(1.0), self.desired_kl)
+        self._step(model, accelerated, torch.randn(8, 6))
+        self.assertAlmostEqual(accelerated.learning_rate, self.learning_rate / 1.5, places=9)
+        accelerated.optimizer.load_state_dict(state)
+        self._step(model, accelerated, torch.randn(8, 6))
+        self.assertAlmostEqual(accelerated.learning_rate, self.learning_rate, places=9)
+
+    def test_bf16_on_cpu(self):
+        """On CPU both precisions fall back to bf16 autocast without a grad scaler and still train."""
+        for precision in ("bf16", "fp16"):
+            model, accelerated = self._make(enabled=True, precision=precision)
+            self.assertEqual(accelerated.autocast_dtype, torch.bfloat16)
+            self.assertIsNone(accelerated.scaler)
+            initial = [p.detach().clone() for p in model.parameters()]
+            self._step(model, accelerated, torch.randn(32, 6))
+            for p, q in zip(initial, model.parameters()):
+                self.assertTrue(torch.isfinite(q).all())
+                self.assertFalse(torch.equal(p, q))
+
+    @unittest.skipUnless(torch.cuda.is_available(), "the fp16 grad scaler needs CUDA")
+    def test_fp16_grad_scaler(self):
+        """The fp16 path steps the fused optimizer through the grad scaler with the device learning rate."""
+        model, accelerated = self._make(device="cuda:0", enabled=True, precision="fp16")
+        self.assertEqual(accelerated.autocast_dtype, torch.float16)
+        self.assertIsNotNone(accelerated.scaler)
+        self.assertIs(accelerated.optimizer.param_groups[0]["lr"], accelerated.lr)
+        initial = [p.detach().clone() for p in model.parameters()]
+        for _ in range(3):
+            self._step(model, accelerated, torch.randn(32, 6, device="cuda:0"))
+        accelerated.adapt_learning_rate(torch.tensor(1.0, device="cuda:0"), self.desired_kl)
+        self.assertAlmostEqual(accelerated.learning_rate, self.learning_rate / 1.5, places=6)
+        for p, q in zip(initial, model.parameters()):
+            self.assertTrue(torch.isfinite(q).all())
+            self.assertFalse(torch.equal(p, q))
+
+
+if __name__ == "__main__":
+    run_tests()
@@ -0,0 +1,70 @@
+# Copyright (c) 2022-2024, The Isaac Lab Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import torch
+import unittest
+
+"""Launch Isaac Sim Simulator first."""
+
+from omni.isaac.lab.app import AppLauncher, run_tests
+
+# launch omniverse app in headless mode
+simulation_app = AppLauncher(headless=True).app
+
+"""Rest everything follows from here."""
+
+from rl_lab.tasks.utils import ObservationHistory
+
+
+class TestObservationHistory(unittest.TestCase):
+    """Stacked history against the ``torch.cat`` shift it replaces."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.num_envs, self.obs_dim, self.history_length = 8, 5, 4
+        self.history = ObservationHistory(self.history_length, self.num_envs, self.obs_dim, "cpu")
+
+    def test_matches_concatenated_history(self):
+        """Without resets the history equals the newest-first concatenation of all frames."""
+        expected = torch.zeros(self.num_envs, self.history_length * self.obs_dim)
+        for step in range(3 * self.history_length + 1):
+            obs = torch.randn(self.num_envs, self.obs_dim)
+            expected = torch.cat((obs, expected[:, : -self.obs_dim]), dim=-1)
+            self.history.append(obs)
+            torch.testing.assert_close(self.history.stacked_view, expected, rtol=0.0, atol=0.0)
+            torch.testing.assert_close(self.history.stacked(), expected, rtol=0.0, atol=0.0)
+            # like ``CircularBuffer``, lags past the pushed frames are clamped to the oldest one
+            lag = torch.full((self.num_envs,), 1)
+            lagged = expected[:, self.obs_dim : 2 * self.obs_dim] if step > 0 else obs
+            torch.testing.assert_close(self.history[lag], lagged, rtol=0.0, atol=0.0)
+
+    def test_stacked_buffers_survive_one_step(self):
+        """The tensor returned by ``stacked`` is not overwritten by the next step."""
+        self.history.append(torch.randn(self.num_envs, self.obs_dim))
+        previous = self.history.stacked()
+        previous_copy = previous.clone()
+        self.history.append(torch.randn(self.num_envs, self.obs_dim))
+        current = self.history.stacked()
+        self.assertNotEqual(previous.data_ptr(), current.data_ptr())
+        torch.testing.assert_close(previous, previous_copy, rtol=0.0, atol=0.0)
+
+    def test_reset_fills_history(self):
+        """The first frame after a reset fills the whole history of the reset environments only."""
+        for _ in range(self.history_length):
+            self.history.append(torch.randn(self.num_envs, self.obs_dim))
+        before = self.history.stacked_view.clone()
+        env_ids = torch.tensor([1, 5])
+        self.history.reset(env_ids)
+        obs = torch.randn(self.num_envs, self.obs_dim)
+        self.history.append(obs)
+        stacked = self.history.stacked_view
+        torch.testing.assert_close(stacked[env_ids], obs[env_ids].repeat(1, self.history_length), rtol=0.0, atol=0.0)
+        kept = torch.tensor([0, 2, 3, 4, 6, 7])
+        expected = torch.cat((obs[kept], before[kept, : -self.obs_dim]), dim=-1)
+        torch.testing.assert_close(stacked[kept], expected, rtol=0.0, atol=0.0)
+
+
+if __name__ == "__main__":
+    run_tests()
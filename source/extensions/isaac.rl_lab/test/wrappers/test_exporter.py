@@ -0,0 +1,85 @@
+# Copyright (c) 2022-2024, The Isaac Lab Project Developers.
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import tempfile
+import torch
+import unittest
+
+"""Launch Isaac Sim Simulator first."""
+
+from omni.isaac.lab.app import AppLauncher, run_tests
+
+# launch omniverse app in headless mode
+simulation_app = AppLauncher(headless=True).app
+
+"""Rest everything follows from here."""
+
+from rl_lab.rsl_rl.modules import CVQVAE, PMC, ActorCritic, EmpiricalNormalization, HIMActorCritic
+from rl_lab.tasks.utils.wrappers.rsl_rl import Z_settings, export_policy_as_jit, make_inference_policy
+
+
+class TestPolicyExporter(unittest.TestCase):
+    """Numerical equivalence of the exported policies with the eager ``act_inference``."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.batch_size = 8
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _normalizer(self, num_obs):
+        normalizer = EmpiricalNormalization(shape=[num_obs], until=1.0e8)
+        for _ in range(10):
+            normalizer(torch.randn(64, num_obs) * 3.0 + 1.0)
+        return normalizer.eval()
+
+    def _assert_exported_matches(self, actor_critic, num_obs, normalizer=None, atol=1e-5):
+        actor_critic.eval()
+        obs = torch.randn(self.batch_size, num_obs) * 3.0 + 1.0
+        with torch.no_grad():
+            expected = actor_critic.act_inference(normalizer(obs) if normalizer is not None else obs)
+            torch.testing.assert_close(
+                make_inference_policy(actor_critic, normalizer, num_obs=num_obs)(obs), expected, atol=atol, rtol=0.0
+            )
+
+        export_policy_as_jit(actor_critic, normalizer, self.tmp_dir.name, batch_size=self.batch_size, num_obs=num_obs)
+        exported = torch.jit.load(os.path.join(self.tmp_dir.name, "policy.pt"))
+        exported.reset()
+        with torch.no_grad():
+            torch.testing.assert_close(exported(obs), expected, atol=atol, rtol=0.0)
+
+    def test_actor_critic_folded_normalizer(self):
+        """The normalizer folded into the first actor layer gives the same actions."""
+        num_obs = 48
+        actor_critic = ActorCritic(num_obs, num_obs, 12, actor_hidden_dims=[64, 64], critic_hidden_dims=[64, 64])
+        normalizer = self._normalizer(num_obs)
+        policy = make_inference_policy(actor_critic, normalizer)
+        self.assertFalse(any(isinstance(module, EmpiricalNormalization) for module in policy.modules()))
+        self._assert_exported_matches(actor_critic, num_obs, normalizer)
+
+    def test_cvqvae(self):
+        """RMSNorm, encoder, codebook lookup and decoder of the CVQVAE policy."""
+        num_obs = 45 * 3
+        actor_critic = CVQVAE(num_obs, num_obs, 12, z_settings=Z_settings(), State_Dimentions=45)
+        self._assert_exported_matches(actor_critic, num_obs, self._normalizer(num_obs))
+
+    def test_pmc(self):
+        """The PMC policy with its nearest-neighbour codebook."""
+        num_obs, num_dataset = 45, 4
+        actor_critic = PMC(num_obs, num_obs, 12, num_dataset, z_settings=Z_settings(), State_Dimentions=45)
+        self._assert_exported_matches(actor_critic, num_obs * 3 + num_dataset)
+
+    def test_him_actor_critic(self):
+        """HIM is traced through its own ``act_inference``."""
+        num_one_step_obs, history = 45, 6
+        actor_critic = HIMActorCritic(num_one_step_obs * history, 50, num_one_step_obs, 12)
+        self._assert_exported_matches(actor_critic, num_one_step_obs * history)
+
+
+if __name__ == "__main__":
+    run_tests()
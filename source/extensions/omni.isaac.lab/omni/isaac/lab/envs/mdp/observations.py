@@ -7,11 +7,15 @@
 
 The functions can be passed to the :class:`omni.isaac.lab.managers.ObservationTermCfg` object to enable
 the observation introduced by the function.
+
+Functions with an ``env_ids`` argument return the observation for these environments only, which
+the :class:`omni.isaac.lab.managers.ObservationManager` uses when computing a subset of the environments.
 """
 
 from __future__ import annotations
 
 import torch
+from collections.abc import Sequence
 from typing import TYPE_CHECKING
 
 import omni.isaac.lab.utils.math as math_utils
@@ -34,25 +38,40 @@ def base_pos_z(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg(
     return asset.data.root_pos_w[:, 2].unsqueeze(-1)
 
 
-def base_lin_vel(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot")) -> torch.Tensor:
+def base_lin_vel(
+    env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot"), env_ids: Sequence[int] | None = None
+) -> torch.Tensor:
     """Root linear velocity in the asset's root frame."""
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     # extract the used quantities (to enable type-hinting)
     asset: RigidObject = env.scene[asset_cfg.name]
-    return asset.data.root_lin_vel_b
+    return asset.data.root_lin_vel_b[env_ids]
 
 
-def base_ang_vel(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot")) -> torch.Tensor:
+def base_ang_vel(
+    env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot"), env_ids: Sequence[int] | None = None
+) -> torch.Tensor:
     """Root angular velocity in the asset's root frame."""
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     # extract the used quantities (to enable type-hinting)
     asset: RigidObject = env.scene[asset_cfg.name]
-    return asset.data.root_ang_vel_b
+    return asset.data.root_ang_vel_b[env_ids]
 
 
-def projected_gravity(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot")) -> torch.Tensor:
+def projected_gravity(
+    env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot"), env_ids: Sequence[int] | None = None
+) -> torch.Tensor:
     """Gravity projection on the asset's root frame."""
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     # extract the used quantities (to enable type-hinting)
     asset: RigidObject = env.scene[asset_cfg.name]
-    return asset.data.projected_gravity_b
+    return asset.data.projected_gravity_b[env_ids]
 
 
 def root_pos_w(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot")) -> torch.Tensor:
@@ -63,7 +82,10 @@ def root_pos_w(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg(
 
 
 def root_quat_w(
-    env: ManagerBasedEnv, make_quat_unique: bool = False, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot")
+    env: ManagerBasedEnv,
+    make_quat_unique: bool = False,
+    asset_cfg: SceneEntityCfg = SceneEntityCfg("robot"),
+    env_ids: Sequence[int] | None = None,
 ) -> torch.Tensor:
     """Asset root orientation (w, x, y, z) in the environment frame.
 
@@ -71,10 +93,13 @@ def root_quat_w(
     the quaternion has non-negative real component. This is because both ``q`` and ``-q`` represent
     the same orientation.
     """
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     # extract the used quantities (to enable type-hinting)
     asset: RigidObject = env.scene[asset_cfg.name]
 
-    quat = asset.data.root_quat_w
+    quat = asset.data.root_quat_w[env_ids]
     # make the quaternion real-part positive if configured
     return math_utils.quat_unique(quat) if make_quat_unique else quat
 
@@ -108,14 +133,22 @@ def joint_pos(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("
     return asset.data.joint_pos[:, asset_cfg.joint_ids]
 
 
-def joint_pos_rel(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot")) -> torch.Tensor:
+def joint_pos_rel(
+    env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot"), env_ids: Sequence[int] | None = None
+) -> torch.Tensor:
     """The joint positions of the asset w.r.t. the default joint positions.
 
     Note: Only the joints configured in :attr:`asset_cfg.joint_ids` will have their positions returned.
     """
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     # extract the used quantities (to enable type-hinting)
     asset: Articulation = env.scene[asset_cfg.name]
-    return asset.data.joint_pos[:, asset_cfg.joint_ids] - asset.data.default_joint_pos[:, asset_cfg.joint_ids]
+    return (
+        asset.data.joint_pos[env_ids][:, asset_cfg.joint_ids]
+        - asset.data.default_joint_pos[env_ids][:, asset_cfg.joint_ids]
+    )
 
 
 def joint_pos_limit_normalized(
@@ -144,14 +177,22 @@ def joint_vel(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("
     return asset.data.joint_vel[:, asset_cfg.joint_ids]
 
 
-def joint_vel_rel(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot")):
+def joint_vel_rel(
+    env: ManagerBasedEnv, asset_cfg: SceneEntityCfg = SceneEntityCfg("robot"), env_ids: Sequence[int] | None = None
+):
     """The joint velocities of the asset w.r.t. the default joint velocities.
 
     Note: Only the joints configured in :attr:`asset_cfg.joint_ids` will have their velocities returned.
     """
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     # extract the used quantities (to enable type-hinting)
     asset: Articulation = env.scene[asset_cfg.name]
-    return asset.data.joint_vel[:, asset_cfg.joint_ids] - asset.data.default_joint_vel[:, asset_cfg.joint_ids]
+    return (
+        asset.data.joint_vel[env_ids][:, asset_cfg.joint_ids]
+        - asset.data.default_joint_vel[env_ids][:, asset_cfg.joint_ids]
+    )
 
 
 """
@@ -159,15 +200,20 @@ Sensors.
 """
 
 
-def height_scan(env: ManagerBasedEnv, sensor_cfg: SceneEntityCfg, offset: float = 0.5) -> torch.Tensor:
+def height_scan(
+    env: ManagerBasedEnv, sensor_cfg: SceneEntityCfg, offset: float = 0.5, env_ids: Sequence[int] | None = None
+) -> torch.Tensor:
     """Height scan from the given sensor w.r.t. the sensor's frame.
 
     The provided offset (Defaults to 0.5) is subtracted from the returned values.
     """
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     # extract the used quantities (to enable type-hinting)
     sensor: RayCaster = env.scene.sensors[sensor_cfg.name]
     # height scan: height = sensor_height - hit_point_z - offset
-    return sensor.data.pos_w[:, 2].unsqueeze(1) - sensor.data.ray_hits_w[..., 2] - offset
+    return sensor.data.pos_w[env_ids, 2].unsqueeze(1) - sensor.data.ray_hits_w[env_ids, :, 2] - offset
 
 
 def body_incoming_wrench(env: ManagerBasedEnv, asset_cfg: SceneEntityCfg) -> torch.Tensor:
@@ -236,16 +282,21 @@ Actions.
 """
 
 
-def last_action(env: ManagerBasedEnv, action_name: str | None = None) -> torch.Tensor:
+def last_action(
+    env: ManagerBasedEnv, action_name: str | None = None, env_ids: Sequence[int] | None = None
+) -> torch.Tensor:
     """The last input action to the environment.
 
     The name of the action term for which the action is required. If None, the
     entire action tensor is returned.
     """
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
     if action_name is None:
-        return env.action_manager.action
+        return env.action_manager.action[env_ids]
     else:
-        return env.action_manager.get_term(action_name).raw_actions
+        return env.action_manager.get_term(action_name).raw_actions[env_ids]
 
 
 """
@@ -253,6 +304,11 @@ Commands.
 """
 
 
-def generated_commands(env: ManagerBasedRLEnv, command_name: str) -> torch.Tensor:
+def generated_commands(
+    env: ManagerBasedRLEnv, command_name: str, env_ids: Sequence[int] | None = None
+) -> torch.Tensor:
     """The generated command from command term in the command manager with the given name."""
-    return env.command_manager.get_command(command_name)
+    # resolve all indices
+    if env_ids is None:
+        env_ids = slice(None)
+    return env.command_manager.get_command(command_name)[env_ids]
@@ -50,6 +50,11 @@ class ObservationManager(ManagerBase):
     called in the order of the terms in the group. The functions are expected to return a tensor with shape
     (num_envs, ...).
 
+    Observations can also be computed for a subset of the environments only, for instance for the terminal
+    observations of the environments that are about to be reset. A term function opts into this by accepting an
+    ``env_ids`` keyword argument (defaulting to None for all the environments) and returning a tensor with shape
+    (len(env_ids), ...). The observations of the other terms are computed for all the environments and sliced.
+
     If a noise model or custom modifier is registered for a term, the function is called to corrupt
     the observation. The corruption function is expected to return a tensor with the same shape as the observation.
     The observations are clipped and scaled as per the configuration settings.
@@ -177,12 +182,18 @@ class ObservationManager(ManagerBase):
         # nothing to log here
         return {}
 
-    def compute(self) -> dict[str, torch.Tensor | dict[str, torch.Tensor]]:
+    def compute(
+        self, env_ids: Sequence[int] | torch.Tensor | None = None
+    ) -> dict[str, torch.Tensor | dict[str, torch.Tensor]]:
         """Compute the observations per group for all groups.
 
         The method computes the observations for all the groups handled by the observation manager.
         Please check the :meth:`compute_group` on the processing of observations per group.
 
+        Args:
+            env_ids: The environment indices to compute the observations for. Defaults to None,
+                in which case the observations are computed for all the environments.
+
         Returns:
             A dictionary with keys as the group names and values as the computed observations.
             The observations are either concatenated into a single tensor or returned as a dictionary
@@ -192,11 +203,13 @@ class ObservationManager(ManagerBase):
         obs_buffer = dict()
         # iterate over all the terms in each group
         for group_name in self._group_obs_term_names:
-            obs_buffer[group_name] = self.compute_group(group_name)
+            obs_buffer[group_name] = self.compute_group(group_name, env_ids)
         # otherwise return a dict with observations of all groups
         return obs_buffer
 
-    def compute_group(self, group_name: str) -> torch.Tensor | dict[str, torch.Tensor]:
+    def compute_group(
+        self, group_name: str, env_ids: Sequence[int] | torch.Tensor | None = None
+    ) -> torch.Tensor | dict[str, torch.Tensor]:
         """Computes the observations for a given group.
 
         The observations for a given group are computed by calling the registered functions for each
@@ -216,9 +229,17 @@ class ObservationManager(ManagerBase):
         could be artificially constrained or amplified, which might misrepresent how noise naturally occurs
         in the data.
 
+        If ``env_ids`` is provided, the observations are only returned for these environments. Terms whose function
+        accepts an ``env_ids`` argument compute their value for these environments only. The other terms are
+        computed for all the environments and sliced before the post-processing, except for terms with class
+        modifiers: these keep a state per environment, so they are processed for all the environments and sliced
+        at the end.
+
         Args:
             group_name: The name of the group for which to compute the observations. Defaults to None,
                 in which case observations for all the groups are computed and returned.
+            env_ids: The environment indices to compute the observations for. Defaults to None,
+                in which case the observations are computed for all the environments.
 
         Returns:
             Depending on the group's configuration, the tensors for individual observation terms are
@@ -239,16 +260,26 @@ class ObservationManager(ManagerBase):
         # buffer to store obs per group
         group_obs = dict.fromkeys(group_term_names, None)
         # read attributes for each term
-        obs_terms = zip(group_term_names, self._group_obs_term_cfgs[group_name])
+        obs_terms = zip(
+            group_term_names, self._group_obs_term_cfgs[group_name], self._group_obs_term_subset_modes[group_name]
+        )
 
         # evaluate terms: compute, add noise, clip, scale, custom modifiers
-        for name, term_cfg in obs_terms:
+        for name, term_cfg, subset_mode in obs_terms:
             # compute term's value
-            obs: torch.Tensor = term_cfg.func(self._env, **term_cfg.params).clone()
+            if env_ids is not None and subset_mode == "env_ids":
+                obs: torch.Tensor = term_cfg.func(self._env, env_ids=env_ids, **term_cfg.params).clone()
+            elif env_ids is not None and subset_mode == "slice":
+                obs: torch.Tensor = term_cfg.func(self._env, **term_cfg.params)[env_ids].clone()
+            else:
+                obs: torch.Tensor = term_cfg.func(self._env, **term_cfg.params).clone()
             # apply post-processing
             if term_cfg.modifiers is not None:
                 for modifier in term_cfg.modifiers:
                     obs = modifier.func(obs, **modifier.params)
+            # stateful modifiers are applied to all the environments, slice their output
+            if env_ids is not None and subset_mode == "full":
+                obs = obs[env_ids]
             if term_cfg.noise:
                 obs = term_cfg.noise.func(obs, term_cfg.noise)
             if term_cfg.clip:
@@ -277,6 +308,8 @@ class ObservationManager(ManagerBase):
         self._group_obs_term_cfgs: dict[str, list[ObservationTermCfg]] = dict()
         self._group_obs_class_term_cfgs: dict[str, list[ObservationTermCfg]] = dict()
         self._group_obs_concatenate: dict[str, bool] = dict()
+        # how each term is computed for a subset of the environments, see :meth:`compute_group`
+        self._group_obs_term_subset_modes: dict[str, list[str]] = dict()
 
         # create a list to store modifiers that are classes
         # we store it as a separate list to only call reset on them and prevent unnecessary calls
@@ -303,6 +336,7 @@ class ObservationManager(ManagerBase):
             self._group_obs_term_dim[group_name] = list()
             self._group_obs_term_cfgs[group_name] = list()
             self._group_obs_class_term_cfgs[group_name] = list()
+            self._group_obs_term_subset_modes[group_name] = list()
             # read common config for the group
             self._group_obs_concatenate[group_name] = group_cfg.concatenate_terms
             # check if config is dict already
@@ -383,6 +417,17 @@ class ObservationManager(ManagerBase):
                                     f" and optional parameters: {args_with_defaults}, but received: {term_params}."
                                 )
 
+                # resolve how the term is computed for a subset of the environments
+                if term_cfg.modifiers is not None and any(
+                    isinstance(mod_cfg.func, modifiers.ModifierBase) for mod_cfg in term_cfg.modifiers
+                ):
+                    subset_mode = "full"
+                elif "env_ids" in inspect.signature(term_cfg.func).parameters:
+                    subset_mode = "env_ids"
+                else:
+                    subset_mode = "slice"
+                self._group_obs_term_subset_modes[group_name].append(subset_mode)
+
                 # add term in a separate list if term is a class
                 if isinstance(term_cfg.func, ManagerTermBase):
                     self._group_obs_class_term_cfgs[group_name].append(term_cfg)
@@ -90,6 +90,12 @@ def lin_vel_w_data(env) -> torch.Tensor:
     return env.data.lin_vel_w
 
 
+def lin_vel_w_data_subset(env, env_ids: torch.Tensor | None = None) -> torch.Tensor:
+    if env_ids is None:
+        env_ids = slice(None)
+    return env.data.lin_vel_w[env_ids]
+
+
 class TestObservationManager(unittest.TestCase):
     """Test cases for various situations with observation manager."""
 
@@ -429,6 +435,37 @@ class TestObservationManager(unittest.TestCase):
         self.assertTrue(torch.min(obs_critic["term_4"]) >= -0.5)
         self.assertTrue(torch.max(obs_critic["term_4"]) <= 0.5)
 
+    def test_compute_env_ids(self):
+        """Test the observation computation for a subset of the environments."""
+
+        modifier = modifiers.ModifierCfg(func=modifiers.bias, params={"value": 1.0})
+
+        @configclass
+        class MyObservationManagerCfg:
+            """Test config class for observation manager."""
+
+            @configclass
+            class PolicyCfg(ObservationGroupCfg):
+                """Test config class for policy observation group."""
+
+                term_1 = ObservationTermCfg(func=pos_w_data, scale=2.0)
+                term_2 = ObservationTermCfg(func=lin_vel_w_data_subset, modifiers=[modifier], clip=(0.0, 1.5))
+                term_3 = ObservationTermCfg(func=grilled_chicken_with_bbq, params={"bbq": True})
+
+            policy: ObservationGroupCfg = PolicyCfg()
+
+        # create observation manager
+        cfg = MyObservationManagerCfg()
+        self.obs_man = ObservationManager(cfg, self.env)
+        # compute observation for all and for a subset of the environments
+        env_ids = torch.tensor([1, 4, 7], device=self.device)
+        obs_policy = self.obs_man.compute()["policy"]
+        obs_policy_subset = self.obs_man.compute_group("policy", env_ids=env_ids)
+
+        self.assertEqual(obs_policy_subset.shape, (len(env_ids), 7))
+        torch.testing.assert_close(obs_policy_subset, obs_policy[env_ids])
+        torch.testing.assert_close(self.obs_man.compute(env_ids=env_ids)["policy"], obs_policy[env_ids])
+
     def test_modifier_invalid_config(self):
         """Test modifier initialization with invalid config."""
 
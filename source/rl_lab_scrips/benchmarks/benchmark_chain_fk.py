@@ -0,0 +1,81 @@
+"""Micro-benchmark of the compiled forward kinematics of a URDF tree.
+
+Compares :class:`CompiledChain` (per-frame tensors, one batched local transform, level-ordered composition)
+with the recursive ``Chain.forward_kinematics`` (one ``Transform3d`` per frame) for all the links of the
+robot, and checks that both give the same link transforms. ``Transform3d`` composes lazily, so the recursive
+version is timed up to the matrices of all the links.
+
+.. code-block:: bash
+
+    python source/rl_lab_scrips/benchmarks/benchmark_chain_fk.py --batch_sizes 1 64 1024 16384
+
+"""
+
+import argparse
+import time
+
+import torch
+
+from rl_lab.rsl_rl.utils.kinematics import CompiledChain, urdf
+
+parser = argparse.ArgumentParser(description="Benchmark the compiled forward kinematics of a URDF tree.")
+parser.add_argument(
+    "--urdf_path", type=str, default="datasets/go2_description/urdf/go2_description.urdf", help="Robot URDF."
+)
+parser.add_argument(
+    "--batch_sizes", type=int, nargs="+", default=[1, 16, 256, 1024, 4096, 16384], help="Number of configurations."
+)
+parser.add_argument("--repeats", type=int, default=20, help="Number of timed forward passes.")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+args_cli = parser.parse_args()
+
+
+def timeit(fn) -> float:
+    fn()
+    if args_cli.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(args_cli.repeats):
+        fn()
+    if args_cli.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / args_cli.repeats
+
+
+def recursive_forward_kinematics(chain, th_dict):
+    """Link transforms of the recursive version, as matrices."""
+    return [transform.get_matrix() for transform in chain.forward_kinematics(th_dict).values()]
+
+
+def main():
+    with open(args_cli.urdf_path, "rb") as urdf_file:
+        chain = urdf.build_chain_from_urdf(urdf_file.read()).to(device=args_cli.device)
+    compiled = CompiledChain(chain)
+    print(
+        f"[INFO] device {args_cli.device}, {compiled.num_links} links, {len(compiled.joint_names)} joints,"
+        f" {len(compiled.level_nodes)} levels"
+    )
+    print(f"{'batch':>8} {'recursive ms':>13} {'compiled ms':>12} {'speedup':>8}  max abs difference")
+    for batch_size in args_cli.batch_sizes:
+        torch.manual_seed(0)
+        th = torch.rand(batch_size, len(compiled.joint_names), device=args_cli.device) * 2.0 - 1.0
+        # the recursive version takes one (batch_size, 1) tensor per joint
+        th_dict = dict((name, th[:, i : i + 1]) for i, name in enumerate(compiled.joint_names))
+
+        with torch.no_grad():
+            reference = chain.forward_kinematics(th_dict)
+            link_transforms = compiled.forward_kinematics(th)
+            error = max(
+                (reference[name].get_matrix() - link_transforms[:, i]).abs().max().item()
+                for i, name in enumerate(compiled.link_names)
+            )
+            recursive_time = timeit(lambda: recursive_forward_kinematics(chain, th_dict))
+            compiled_time = timeit(lambda: compiled.forward_kinematics(th))
+        print(
+            f"{batch_size:>8} {recursive_time * 1e3:>13.3f} {compiled_time * 1e3:>12.3f}"
+            f" {recursive_time / compiled_time:>7.1f}x  {error:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
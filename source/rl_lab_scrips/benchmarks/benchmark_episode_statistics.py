@@ -0,0 +1,104 @@
+"""Micro-benchmark of the runner episode bookkeeping during rollout collection.
+
+Compares the device-side :class:`EpisodeStatistics` accumulator with the previous per-step bookkeeping, which
+called ``(dones > 0).nonzero()`` and ``.cpu().numpy().tolist()`` on every env step, and checks that both report
+the same mean return and episode length.
+
+.. code-block:: bash
+
+    python source/rl_lab_scrips/benchmarks/benchmark_episode_statistics.py --num_envs 4096 --num_steps 24
+
+"""
+
+import argparse
+import statistics
+import time
+from collections import deque
+
+import torch
+
+from rl_lab.rsl_rl.utils.episode_statistics import EpisodeStatistics
+
+parser = argparse.ArgumentParser(description="Benchmark the episode statistics bookkeeping of the runners.")
+parser.add_argument("--num_envs", type=int, default=4096, help="Number of environments.")
+parser.add_argument("--num_steps", type=int, default=24, help="Env steps per iteration.")
+parser.add_argument("--iterations", type=int, default=50, help="Number of timed iterations.")
+parser.add_argument("--done_prob", type=float, default=0.005, help="Probability of an env finishing per step.")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+args_cli = parser.parse_args()
+
+
+def fake_env_step(generator):
+    """Stand-in for a small amount of simulation work per env step."""
+    rewards = torch.rand(args_cli.num_envs, device=args_cli.device, generator=generator)
+    dones = (torch.rand(args_cli.num_envs, device=args_cli.device, generator=generator) < args_cli.done_prob).long()
+    return rewards, dones
+
+
+def synchronize():
+    if args_cli.device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def run_legacy():
+    generator = torch.Generator(device=args_cli.device).manual_seed(0)
+    rewbuffer = deque(maxlen=100)
+    lenbuffer = deque(maxlen=100)
+    cur_reward_sum = torch.zeros(args_cli.num_envs, dtype=torch.float, device=args_cli.device)
+    cur_episode_length = torch.zeros(args_cli.num_envs, dtype=torch.float, device=args_cli.device)
+    collection_time = 0.0
+    for _ in range(args_cli.iterations):
+        synchronize()
+        start = time.perf_counter()
+        for _ in range(args_cli.num_steps):
+            rewards, dones = fake_env_step(generator)
+            cur_reward_sum += rewards
+            cur_episode_length += 1
+            new_ids = (dones > 0).nonzero(as_tuple=False)
+            rewbuffer.extend(cur_reward_sum[new_ids][:, 0].cpu().numpy().tolist())
+            lenbuffer.extend(cur_episode_length[new_ids][:, 0].cpu().numpy().tolist())
+            cur_reward_sum[new_ids] = 0
+            cur_episode_length[new_ids] = 0
+        # the old log() only used the python lists
+        mean_reward = statistics.mean(rewbuffer) if rewbuffer else 0.0
+        mean_length = statistics.mean(lenbuffer) if lenbuffer else 0.0
+        synchronize()
+        collection_time += time.perf_counter() - start
+    return collection_time, mean_reward, mean_length
+
+
+def run_accumulator():
+    generator = torch.Generator(device=args_cli.device).manual_seed(0)
+    episode_stats = EpisodeStatistics(args_cli.num_envs, buffer_size=100, device=args_cli.device)
+    collection_time = 0.0
+    for _ in range(args_cli.iterations):
+        synchronize()
+        start = time.perf_counter()
+        for _ in range(args_cli.num_steps):
+            rewards, dones = fake_env_step(generator)
+            episode_stats.update(rewards, dones)
+        # one read back per log() call
+        rewbuffer, lenbuffer = episode_stats.read()
+        mean_reward = statistics.mean(rewbuffer) if rewbuffer else 0.0
+        mean_length = statistics.mean(lenbuffer) if lenbuffer else 0.0
+        synchronize()
+        collection_time += time.perf_counter() - start
+    return collection_time, mean_reward, mean_length
+
+
+def main():
+    # warm up kernels and allocator
+    run_accumulator()
+    legacy_time, legacy_reward, legacy_length = run_legacy()
+    new_time, new_reward, new_length = run_accumulator()
+    print(f"device: {args_cli.device}, envs: {args_cli.num_envs}, steps/iteration: {args_cli.num_steps}")
+    print(f"legacy bookkeeping : {legacy_time / args_cli.iterations * 1e3:8.3f} ms/iteration")
+    print(f"EpisodeStatistics  : {new_time / args_cli.iterations * 1e3:8.3f} ms/iteration")
+    print(f"speedup            : {legacy_time / new_time:8.2f}x")
+    # at most 100 episodes are kept; when more than 100 finish in the last steps the kept subsets may differ
+    print(f"mean reward        : {legacy_reward:.4f} (legacy) {new_reward:.4f} (new)")
+    print(f"mean episode length: {legacy_length:.2f} (legacy) {new_length:.2f} (new)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Micro-benchmark of the GAE return and advantage computation of the rollout storages.
+
+Compares :func:`compute_gae` (batched TD errors, scripted in-place reverse scan, in-place normalization) with the
+previous Python loop of ``RolloutStorage.compute_returns`` and checks that both produce the same returns and
+advantages.
+
+.. code-block:: bash
+
+    python source/rl_lab_scrips/benchmarks/benchmark_gae.py --num_envs 4096 --num_steps 24 48 96
+
+"""
+
+import argparse
+import time
+
+import torch
+
+from rl_lab.rsl_rl.storage.gae import compute_gae
+
+parser = argparse.ArgumentParser(description="Benchmark the GAE computation of the rollout storages.")
+parser.add_argument("--num_envs", type=int, default=4096, help="Number of environments.")
+parser.add_argument("--num_steps", type=int, nargs="+", default=[24, 48, 96], help="Transitions per environment.")
+parser.add_argument("--gamma", type=float, default=0.99, help="Discount factor.")
+parser.add_argument("--lam", type=float, default=0.95, help="GAE lambda.")
+parser.add_argument("--repeats", type=int, default=50, help="Number of timed calls.")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+args_cli = parser.parse_args()
+
+
+def legacy_compute_returns(rewards, values, dones, last_values, returns, gamma, lam):
+    """Previous ``RolloutStorage.compute_returns``."""
+    advantage = 0
+    num_steps = rewards.shape[0]
+    for step in reversed(range(num_steps)):
+        if step == num_steps - 1:
+            next_values = last_values
+        else:
+            next_values = values[step + 1]
+        next_is_not_terminal = 1.0 - dones[step].float()
+        delta = rewards[step] + next_is_not_terminal * gamma * next_values - values[step]
+        advantage = delta + next_is_not_terminal * gamma * lam * advantage
+        returns[step] = advantage + values[step]
+    advantages = returns - values
+    advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+    return returns, advantages
+
+
+def synchronize():
+    if args_cli.device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def timeit(fn):
+    fn()
+    synchronize()
+    start = time.perf_counter()
+    for _ in range(args_cli.repeats):
+        fn()
+    synchronize()
+    return (time.perf_counter() - start) / args_cli.repeats
+
+
+def main():
+    device = args_cli.device
+    print(f"device: {device}, envs: {args_cli.num_envs}")
+    for num_steps in args_cli.num_steps:
+        shape = (num_steps, args_cli.num_envs, 1)
+        rewards = torch.randn(shape, device=device)
+        values = torch.randn(shape, device=device)
+        dones = (torch.rand(shape, device=device) < 0.02).byte()
+        last_values = torch.randn(args_cli.num_envs, 1, device=device)
+        legacy_returns = torch.zeros(shape, device=device)
+        returns = torch.zeros(shape, device=device)
+        advantages = torch.zeros(shape, device=device)
+
+        legacy_returns, legacy_advantages = legacy_compute_returns(
+            rewards, values, dones, last_values, legacy_returns, args_cli.gamma, args_cli.lam
+        )
+        compute_gae(rewards, values, dones, last_values, args_cli.gamma, args_cli.lam, returns, advantages)
+        max_err = max(
+            (returns - legacy_returns).abs().max().item(), (advantages - legacy_advantages).abs().max().item()
+        )
+
+        legacy_time = timeit(
+            lambda: legacy_compute_returns(
+                rewards, values, dones, last_values, legacy_returns, args_cli.gamma, args_cli.lam
+            )
+        )
+        new_time = timeit(
+            lambda: compute_gae(rewards, values, dones, last_values, args_cli.gamma, args_cli.lam, returns, advantages)
+        )
+        print(
+            f"steps {num_steps:4d} | legacy {legacy_time * 1e3:8.3f} ms | compute_gae {new_time * 1e3:8.3f} ms |"
+            f" speedup {legacy_time / new_time:5.2f}x | max abs diff {max_err:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the batched MotionData_Base.data_discretization against the per-clip loop it replaced.
+
+The script loads the bundled GO2 mocap set once, then runs both resampling implementations on the
+same original clips and checks that they produce the same ``data_tensors``.
+
+.. code-block:: bash
+
+    python source/rl_lab_scrips/benchmarks/benchmark_motion_discretization.py --env_step_duration 0.02
+
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import torch
+
+from rl_lab.assets.base_motionloader import MotionData_Base
+
+parser = argparse.ArgumentParser(description="Benchmark motion data resampling.")
+parser.add_argument("--data_dir", type=str, default="datasets/mocap_motions_go2", help="Directory of the txt motion clips.")
+parser.add_argument("--datatype", type=str, default="isaacgym", help="Frame layout of the motion clips.")
+parser.add_argument("--env_step_duration", type=float, default=0.02, help="Resampling interval in seconds.")
+parser.add_argument("--repeats", type=int, default=3, help="Number of timed runs per implementation.")
+args_cli = parser.parse_args()
+
+
+def data_discretization_per_clip(motion_data: MotionData_Base) -> list[torch.Tensor]:
+    """Reference implementation: python time grid and one slerp per clip and key."""
+    data_tensors = []
+    for original_data_tensor, data_time_length, data_length in zip(
+        motion_data.original_data_tensors, motion_data.data_time_length, motion_data.data_length
+    ):
+        interpolation_time_list = []
+        interpolation_time = 0
+        while interpolation_time < data_time_length:
+            interpolation_time_list.append(interpolation_time)
+            interpolation_time += motion_data.env_step_duration
+        interpolation_time_tensor = torch.tensor(interpolation_time_list, dtype=torch.float64, device=motion_data.device)
+        intermidate_data = torch.zeros(
+            (len(interpolation_time_tensor), original_data_tensor.shape[1]), device=motion_data.device
+        )
+        percentage = interpolation_time_tensor / data_time_length
+        idx_low = torch.floor(percentage * data_length).to(torch.int64)
+        idx_high = torch.ceil(percentage * data_length).to(torch.int64)
+        frame_stats = original_data_tensor[idx_low, :]
+        frame_ends = original_data_tensor[idx_high, :]
+        blend = (percentage * data_length - idx_low).unsqueeze(-1)
+        for key, (start, end) in motion_data.cumulative_indices.items():
+            if key == "root_quat":
+                intermidate_data[:, start:end] = motion_data.quaternion_slerp(
+                    frame_stats[:, start:end], frame_ends[:, start:end], blend
+                )
+            else:
+                intermidate_data[:, start:end] = motion_data.slerp(
+                    frame_stats[:, start:end], frame_ends[:, start:end], blend
+                )
+        data_tensors.append(intermidate_data)
+    return data_tensors
+
+
+def timeit(fn) -> float:
+    times = []
+    for _ in range(args_cli.repeats):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        motion_data = MotionData_Base(
+            os.path.abspath(args_cli.data_dir),
+            datatype=args_cli.datatype,
+            file_type="txt",
+            env_step_duration=args_cli.env_step_duration,
+            use_cache=False,
+        )
+    num_frames = sum(data.shape[0] for data in motion_data.original_data_tensors)
+    print(f"[INFO] {len(motion_data.original_data_tensors)} clips, {num_frames} source frames, device {motion_data.device}")
+
+    reference = data_discretization_per_clip(motion_data)
+    batched = motion_data.data_tensors
+    assert len(reference) == len(batched)
+    max_error = 0.0
+    for ref, new in zip(reference, batched):
+        assert ref.shape == new.shape, f"shape mismatch {ref.shape} != {new.shape}"
+        max_error = max(max_error, (ref - new).abs().max().item())
+    print(f"[INFO] {sum(data.shape[0] for data in batched)} resampled frames, max abs difference {max_error:.3e}")
+
+    loop_time = timeit(lambda: data_discretization_per_clip(motion_data))
+    batched_time = timeit(motion_data.data_discretization)
+    print(f"per-clip loop : {loop_time * 1e3:9.2f} ms")
+    print(f"batched       : {batched_time * 1e3:9.2f} ms  ({loop_time / batched_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Micro-benchmark of the PPO update with and without the accelerated update path.
+
+Fills a rollout storage with random transitions and times :meth:`PPO.update` in the default eager fp32 mode and in
+the ``accelerated_update`` mode (autocast, on-device adaptive learning rate, optionally compiled loss terms). Every
+configuration starts from the same network weights and the same storage contents, the first update is a warm-up.
+
+.. code-block:: bash
+
+    python source/rl_lab_scrips/benchmarks/benchmark_ppo_update.py --num_envs 4096 --num_steps 24
+    python source/rl_lab_scrips/benchmarks/benchmark_ppo_update.py --precision bf16 fp16 --compile_mode reduce-overhead
+
+"""
+
+import argparse
+import copy
+import time
+
+import torch
+
+from rl_lab.rsl_rl.modules import ActorCritic
+from rl_lab.rsl_rl.ppo_algorithm import PPO
+
+parser = argparse.ArgumentParser(description="Benchmark the PPO update with and without the accelerated path.")
+parser.add_argument("--num_envs", type=int, default=4096, help="Number of environments.")
+parser.add_argument("--num_steps", type=int, default=24, help="Transitions per environment.")
+parser.add_argument("--num_obs", type=int, default=48, help="Actor observation dimension.")
+parser.add_argument("--num_critic_obs", type=int, default=235, help="Critic observation dimension.")
+parser.add_argument("--num_actions", type=int, default=12, help="Action dimension.")
+parser.add_argument("--num_learning_epochs", type=int, default=5, help="Learning epochs per update.")
+parser.add_argument("--num_mini_batches", type=int, default=4, help="Mini-batches per epoch.")
+parser.add_argument("--precision", type=str, nargs="+", default=["bf16", "fp16"], help="Autocast precisions.")
+parser.add_argument("--compile_mode", type=str, default=None, help="torch.compile mode of the loss terms.")
+parser.add_argument("--repeats", type=int, default=5, help="Number of timed updates.")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+args_cli = parser.parse_args()
+
+
+def synchronize():
+    if args_cli.device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def make_transitions(device):
+    """Random rollout shared by all configurations."""
+    shape = (args_cli.num_steps, args_cli.num_envs)
+    return {
+        "observations": torch.randn(*shape, args_cli.num_obs, device=device),
+        "critic_observations": torch.randn(*shape, args_cli.num_critic_obs, device=device),
+        "actions": torch.randn(*shape, args_cli.num_actions, device=device),
+        "rewards": torch.randn(*shape, device=device),
+        "dones": (torch.rand(*shape, device=device) < 0.02).long(),
+        "values": torch.randn(*shape, 1, device=device),
+        "actions_log_prob": torch.randn(*shape, device=device),
+        "action_mean": torch.randn(*shape, args_cli.num_actions, device=device),
+        "action_sigma": torch.rand(*shape, args_cli.num_actions, device=device) + 0.5,
+    }
+
+
+def fill_storage(alg, transitions):
+    alg.storage.clear()
+    for step in range(args_cli.num_steps):
+        for name, value in transitions.items():
+            setattr(alg.transition, name, value[step])
+        alg.storage.add_transitions(alg.transition)
+        alg.transition.clear()
+    last_values = torch.randn(args_cli.num_envs, 1, device=args_cli.device)
+    alg.storage.compute_returns(last_values, alg.gamma, alg.lam)
+
+
+def run(actor_critic, transitions, **kwargs):
+    alg = PPO(
+        copy.deepcopy(actor_critic),
+        num_learning_epochs=args_cli.num_learning_epochs,
+        num_mini_batches=args_cli.num_mini_batches,
+        schedule="adaptive",
+        device=args_cli.device,
+        **kwargs,
+    )
+    alg.init_storage(
+        args_cli.num_envs, args_cli.num_steps, [args_cli.num_obs], [args_cli.num_critic_obs], [args_cli.num_actions]
+    )
+    fill_storage(alg, transitions)
+    alg.update()
+    elapsed = 0.0
+    for _ in range(args_cli.repeats):
+        fill_storage(alg, transitions)
+        synchronize()
+        start = time.perf_counter()
+        value_loss, surrogate_loss = alg.update()
+        synchronize()
+        elapsed += time.perf_counter() - start
+    return elapsed / args_cli.repeats, value_loss, surrogate_loss, alg.learning_rate
+
+
+def main():
+    device = args_cli.device
+    print(f"device: {device}, envs: {args_cli.num_envs}, steps: {args_cli.num_steps}")
+    torch.manual_seed(0)
+    actor_critic = ActorCritic(args_cli.num_obs, args_cli.num_critic_obs, args_cli.num_actions)
+    transitions = make_transitions(device)
+
+    configs = [("legacy fp32", {})]
+    for precision in args_cli.precision:
+        configs.append(
+            (
+                f"accelerated {precision}",
+                dict(accelerated_update=True, update_precision=precision, update_compile_mode=args_cli.compile_mode),
+            )
+        )
+
+    legacy_time = None
+    for name, kwargs in configs:
+        update_time, value_loss, surrogate_loss, learning_rate = run(actor_critic, transitions, **kwargs)
+        legacy_time = legacy_time or update_time
+        print(
+            f"{name:18s} | update {update_time * 1e3:9.2f} ms | speedup {legacy_time / update_time:5.2f}x |"
+            f" value loss {value_loss:.4f} | surrogate loss {surrogate_loss:.4f} | lr {learning_rate:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Micro-benchmark of the VectorQuantiser nearest-code search.
+
+Compares the current quantiser (argmax over distance blocks, index gather, bincount perplexity) with the
+previous sort + one-hot matmul implementation across batch and codebook sizes, and checks that both produce
+bit-identical outputs from the same state.
+
+.. code-block:: bash
+
+    python source/rl_lab_scrips/benchmarks/benchmark_vector_quantiser.py --batch_sizes 1024 4096 24576 --num_embeds 64 512 4096
+
+"""
+
+import argparse
+import copy
+import time
+
+import torch
+
+from rl_lab.rsl_rl.modules.Cvqvae.quantise import VectorQuantiser, code_distance
+
+parser = argparse.ArgumentParser(description="Benchmark the VectorQuantiser forward pass.")
+parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1024, 4096, 24576], help="Number of latent vectors.")
+parser.add_argument("--num_embeds", type=int, nargs="+", default=[64, 512, 4096], help="Codebook sizes.")
+parser.add_argument("--embed_dim", type=int, default=64, help="Dimension of the codebook entries.")
+parser.add_argument("--distance", type=str, default="cos", choices=["cos", "l2"], help="Distance metric.")
+parser.add_argument("--chunk_size", type=int, default=None, help="Rows per distance block for the new path.")
+parser.add_argument("--repeats", type=int, default=20, help="Number of timed forward passes.")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+args_cli = parser.parse_args()
+
+
+def legacy_forward(vq: VectorQuantiser, z: torch.Tensor):
+    """Previous quantiser forward pass with the codebook re-initialisation and contrastive loss disabled."""
+    z_flattened = z.view(-1, vq.embed_dim)
+    d = code_distance(z_flattened, vq.embedding.weight, vq.distance)
+    _, indices = d.sort(dim=1)
+    encoding_indices = indices[:, -1]
+    encodings = torch.zeros(encoding_indices.unsqueeze(1).shape[0], vq.num_embed, device=z.device)
+    encodings.scatter_(1, encoding_indices.unsqueeze(1), 1)
+    z_q = torch.matmul(encodings, vq.embedding.weight).view(z.shape)
+    loss = vq.beta * torch.mean((z_q.detach() - z) ** 2) + torch.mean((z_q - z.detach()) ** 2)
+    z_q = z + (z_q - z).detach()
+    avg_probs = torch.mean(encodings, dim=0)
+    perplexity = torch.exp(-torch.sum(avg_probs * torch.log(avg_probs + 1e-10)))
+    return z_q, loss, (perplexity, encodings, encoding_indices)
+
+
+def timeit(fn) -> float:
+    fn()
+    if args_cli.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(args_cli.repeats):
+        fn()
+    if args_cli.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / args_cli.repeats
+
+
+def main():
+    print(f"[INFO] device {args_cli.device}, distance {args_cli.distance}, embed_dim {args_cli.embed_dim}")
+    print(f"{'batch':>8} {'codes':>6} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}  identical")
+    for num_embed in args_cli.num_embeds:
+        for batch_size in args_cli.batch_sizes:
+            torch.manual_seed(0)
+            vq = VectorQuantiser(
+                num_embed, args_cli.embed_dim, beta=0.25, distance=args_cli.distance, chunk_size=args_cli.chunk_size
+            ).to(args_cli.device)
+            vq.eval()
+            vq_no_onehot = copy.deepcopy(vq)
+            vq_no_onehot.return_encodings = False
+            z = torch.randn(batch_size, args_cli.embed_dim, device=args_cli.device)
+
+            with torch.no_grad():
+                ref_zq, ref_loss, (ref_perplexity, ref_encodings, ref_indices) = legacy_forward(vq, z)
+                new_zq, new_loss, (new_perplexity, new_encodings, new_indices) = vq(z)
+            identical = (
+                torch.equal(ref_indices, new_indices)
+                and torch.equal(ref_zq, new_zq)
+                and torch.equal(ref_loss, new_loss)
+                and torch.equal(ref_perplexity, new_perplexity)
+                and torch.equal(ref_encodings, new_encodings)
+            )
+
+            with torch.no_grad():
+                legacy_time = timeit(lambda: legacy_forward(vq, z))
+                new_time = timeit(lambda: vq_no_onehot(z))
+            print(
+                f"{batch_size:>8} {num_embed:>6} {legacy_time * 1e3:>10.3f} {new_time * 1e3:>10.3f}"
+                f" {legacy_time / new_time:>7.1f}x  {identical}"
+            )
+
+
+if __name__ == "__main__":
+    main()